@@ -0,0 +1,158 @@
+"""
+Модуль кэша аутентификации.
+
+Хранит в памяти процесса соответствие API-ключа легковесной
+информации о пользователе (ID и имя), чтобы не обращаться к базе
+данных за пользователем в начале каждого запроса. Записи кэша
+ограничены по количеству (LRU) и по времени жизни (TTL).
+
+Кэш сбрасывается обработчиками событий ORM при добавлении, изменении
+и удалении пользователей. Каждый процесс приложения держит собственный
+кэш, поэтому изменения, сделанные в другом процессе, становятся видны
+не позднее чем через AUTH_CACHE_TTL секунд.
+"""
+
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, inspect
+
+from server.app.metrics import metrics
+from server.database.getter_variables import (
+    AUTH_CACHE_SIZE,
+    AUTH_CACHE_TTL,
+    AUTH_CACHE_NEGATIVE_TTL,
+)
+from server.database.models import User
+
+
+class UserIdentity(NamedTuple):
+    """
+    Легковесная информация о пользователе, достаточная для аутентификации.
+    """
+
+    id: int
+    name: str
+
+
+class AuthCache:
+    """
+    LRU-кэш с ограниченным временем жизни записей, сопоставляющий
+    API-ключ пользователю.
+
+    Отсутствующие пользователи кэшируются как None на более короткое
+    время, чтобы поглощать запросы с неверными ключами.
+
+    Атрибуты:
+        maxsize (int): Максимальное количество записей.
+        ttl (float): Время жизни записи о найденном пользователе в секундах.
+        negative_ttl (float): Время жизни записи об отсутствующем пользователе.
+        entries (OrderedDict): Записи кэша в порядке последнего использования.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries: OrderedDict[str, Tuple[float, Optional[UserIdentity]]] = (
+            OrderedDict()
+        )
+
+    def get(self, api_key: str) -> Tuple[bool, Optional[UserIdentity]]:
+        """
+        Получает пользователя из кэша.
+
+        :param api_key: API-ключ пользователя.
+        :return: Признак наличия записи в кэше и пользователь
+            (None, если пользователь с таким ключом отсутствует).
+        """
+        entry = self.entries.get(api_key)
+        if entry is None:
+            metrics.inc("auth_cache_misses_total")
+            return False, None
+
+        expires_at, identity = entry
+        if expires_at <= time.monotonic():
+            del self.entries[api_key]
+            metrics.inc("auth_cache_misses_total")
+            return False, None
+
+        self.entries.move_to_end(api_key)
+        metrics.inc(
+            "auth_cache_hits_total"
+            if identity is not None
+            else "auth_cache_negative_hits_total"
+        )
+        return True, identity
+
+    def set(self, api_key: str, identity: Optional[UserIdentity]) -> None:
+        """
+        Сохраняет пользователя в кэше, вытесняя самую старую запись
+        при превышении размера.
+
+        :param api_key: API-ключ пользователя.
+        :param identity: Пользователь или None, если пользователь не найден.
+        """
+        ttl = self.ttl if identity is not None else self.negative_ttl
+        self.entries[api_key] = (time.monotonic() + ttl, identity)
+        self.entries.move_to_end(api_key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            metrics.inc("auth_cache_evictions_total")
+
+        metrics.set("auth_cache_size", len(self.entries))
+
+    def invalidate(self, api_key: str) -> None:
+        """
+        Удаляет запись о API-ключе из кэша.
+
+        :param api_key: API-ключ пользователя.
+        """
+        if self.entries.pop(api_key, None) is not None:
+            metrics.inc("auth_cache_invalidations_total")
+            metrics.set("auth_cache_size", len(self.entries))
+
+    def clear(self) -> None:
+        """
+        Очищает кэш.
+        """
+        self.entries.clear()
+        metrics.set("auth_cache_size", 0)
+
+
+auth_cache = AuthCache(
+    maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL, negative_ttl=AUTH_CACHE_NEGATIVE_TTL
+)
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_delete")
+def invalidate_user(mapper, connection, target: User) -> None:
+    """
+    Сбрасывает запись кэша при добавлении или удалении пользователя
+    (в том числе отрицательную запись о ранее неизвестном ключе).
+    """
+    auth_cache.invalidate(target.apikey)
+
+
+@event.listens_for(User, "after_update")
+def invalidate_changed_user(mapper, connection, target: User) -> None:
+    """
+    Сбрасывает запись кэша при изменении API-ключа или имени пользователя.
+    """
+    state = inspect(target)
+    if (
+        state.attrs.apikey.history.has_changes()
+        or state.attrs.name.history.has_changes()
+    ):
+        auth_cache.invalidate(target.apikey)
+
+
+@event.listens_for(User.apikey, "set", active_history=True)
+def invalidate_previous_apikey(target: User, value: str, oldvalue, initiator) -> None:
+    """
+    Сбрасывает запись кэша для прежнего API-ключа пользователя при его замене.
+    """
+    if isinstance(oldvalue, str) and oldvalue != value:
+        auth_cache.invalidate(oldvalue)
@@ -4,15 +4,59 @@
 Запуск происходит из корневой папки, с помощью uvicorn.
 """
 
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 
+from server.app.loggerconf import logger
+from server.app.media_cleanup import media_deleter
+from server.app.media_gc import media_sweeper
+from server.app.media_processing import image_processor
+from server.app.middleware import BodySizeLimitMiddleware
+from server.app.responses import MsgspecJSONResponse
 from server.app.routes.users import router as users_router
 from server.app.routes.tweets import router as tweets_router
 from server.app.routes.medias import router as medias_router
+from server.app.routes.metrics import router as metrics_router
+from server.database.confdb import dispose_engines, warm_up_pool
+from server.database.getter_variables import MEDIA_MAX_SIZE, MEDIA_CHUNK_SIZE
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Жизненный цикл приложения.
+
+    Перед приемом запросов открывает минимальный пул соединений
+    с основной базой данных и репликой, запускает фоновое удаление
+    медиафайлов, сборку неиспользуемых медиафайлов и пул процессов
+    обработки изображений. При остановке дожидается обработки изображений
+    и удаления файлов из очереди и закрывает все соединения пулов.
+    """
+    await warm_up_pool()
+    logger.info("Database connection pool is warmed up")
+    await media_deleter.start()
+    media_sweeper.start()
+    image_processor.start()
+
+    yield
+
+    image_processor.stop()
+    await media_sweeper.stop()
+    await media_deleter.stop()
+    await dispose_engines()
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=MsgspecJSONResponse, lifespan=lifespan)
+# Запас в одну часть файла на заголовки и границы multipart/form-data
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    path="/api/medias",
+    max_size=MEDIA_MAX_SIZE + MEDIA_CHUNK_SIZE,
+)
 
 app.include_router(users_router, prefix="/api/users", tags=["users"])
 app.include_router(tweets_router, prefix="/api/tweets", tags=["tweets"])
 app.include_router(medias_router, prefix="/api/medias", tags=["medias"])
+app.include_router(metrics_router, prefix="/api/metrics", tags=["metrics"])
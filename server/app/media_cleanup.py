@@ -0,0 +1,214 @@
+"""
+Модуль фонового удаления медиафайлов.
+
+Обработчики запросов не удаляют файлы сами: пути файлов ставятся
+в очередь, а фоновая задача забирает их пачками и удаляет в пуле
+потоков, не блокируя цикл событий. Неудачные удаления повторяются
+с экспоненциальной задержкой, файлы, которые не удалось удалить
+после всех попыток, записываются в таблицу media_deletion_failures
+и повторно ставятся в очередь при следующем запуске приложения.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete
+
+from server.app.loggerconf import logger
+from server.app.metrics import metrics
+from server.database.confdb import Session
+from server.database.getter_variables import (
+    MEDIA_DELETE_WORKERS,
+    MEDIA_DELETE_BATCH_SIZE,
+    MEDIA_DELETE_RETRIES,
+    MEDIA_DELETE_RETRY_DELAY,
+)
+from server.database.models import MediaDeletionFailure
+
+
+def delete_files(file_paths: List[str]) -> Dict[str, str]:
+    """
+    Удаляет файлы с диска. Выполняется в пуле потоков.
+
+    Отсутствующий файл считается удаленным.
+
+    :param file_paths: Пути файлов.
+    :return: Словарь путь файла -> текст ошибки для неудаленных файлов.
+    """
+    errors = {}
+    for file_path in file_paths:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            errors[file_path] = str(exc)
+
+    return errors
+
+
+class MediaDeleter:
+    """
+    Фоновое удаление медиафайлов.
+
+    Атрибуты:
+        workers (int): Количество потоков, удаляющих файлы.
+        batch_size (int): Максимальное количество файлов в пачке.
+        retries (int): Количество повторных попыток удаления.
+        retry_delay (float): Задержка перед первой повторной попыткой в секундах,
+            перед каждой следующей попыткой задержка удваивается.
+        queue (asyncio.Queue): Очередь путей файлов на удаление.
+    """
+
+    def __init__(
+        self, workers: int, batch_size: int, retries: int, retry_delay: float
+    ) -> None:
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """
+        Запускает фоновую задачу удаления и ставит в очередь файлы,
+        которые не удалось удалить при предыдущих запусках.
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="media-deleter"
+        )
+        self.task = asyncio.create_task(self.run())
+        await self.requeue_failures()
+
+    async def stop(self) -> None:
+        """
+        Дожидается удаления файлов из очереди и останавливает фоновую задачу.
+        """
+        await self.join()
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def join(self) -> None:
+        """
+        Дожидается обработки всех файлов, поставленных в очередь.
+        """
+        await self.queue.join()
+
+    def submit(self, file_paths: Iterable[str]) -> None:
+        """
+        Ставит файлы в очередь на удаление.
+
+        :param file_paths: Пути файлов.
+        """
+        for file_path in file_paths:
+            self.queue.put_nowait(file_path)
+
+        metrics.set("media_delete_queue_size", self.queue.qsize())
+
+    async def requeue_failures(self) -> None:
+        """
+        Ставит в очередь файлы из таблицы media_deletion_failures,
+        удаляя записи о них одним запросом DELETE ... RETURNING.
+        """
+        async with Session() as session:
+            result = await session.execute(
+                delete(MediaDeletionFailure).returning(MediaDeletionFailure.file_path)
+            )
+            file_paths = result.scalars().all()
+            await session.commit()
+
+        if file_paths:
+            logger.info(f"Requeued {len(file_paths)} media files for deletion")
+            self.submit(file_paths)
+
+    async def run(self) -> None:
+        """
+        Забирает файлы из очереди пачками до batch_size и удаляет их.
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            metrics.set("media_delete_queue_size", self.queue.qsize())
+
+            try:
+                await self.delete_batch(batch)
+            except Exception:
+                logger.exception(f"Failed to delete media files: {batch}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def delete_batch(self, file_paths: List[str]) -> None:
+        """
+        Удаляет пачку файлов, распределяя ее между потоками пула,
+        и повторяет удаление неудаленных файлов.
+
+        :param file_paths: Пути файлов.
+        """
+        loop = asyncio.get_running_loop()
+        pending = file_paths
+        errors: Dict[str, str] = {}
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                metrics.inc("media_delete_retries_total", len(pending))
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+            chunks = [pending[i :: self.workers] for i in range(self.workers)]
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(self.executor, delete_files, chunk)
+                    for chunk in chunks
+                    if chunk
+                )
+            )
+            errors = {
+                path: error for result in results for path, error in result.items()
+            }
+            metrics.inc("media_files_deleted_total", len(pending) - len(errors))
+            for file_path in set(pending) - set(errors):
+                logger.info(f"{file_path} deleted")
+
+            pending = list(errors)
+            if not pending:
+                return
+
+        await self.record_failures(errors)
+
+    async def record_failures(self, errors: Dict[str, str]) -> None:
+        """
+        Записывает файлы, которые не удалось удалить, в таблицу
+        media_deletion_failures.
+
+        :param errors: Словарь путь файла -> текст ошибки.
+        """
+        metrics.inc("media_delete_failures_total", len(errors))
+        for file_path, error in errors.items():
+            logger.error(f"Failed to delete {file_path}: {error}")
+
+        async with Session() as session:
+            session.add_all(
+                MediaDeletionFailure(
+                    file_path=file_path, error=error, attempts=self.retries + 1
+                )
+                for file_path, error in errors.items()
+            )
+            await session.commit()
+
+
+media_deleter = MediaDeleter(
+    workers=MEDIA_DELETE_WORKERS,
+    batch_size=MEDIA_DELETE_BATCH_SIZE,
+    retries=MEDIA_DELETE_RETRIES,
+    retry_delay=MEDIA_DELETE_RETRY_DELAY,
+)
@@ -0,0 +1,263 @@
+"""
+Модуль сборки неиспользуемых медиафайлов.
+
+post_medias создает записи medias без твита (tweet_id IS NULL), они
+привязываются к твиту, только если его создание ссылается на них.
+Сборщик удаляет записи, так и не привязанные к твиту за период ожидания
+MEDIA_GC_GRACE_PERIOD, вместе с их файлами, а также временные файлы
+прерванных загрузок.
+
+Записи выбираются пачками по частичному индексу
+ix_medias_unattached_created_at и блокируются с SKIP LOCKED, поэтому
+несколько процессов приложения могут собирать мусор одновременно,
+а запись, которую в этот момент привязывают к твиту, пропускается.
+Файлы удаляются в пуле потоков с ограниченным числом одновременных
+удалений.
+
+Сборщик запускается в фоне приложения каждые MEDIA_GC_INTERVAL секунд
+или вручную:
+
+    python -m server.app.media_gc --grace-period 86400
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from server.app.loggerconf import logger
+from server.app.media_cleanup import media_deleter
+from server.app.metrics import metrics
+from server.app.storage import UPLOAD_TMP_DIR, release_blobs, restore_blobs
+from server.database.confdb import Session, dispose_engines
+from server.database.getter_variables import (
+    MEDIA_GC_INTERVAL,
+    MEDIA_GC_GRACE_PERIOD,
+    MEDIA_GC_BATCH_SIZE,
+    MEDIA_GC_CONCURRENCY,
+)
+from server.database.models import Media
+
+
+def remove_file(file_path: str) -> int:
+    """
+    Удаляет файл с диска. Выполняется в пуле потоков.
+
+    :param file_path: Путь файла.
+    :return: Размер удаленного файла в байтах (0, если файла нет).
+    """
+    try:
+        size = os.stat(file_path).st_size
+        os.remove(file_path)
+    except FileNotFoundError:
+        return 0
+
+    return size
+
+
+def stale_temp_files(before: float) -> List[str]:
+    """
+    Находит временные файлы загрузок, измененные раньше заданного
+    времени. Выполняется в пуле потоков.
+
+    :param before: Время в секундах с начала эпохи.
+    :return: Пути временных файлов.
+    """
+    try:
+        with os.scandir(UPLOAD_TMP_DIR) as entries:
+            return [
+                entry.path
+                for entry in entries
+                if entry.is_file() and entry.stat().st_mtime < before
+            ]
+    except FileNotFoundError:
+        return []
+
+
+class MediaSweeper:
+    """
+    Сборка медиафайлов, не привязанных к твитам.
+
+    Атрибуты:
+        interval (float): Интервал между запусками в фоне в секундах
+            (0 - сборщик в фоне не запускается).
+        grace_period (float): Время в секундах, в течение которого
+            загруженный медиафайл может быть привязан к твиту.
+        batch_size (int): Максимальное количество записей в пачке.
+        concurrency (int): Максимальное количество одновременно
+            удаляемых файлов.
+    """
+
+    def __init__(
+        self, interval: float, grace_period: float, batch_size: int, concurrency: int
+    ) -> None:
+        self.interval = interval
+        self.grace_period = grace_period
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        Запускает периодическую сборку в фоне.
+        """
+        if self.interval > 0:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает периодическую сборку.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self) -> None:
+        """
+        Выполняет сборку каждые interval секунд.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Media garbage collection failed")
+
+    async def sweep(self) -> Dict[str, int]:
+        """
+        Удаляет записи medias, не привязанные к твиту дольше grace_period,
+        их файлы и временные файлы загрузок старше grace_period.
+
+        :return: Количество удаленных записей и файлов
+            и количество освобожденных байт.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.grace_period)
+        stats = {"medias": 0, "files": 0, "bytes": 0}
+
+        deleted = self.batch_size
+        while deleted == self.batch_size:
+            deleted, file_paths = await self.sweep_batch(cutoff)
+            files, reclaimed = await self.remove_files(file_paths)
+            stats["medias"] += deleted
+            stats["files"] += files
+            stats["bytes"] += reclaimed
+
+        temp_paths = await asyncio.to_thread(
+            stale_temp_files, time.time() - self.grace_period
+        )
+        files, reclaimed = await self.remove_files(temp_paths)
+        stats["files"] += files
+        stats["bytes"] += reclaimed
+
+        metrics.inc("media_gc_medias_deleted_total", stats["medias"])
+        metrics.inc("media_gc_files_deleted_total", stats["files"])
+        metrics.inc("media_gc_bytes_reclaimed_total", stats["bytes"])
+        logger.info(f"Media garbage collection: {stats}")
+        return stats
+
+    async def sweep_batch(self, cutoff: datetime) -> Tuple[int, List[str]]:
+        """
+        Удаляет пачку записей medias, загруженных раньше cutoff и не
+        привязанных к твиту, одним запросом DELETE ... RETURNING.
+
+        Ссылки на медиафайлы освобождаются release_blobs, файлы,
+        на которые не осталось ссылок, удаляются после фиксации транзакции.
+
+        :param cutoff: Время, раньше которого загружены удаляемые записи.
+        :return: Количество удаленных записей и пути файлов для удаления.
+        """
+        orphans = (
+            select(Media.id)
+            .where(Media.tweet_id.is_(None), Media.created_at < cutoff)
+            .order_by(Media.created_at, Media.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with Session() as session:
+            result = await session.execute(
+                delete(Media)
+                .where(Media.id.in_(orphans))
+                .returning(Media.file_path, Media.sha256)
+            )
+            rows = result.all()
+            moved = await release_blobs(
+                session=session,
+                sha256s=[sha256 for _, sha256 in rows if sha256 is not None],
+            )
+            try:
+                await session.commit()
+            except BaseException:
+                await restore_blobs(moved)
+                raise
+
+        legacy_paths = [file_path for file_path, sha256 in rows if sha256 is None]
+        return len(rows), legacy_paths + [trash_path for _, trash_path in moved]
+
+    async def remove_files(self, file_paths: List[str]) -> Tuple[int, int]:
+        """
+        Удаляет файлы, не более concurrency одновременно. Файлы,
+        которые не удалось удалить, записываются в media_deletion_failures.
+
+        :param file_paths: Пути файлов.
+        :return: Количество удаленных файлов и освобожденных байт.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = {}
+
+        async def remove(file_path: str) -> int:
+            async with semaphore:
+                try:
+                    return await asyncio.to_thread(remove_file, file_path)
+                except OSError as exc:
+                    errors[file_path] = str(exc)
+                    return 0
+
+        sizes = await asyncio.gather(*(remove(file_path) for file_path in file_paths))
+        if errors:
+            await media_deleter.record_failures(errors)
+
+        return len(file_paths) - len(errors), sum(sizes)
+
+
+media_sweeper = MediaSweeper(
+    interval=MEDIA_GC_INTERVAL,
+    grace_period=MEDIA_GC_GRACE_PERIOD,
+    batch_size=MEDIA_GC_BATCH_SIZE,
+    concurrency=MEDIA_GC_CONCURRENCY,
+)
+
+
+async def run(grace_period: float) -> None:
+    """
+    Выполняет сборку и выводит ее итоги.
+    """
+    media_sweeper.grace_period = grace_period
+    try:
+        stats = await media_sweeper.sweep()
+    finally:
+        await dispose_engines()
+
+    print(
+        f"Removed {stats['medias']} media records and {stats['files']} files, "
+        f"reclaimed {stats['bytes']} bytes"
+    )
+
+
+def main() -> None:
+    """
+    Точка входа команды сборки медиафайлов.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--grace-period", type=float, default=MEDIA_GC_GRACE_PERIOD)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.grace_period))
+
+
+if __name__ == "__main__":
+    main()
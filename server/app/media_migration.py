@@ -0,0 +1,321 @@
+"""
+Модуль переноса медиафайлов в раскладку по префиксу SHA-256.
+
+Переносятся файлы, сохраненные до хранения по префиксу SHA-256:
+файлы записей medias без SHA-256, лежащие в каталогах пользователей
+server/medias/{user.id}, и файлы media_blobs, лежащие непосредственно
+в MEDIA_ROOT. Пути и URL записей medias и media_blobs переписываются.
+
+Перенос выполняется пачками, каждая пачка - в собственной транзакции
+с блокировкой переносимых строк. Файлы хешируются до блокировки,
+новый путь создается жесткой ссылкой на старый файл, а старый путь
+удаляется только после фиксации транзакции, поэтому файл в любой момент
+доступен по URL из базы данных и перенос можно выполнять, не останавливая
+сервер. Перенесенные записи повторно не выбираются, прерванный перенос
+продолжается повторным запуском:
+
+    python -m server.app.media_migration --batch-size 100
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+from contextlib import suppress
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import select, update
+
+from server.app.loggerconf import logger
+from server.app.storage import UPLOAD_TMP_DIR, blob_path, media_url, store_blob
+from server.database.confdb import Session, dispose_engines
+from server.database.getter_variables import MEDIA_CHUNK_SIZE
+from server.database.models import Media, MediaBlob
+
+
+def hash_file(file_path: str) -> Optional[Tuple[int, str]]:
+    """
+    Вычисляет размер и SHA-256 файла. Выполняется в пуле потоков.
+
+    :param file_path: Путь файла.
+    :return: Размер файла в байтах и SHA-256 содержимого
+        в шестнадцатеричном виде или None, если файла нет.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(file_path, "rb") as media_file:
+            while chunk := media_file.read(MEDIA_CHUNK_SIZE):
+                size += len(chunk)
+                sha256.update(chunk)
+    except FileNotFoundError:
+        return None
+
+    return size, sha256.hexdigest()
+
+
+def link_to_temp(file_path: str) -> str:
+    """
+    Создает временный файл с содержимым файла, не копируя его:
+    жесткой ссылкой, а если она невозможна - копированием.
+    Выполняется в пуле потоков.
+
+    :param file_path: Путь файла.
+    :return: Путь временного файла в UPLOAD_TMP_DIR.
+    """
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid4().hex}.part")
+    try:
+        os.link(file_path, temp_path)
+    except OSError:
+        shutil.copyfile(file_path, temp_path)
+
+    return temp_path
+
+
+def move_to_blob_path(file_path: str, new_path: str) -> None:
+    """
+    Создает файл по новому пути, оставляя старый файл на месте.
+    Выполняется в пуле потоков.
+
+    :param file_path: Путь файла.
+    :param new_path: Новый путь файла.
+    """
+    temp_path = link_to_temp(file_path)
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    os.replace(temp_path, new_path)
+
+
+def remove_files(file_paths: List[str]) -> None:
+    """
+    Удаляет файлы и опустевшие каталоги, в которых они лежали
+    (каталоги пользователей после переноса). Выполняется в пуле потоков.
+
+    :param file_paths: Пути файлов.
+    """
+    for file_path in file_paths:
+        with suppress(FileNotFoundError):
+            os.remove(file_path)
+        with suppress(OSError):
+            os.rmdir(os.path.dirname(file_path))
+
+
+def file_extension(file_path: str) -> str:
+    """
+    Возвращает расширение файла без точки.
+    """
+    return os.path.splitext(file_path)[1].lstrip(".")
+
+
+async def migrate_legacy_batch(
+    after_id: int, batch_size: int
+) -> Tuple[Optional[int], int, int]:
+    """
+    Переносит пачку медиафайлов записей medias без SHA-256.
+
+    Файлы хешируются до начала транзакции, затем строки medias
+    блокируются, и для каждой строки, которая еще не перенесена и не удалена,
+    store_blob добавляет ссылку на медиафайл с ее содержимым. Если пачка
+    не будет зафиксирована, файлы, записанные store_blob вместе с новыми
+    строками media_blobs, удаляются при откате транзакции.
+
+    :param after_id: ID записи medias, после которой начинается пачка.
+    :param batch_size: Количество записей в пачке.
+    :return: ID последней записи пачки (None, если записей не осталось),
+        количество перенесенных записей и количество отсутствующих файлов.
+    """
+    async with Session() as session:
+        result = await session.execute(
+            select(Media.id, Media.file_path)
+            .where(Media.sha256.is_(None), Media.id > after_id)
+            .order_by(Media.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+    if not rows:
+        return None, 0, 0
+
+    hashes = await asyncio.gather(
+        *(asyncio.to_thread(hash_file, file_path) for _, file_path in rows)
+    )
+    hashed = {
+        (media_id, file_path): file_hash
+        for (media_id, file_path), file_hash in zip(rows, hashes)
+        if file_hash is not None
+    }
+    for (media_id, file_path), file_hash in zip(rows, hashes):
+        if file_hash is None:
+            logger.warning(f"Media {media_id}: file {file_path} not found")
+
+    old_paths = []
+    async with Session() as session:
+        result = await session.execute(
+            select(Media.id, Media.file_path)
+            .where(
+                Media.id.in_([media_id for media_id, _ in hashed]),
+                Media.sha256.is_(None),
+            )
+            .order_by(Media.id)
+            .with_for_update()
+        )
+        for media_id, file_path in result.all():
+            if (media_id, file_path) not in hashed:
+                continue
+            size, sha256 = hashed[media_id, file_path]
+            temp_path = await asyncio.to_thread(link_to_temp, file_path)
+            new_path = await store_blob(
+                session=session,
+                temp_path=temp_path,
+                sha256=sha256,
+                size=size,
+                extension=file_extension(file_path),
+            )
+            await session.execute(
+                update(Media)
+                .where(Media.id == media_id)
+                .values(file_path=new_path, file_url=media_url(new_path), sha256=sha256)
+            )
+            old_paths.append(file_path)
+        await session.commit()
+
+    await asyncio.to_thread(remove_files, old_paths)
+    return rows[-1][0], len(old_paths), len(rows) - len(hashed)
+
+
+async def migrate_blob_batch(
+    after_sha256: str, batch_size: int
+) -> Tuple[Optional[str], int]:
+    """
+    Переносит пачку файлов media_blobs, лежащих вне каталогов
+    по префиксу SHA-256.
+
+    Строки media_blobs, файлы которых нужно перенести, блокируются,
+    поэтому загрузка и удаление медиафайлов с тем же содержимым
+    дожидаются конца транзакции. Если пачка не будет зафиксирована,
+    созданные по новым путям файлы удаляются.
+
+    :param after_sha256: SHA-256, после которого начинается пачка.
+    :param batch_size: Количество строк в пачке.
+    :return: SHA-256 последней строки пачки (None, если строк не осталось)
+        и количество перенесенных файлов.
+    """
+    async with Session() as session:
+        result = await session.execute(
+            select(MediaBlob.sha256, MediaBlob.file_path)
+            .where(MediaBlob.sha256 > after_sha256)
+            .order_by(MediaBlob.sha256)
+            .limit(batch_size)
+        )
+        rows = result.all()
+    if not rows:
+        return None, 0
+
+    unsharded = [
+        sha256
+        for sha256, file_path in rows
+        if file_path != blob_path(sha256, file_extension(file_path))
+    ]
+    if not unsharded:
+        return rows[-1][0], 0
+
+    old_paths = []
+    new_paths = []
+    try:
+        async with Session() as session:
+            result = await session.execute(
+                select(MediaBlob.sha256, MediaBlob.file_path)
+                .where(MediaBlob.sha256.in_(unsharded))
+                .order_by(MediaBlob.sha256)
+                .with_for_update()
+            )
+            for sha256, file_path in result.all():
+                new_path = blob_path(sha256, file_extension(file_path))
+                if file_path == new_path:
+                    continue
+                try:
+                    await asyncio.to_thread(move_to_blob_path, file_path, new_path)
+                except FileNotFoundError:
+                    logger.warning(f"Media blob {sha256}: file {file_path} not found")
+                    continue
+                new_paths.append(new_path)
+                await session.execute(
+                    update(MediaBlob)
+                    .where(MediaBlob.sha256 == sha256)
+                    .values(file_path=new_path)
+                )
+                await session.execute(
+                    update(Media)
+                    .where(Media.sha256 == sha256)
+                    .values(file_path=new_path, file_url=media_url(new_path))
+                )
+                old_paths.append(file_path)
+            await session.commit()
+    except BaseException:
+        await asyncio.to_thread(remove_files, new_paths)
+        raise
+
+    await asyncio.to_thread(remove_files, old_paths)
+    return rows[-1][0], len(old_paths)
+
+
+async def migrate_media(batch_size: int, pause: float = 0) -> Dict[str, int]:
+    """
+    Переносит все медиафайлы, сохраненные до хранения по префиксу SHA-256.
+
+    :param batch_size: Количество записей в пачке.
+    :param pause: Пауза между пачками в секундах, снижающая нагрузку
+        на базу данных и диск.
+    :return: Количество перенесенных записей medias, файлов media_blobs
+        и отсутствующих на диске файлов.
+    """
+    stats = {"medias": 0, "blobs": 0, "missing": 0}
+
+    after_id = 0
+    while after_id is not None:
+        after_id, migrated, missing = await migrate_legacy_batch(after_id, batch_size)
+        stats["medias"] += migrated
+        stats["missing"] += missing
+        logger.info(f"Media migration: {stats}")
+        await asyncio.sleep(pause)
+
+    after_sha256 = ""
+    while after_sha256 is not None:
+        after_sha256, migrated = await migrate_blob_batch(after_sha256, batch_size)
+        stats["blobs"] += migrated
+        logger.info(f"Media migration: {stats}")
+        await asyncio.sleep(pause)
+
+    return stats
+
+
+async def run(batch_size: int, pause: float) -> None:
+    """
+    Выполняет перенос и выводит его итоги.
+    """
+    try:
+        stats = await migrate_media(batch_size=batch_size, pause=pause)
+    finally:
+        await dispose_engines()
+
+    print(
+        f"Migrated {stats['medias']} media records and {stats['blobs']} "
+        f"media blobs, {stats['missing']} files not found"
+    )
+
+
+def main() -> None:
+    """
+    Точка входа команды переноса медиафайлов.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--pause", type=float, default=0.1)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.batch_size, args.pause))
+
+
+if __name__ == "__main__":
+    main()
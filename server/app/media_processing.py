@@ -0,0 +1,267 @@
+"""
+Модуль обработки загруженных изображений.
+
+Для каждого загруженного изображения создаются облегченные варианты
+в формате WebP: миниатюра и превью, ограниченные по большей стороне
+MEDIA_THUMBNAIL_SIZE и MEDIA_PREVIEW_SIZE. Варианты лежат рядом
+с медиафайлом (ab/cd/<sha256>.thumbnail.webp) и, как и он, общие
+для всех загрузок одинакового содержимого.
+
+Декодирование и масштабирование изображений занимают процессор,
+поэтому выполняются в пуле процессов и не блокируют цикл событий
+и не удерживают GIL процесса приложения. Варианты создаются
+из временного файла загрузки до обращения к базе данных, store_blob
+только переименовывает их в пути вариантов, поэтому блокировка строки
+media_blobs и соединение с базой данных не удерживаются на время
+масштабирования.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from typing import Dict, Optional, Sequence, Tuple
+
+import aiofiles.os
+import msgspec
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from server.app.loggerconf import logger
+from server.app.metrics import metrics
+from server.app.storage import VARIANTS, media_url, variant_path
+from server.database.getter_variables import (
+    MEDIA_IMAGE_WORKERS,
+    MEDIA_THUMBNAIL_SIZE,
+    MEDIA_PREVIEW_SIZE,
+    MEDIA_WEBP_QUALITY,
+)
+
+
+class ImageSize(msgspec.Struct):
+    """
+    Размеры изображения в пикселях.
+    """
+
+    width: int
+    height: int
+
+
+class ImageVariants(msgspec.Struct, kw_only=True):
+    """
+    Размеры исходного изображения и его варианты.
+
+    Атрибуты:
+        size (ImageSize): Размеры исходного изображения.
+        variants (Dict[str, Tuple[Optional[str], ImageSize]]): Путь
+            временного файла и размеры варианта по его имени (путь None,
+            если вариант уже сохранен и не создавался).
+    """
+
+    size: ImageSize
+    variants: Dict[str, Tuple[Optional[str], ImageSize]]
+
+
+def fit_size(width: int, height: int, bound: int) -> Tuple[int, int]:
+    """
+    Вычисляет размеры изображения, уменьшенного до bound по большей
+    стороне с сохранением пропорций. Изображение не увеличивается.
+
+    :param width: Ширина изображения.
+    :param height: Высота изображения.
+    :param bound: Максимальный размер большей стороны.
+    :return: Ширина и высота уменьшенного изображения.
+    """
+    scale = min(1.0, bound / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def remove_variant_files(variants: Dict[str, Tuple[Optional[str], ImageSize]]) -> None:
+    """
+    Удаляет временные файлы вариантов, если обработка прервалась.
+
+    :param variants: Путь временного файла и размеры варианта по его имени.
+    """
+    for path, _ in variants.values():
+        if path is not None:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def make_variants(
+    file_path: str,
+    variants: Dict[str, Tuple[str, int]],
+    quality: int,
+    existing: Sequence[str] = (),
+) -> Optional[ImageVariants]:
+    """
+    Создает варианты изображения в формате WebP во временных файлах.
+    Выполняется в пуле процессов.
+
+    :param file_path: Путь временного файла загрузки.
+    :param variants: Путь временного файла варианта и максимальный размер
+        его большей стороны по имени варианта.
+    :param quality: Качество сжатия WebP.
+    :param existing: Имена уже сохраненных вариантов: для них вычисляются
+        только размеры.
+    :return: Размеры изображения и его вариантов или None,
+        если файл не является изображением.
+    """
+    sizes = {}
+    try:
+        with Image.open(file_path) as image:
+            image = ImageOps.exif_transpose(image)
+            width, height = image.size
+            for name, (path, bound) in variants.items():
+                size = fit_size(width, height, bound)
+                if name in existing:
+                    sizes[name] = (None, ImageSize(*size))
+                    continue
+
+                if image.mode not in ("RGB", "RGBA"):
+                    has_alpha = "A" in image.mode or "transparency" in image.info
+                    image = image.convert("RGBA" if has_alpha else "RGB")
+                resized = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+                sizes[name] = (path, ImageSize(*size))
+                resized.save(path, "WEBP", quality=quality)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        remove_variant_files(sizes)
+        return None
+    except BaseException:
+        remove_variant_files(sizes)
+        raise
+
+    return ImageVariants(size=ImageSize(width, height), variants=sizes)
+
+
+class ImageProcessor:
+    """
+    Обработка изображений в пуле процессов.
+
+    Атрибуты:
+        workers (int): Количество процессов пула.
+        bounds (Dict[str, int]): Максимальный размер большей стороны
+            по имени варианта.
+        quality (int): Качество сжатия WebP.
+    """
+
+    def __init__(self, workers: int, bounds: Dict[str, int], quality: int) -> None:
+        self.workers = workers
+        self.bounds = bounds
+        self.quality = quality
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        """
+        Запускает пул процессов.
+
+        Процессы запускаются через spawn: форк процесса с запущенным
+        циклом событий и потоками пулов небезопасен.
+        """
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def stop(self) -> None:
+        """
+        Дожидается завершения обработки и останавливает пул процессов.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def process(self, temp_path: str, file_path: str) -> Optional[ImageVariants]:
+        """
+        Создает варианты загруженного изображения в пуле процессов.
+
+        Варианты, уже сохраненные рядом с медиафайлом file_path,
+        не создаются заново. Ошибка обработки не прерывает загрузку:
+        медиафайл остается доступным без вариантов.
+
+        :param temp_path: Путь временного файла загрузки.
+        :param file_path: Путь медиафайла с тем же содержимым.
+        :return: Размеры изображения и его вариантов или None,
+            если файл не является изображением или не был обработан.
+        """
+        variants = {
+            name: (variant_path(temp_path, name), bound)
+            for name, bound in self.bounds.items()
+        }
+        existing = [
+            name
+            for name in self.bounds
+            if await aiofiles.os.path.exists(variant_path(file_path, name))
+        ]
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self.executor,
+                make_variants,
+                temp_path,
+                variants,
+                self.quality,
+                existing,
+            )
+        except Exception:
+            logger.exception(f"Failed to process image {temp_path}")
+            metrics.inc("media_images_failed_total")
+            return None
+
+        if result is None:
+            metrics.inc("media_images_skipped_total")
+        else:
+            metrics.inc("media_images_processed_total")
+        return result
+
+
+image_processor = ImageProcessor(
+    workers=MEDIA_IMAGE_WORKERS,
+    bounds=dict(zip(VARIANTS, (MEDIA_THUMBNAIL_SIZE, MEDIA_PREVIEW_SIZE))),
+    quality=MEDIA_WEBP_QUALITY,
+)
+
+
+def temp_variants(result: Optional[ImageVariants]) -> Dict[str, str]:
+    """
+    Возвращает пути временных файлов созданных вариантов изображения.
+
+    :param result: Результат обработки изображения.
+    :return: Путь временного файла варианта по имени варианта.
+    """
+    if result is None:
+        return {}
+
+    return {name: path for name, (path, _) in result.variants.items() if path}
+
+
+async def variant_columns(
+    result: Optional[ImageVariants], file_path: str
+) -> Dict[str, object]:
+    """
+    Формирует значения колонок Media с размерами изображения
+    и URL его вариантов.
+
+    Вызывается после store_blob: строка media_blobs заблокирована
+    транзакцией, поэтому варианты, лежащие рядом с медиафайлом,
+    не будут удалены до ее фиксации. Варианта может не оказаться,
+    если он был сохранен до обработки и удален вместе с медиафайлом
+    с тем же содержимым, тогда его колонки не заполняются.
+
+    :param result: Результат обработки изображения.
+    :param file_path: Путь медиафайла.
+    :return: Значения колонок Media по их именам
+        (пустой словарь, если файл не является изображением).
+    """
+    if result is None:
+        return {}
+
+    columns = {"width": result.size.width, "height": result.size.height}
+    for name, (_, size) in result.variants.items():
+        path = variant_path(file_path, name)
+        if not await aiofiles.os.path.exists(path):
+            continue
+        columns[f"{name}_url"] = media_url(path)
+        columns[f"{name}_width"] = size.width
+        columns[f"{name}_height"] = size.height
+
+    return columns
@@ -0,0 +1,61 @@
+"""
+Модуль метрик приложения.
+
+Метрики хранятся в памяти процесса и отдаются
+в текстовом формате Prometheus через роут /api/metrics/.
+"""
+
+from collections import defaultdict
+from typing import Dict, Union
+
+
+Number = Union[int, float]
+
+
+class Metrics:
+    """
+    Реестр счетчиков и измерителей приложения.
+
+    Атрибуты:
+        counters (dict[str, int | float]): Монотонно растущие счетчики.
+        gauges (dict[str, int | float]): Измерители с произвольным текущим значением.
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, Number] = defaultdict(int)
+        self.gauges: Dict[str, Number] = {}
+
+    def inc(self, name: str, value: Number = 1) -> None:
+        """
+        Увеличивает значение счетчика.
+
+        :param name: Имя счетчика.
+        :param value: Величина прироста.
+        """
+        self.counters[name] += value
+
+    def set(self, name: str, value: Number) -> None:
+        """
+        Устанавливает значение измерителя.
+
+        :param name: Имя измерителя.
+        :param value: Новое значение.
+        """
+        self.gauges[name] = value
+
+    def render(self) -> str:
+        """
+        Формирует текстовое представление метрик в формате Prometheus.
+
+        :return: Строка с метриками.
+        """
+        lines = []
+        for metric_type, values in (("counter", self.counters), ("gauge", self.gauges)):
+            for name, value in sorted(values.items()):
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,85 @@
+"""
+Модуль ASGI-middleware приложения.
+"""
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from server.app.loggerconf import logger
+from server.app.metrics import metrics
+from server.app.responses import MsgspecJSONResponse
+
+
+class BodySizeLimitMiddleware:
+    """
+    Ограничивает размер тела POST-запросов к роутам с заданным префиксом.
+
+    Запрос с заголовком Content-Length больше max_size отклоняется
+    с кодом 413 до чтения тела. Если размер тела заранее неизвестен
+    (Transfer-Encoding: chunked), байты тела считаются по мере чтения,
+    и при превышении max_size обработчику сообщается об отключении
+    клиента, а клиенту отдается ответ с кодом 413.
+
+    Атрибуты:
+        app (ASGIApp): Оборачиваемое приложение.
+        path (str): Префикс пути ограничиваемых роутов.
+        max_size (int): Максимальный размер тела запроса в байтах.
+    """
+
+    def __init__(self, app: ASGIApp, path: str, max_size: int) -> None:
+        self.app = app
+        self.path = path
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.path)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_size:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started
+            if exceeded and not response_started:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+
+        if exceeded and not response_started:
+            await self.reject(scope, receive, send)
+
+    async def reject(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Отдает ответ с кодом 413 на слишком большой запрос.
+        """
+        metrics.inc("request_body_too_large_total")
+        logger.warning(f"Request body too large: {scope['path']}")
+        response = MsgspecJSONResponse({"detail": "File is too large"}, status_code=413)
+        await response(scope, receive, send)
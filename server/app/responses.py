@@ -0,0 +1,24 @@
+"""
+Модуль классов ответов приложения.
+"""
+
+from typing import Any
+
+import msgspec
+from fastapi.responses import JSONResponse
+
+
+encoder = msgspec.json.Encoder()
+
+
+class MsgspecJSONResponse(JSONResponse):
+    """
+    JSON-ответ, сериализуемый msgspec.
+
+    Принимает как обычные словари и списки, так и структуры
+    из server.app.schemas, которые кодируются без промежуточных словарей.
+    Используется как класс ответа по умолчанию для всех роутов.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return encoder.encode(content)
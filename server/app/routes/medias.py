@@ -2,45 +2,55 @@
 Модуль роута /api/medias/
 """
 
-import os
-from urllib.parse import urljoin
-import random
-import string
-import aiofiles
-
-from fastapi import APIRouter, Header, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-
-from server.database.confdb import session
-from server.database.models import User, Media
-from server.app.routes.utils import lazy_get_user_by_apikey
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, UploadFile, HTTPException, Depends
+
+from server.database.confdb import get_session
+from server.database.models import Media
+from server.app.routes.utils import current_user, save_upload
+from server.app.storage import blob_path, media_url, store_blob
+from server.app.media_processing import (
+    image_processor,
+    temp_variants,
+    variant_columns,
+)
+from server.app.cache import UserIdentity
 from server.app.loggerconf import logger
+from server.app.responses import MsgspecJSONResponse
 
 
 router = APIRouter()
-BASE_URL = "http://127.0.0.1"
 
 
 @router.post("/")
-async def post_medias(file: UploadFile, api_key: str = Header(...)) -> JSONResponse:
+async def post_medias(
+    file: UploadFile,
+    user: UserIdentity = Depends(current_user()),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Загружает медиафайл на сервер.
 
     Функция позволяет пользователю загрузить медиафайл
     на сервер. Если файл не был загружен, возвращается
-    ошибка с кодом 400. Файл сохраняется в директории,
-    привязанной к пользователю, и генерируется уникальное
-    имя для файла. После успешной загрузки медиафайл
+    ошибка с кодом 400. Файл записывается на диск частями, не загружаясь
+    в память целиком, файл больше MEDIA_MAX_SIZE отклоняется
+    с кодом 413. Имя файла определяется SHA-256 его содержимого:
+    если такой файл уже загружен, новая запись ссылается на него
+    без повторной записи на диск. Для изображений в пуле процессов
+    создаются миниатюра и превью в формате WebP, их URL и размеры
+    сохраняются в записи медиафайла. Варианты создаются до обращения
+    к media_blobs, поэтому блокировка строки удерживается только
+    на время ее обновления. После успешной загрузки медиафайл
     сохраняется в базе данных, и возвращается ответ с
     результатом операции и ID нового медиафайла.
 
     :param file: Загружаемый файл.
-    :param api_key: API-ключ текущего пользователя, использующего функцию.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с результатом операции и ID загруженного медиафайла.
-    :raises HTTPException: Если файл не был загружен.
+    :raises HTTPException: Если файл не был загружен или слишком большой.
     """
-    user: User = await lazy_get_user_by_apikey(api_key=api_key, session=session)
-
     if not file:
         logger.warning(
             f"User {
@@ -49,31 +59,32 @@ async def post_medias(file: UploadFile, api_key: str = Header(...)) -> JSONRespo
         )
         raise HTTPException(status_code=400, detail="No file upload")
 
-    media_dir = f"server/medias/{user.id}"
-    os.makedirs(media_dir, exist_ok=True)
-
     file_format = file.filename.split(".")[-1]
-    new_file_name = f"{
-        ''.join(
-            random.choice(
-                string.ascii_letters) for _ in range(10))}.{file_format}"
-
-    file_path = os.path.join(media_dir, new_file_name)
-
-    async with aiofiles.open(file_path, "wb") as medias_file:
-        content = await file.read()
-        await medias_file.write(content)
-        logger.info(
-            f"User {
-                user.name}:{
-                user.id} uploaded a new file: {file_path}"
-        )
-
-    file_url = urljoin(BASE_URL, f"medias/{user.id}/{new_file_name}")
-
-    new_media = Media(file_path=file_path, file_url=file_url)
+    temp_path, size, sha256 = await save_upload(file=file)
+    variants = await image_processor.process(
+        temp_path=temp_path, file_path=blob_path(sha256, file_format)
+    )
+    file_path = await store_blob(
+        session=session,
+        temp_path=temp_path,
+        sha256=sha256,
+        size=size,
+        extension=file_format,
+        temp_variants=temp_variants(variants),
+    )
+    logger.info(
+        f"User {user.name}:{user.id} uploaded a new file: {file_path}, "
+        f"size: {size}, sha256: {sha256}"
+    )
+
+    new_media = Media(
+        file_path=file_path,
+        file_url=media_url(file_path),
+        sha256=sha256,
+        **await variant_columns(variants, file_path),
+    )
     session.add(new_media)
     await session.flush()
     logger.info(f"Media file saved to database with ID: {new_media.id}")
 
-    return JSONResponse({"result": True, "media_id": new_media.id})
+    return MsgspecJSONResponse({"result": True, "media_id": new_media.id})
@@ -0,0 +1,21 @@
+"""
+Модуль роута /api/metrics/
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from server.app.metrics import metrics
+
+
+router = APIRouter()
+
+
+@router.get("/")
+async def get_metrics() -> PlainTextResponse:
+    """
+    Отдает метрики приложения.
+
+    :return: Ответ в текстовом формате Prometheus.
+    """
+    return PlainTextResponse(metrics.render())
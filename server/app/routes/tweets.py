@@ -2,87 +2,262 @@
 Модуль роутов /api/tweets/
 """
 
-import os
-from typing import Sequence
+import json
+from enum import Enum
+from typing import AsyncIterator, List, Optional
 
 from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
-from fastapi import APIRouter, Header, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import Response, StreamingResponse
 
+from server.app.cache import UserIdentity
 from server.app.loggerconf import logger
+from server.app.media_cleanup import media_deleter
+from server.app.responses import MsgspecJSONResponse
+from server.app.storage import release_blobs, restore_blobs
 from server.app.routes.utils import (
-    lazy_get_user_by_apikey,
-    get_all_tweet,
-    get_user_by_apikey,
+    current_user,
+    get_timeline_page,
+    get_timeline_tweet_ids,
+    get_likes_preview,
+    get_likes_page,
+    render_tweet_feed_json,
+    stream_tweet_json_items,
+    push_tweet_to_timelines,
     lazy_get_tweet_by_id,
-    get_like,
-    get_tweet_by_id,
+    delete_tweet_by_author,
     make_tweet_feed,
+    add_like,
+    remove_like,
 )
-from server.database.confdb import session
-from server.database.models import Tweet, User, Media, Like
+from server.database.confdb import Session, get_session
+from server.database.getter_variables import (
+    FEED_PAGE_SIZE,
+    FEED_MAX_PAGE_SIZE,
+    LIKES_PAGE_SIZE,
+)
+from server.database.models import Tweet, Media
+from server.app.schemas import TweetFeed
 
 
 router = APIRouter()
 
 
+class FeedRender(str, Enum):
+    """
+    Способ формирования ответа ленты твитов.
+
+    orm: твиты загружаются в ORM-объекты и сериализуются приложением.
+    database: JSON ответа целиком собирается на стороне PostgreSQL.
+    """
+
+    orm = "orm"
+    database = "database"
+
+
+class FeedStream(str, Enum):
+    """
+    Формат потоковой передачи ленты твитов.
+
+    ndjson: по одному элементу ленты в строке (application/x-ndjson),
+        курсор следующей страницы передается в заголовке X-Next-Cursor.
+    json: обычный ответ ленты, передаваемый частями по мере чтения твитов.
+    """
+
+    ndjson = "ndjson"
+    json = "json"
+
+
+async def stream_tweet_feed(
+    tweet_ids: List[int],
+    next_cursor: Optional[int],
+    likes_preview: Optional[int],
+    stream: FeedStream,
+    bind: AsyncEngine,
+) -> AsyncIterator[bytes]:
+    """
+    Формирует тело потокового ответа ленты твитов.
+
+    Генератор выполняется уже после выхода из обработчика запроса,
+    поэтому открывает собственную сессию на время передачи ответа
+    на том же движке (основная база или реплика), что и сессия запроса.
+
+    :param tweet_ids: ID твитов страницы ленты.
+    :param next_cursor: Курсор следующей страницы.
+    :param likes_preview: Количество лайкнувших пользователей в элементе ленты.
+    :param stream: Формат потоковой передачи.
+    :param bind: Движок, на котором выполняется сессия запроса.
+    :return: Асинхронный итератор частей тела ответа.
+    """
+    async with Session(bind=bind) as stream_session:
+        items = stream_tweet_json_items(
+            session=stream_session, tweet_ids=tweet_ids, likes_preview=likes_preview
+        )
+
+        if stream == FeedStream.ndjson:
+            async for item in items:
+                yield f"{item}\n".encode()
+            return
+
+        yield b'{"result": true, "tweets": ['
+        separator = ""
+        async for item in items:
+            yield f"{separator}{item}".encode()
+            separator = ", "
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'.encode()
+
+
 @router.get("/")
-async def tweets(api_key: str = Header(...)) -> JSONResponse:
+async def tweets(
+    user: UserIdentity = Depends(current_user()),
+    limit: int = Query(default=FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(default=None),
+    render: FeedRender = Query(default=FeedRender.orm),
+    likes_preview: Optional[int] = Query(default=None, ge=0, le=FEED_MAX_PAGE_SIZE),
+    stream: Optional[FeedStream] = Query(default=None),
+    session: AsyncSession = Depends(get_session),
+) -> Response:
     """
     Получает ленту твитов для текущего пользователя.
 
-    Функция извлекает все твиты из базы данных и формирует ленту твитов.
-    Лента включает в себя информацию о контенте твитов, медиа-материалах
-    и лайках. Для получения данных используется API-ключ текущего пользователя.
-
-    :param api_key: API-ключ текущего пользователя, используемый для аутентификации.
-    :return: Ответ в формате JSON с лентой твитов.
+    Функция извлекает страницу домашней ленты пользователя (его собственные
+    твиты и твиты пользователей, на которых он подписан) и формирует ленту
+    твитов. Лента включает в себя информацию о контенте твитов, медиа-материалах
+    и лайках. Твиты отдаются от новых к старым, для получения следующей
+    страницы нужно передать значение next_cursor из предыдущего ответа.
+    Для получения данных используется API-ключ текущего пользователя.
+
+    При render=database ответ собирается одним запросом к PostgreSQL
+    и передается клиенту без построения ORM-объектов.
+
+    При переданном likes_preview в элементах ленты вместо полного списка
+    лайков возвращаются только первые likes_preview лайкнувших пользователей,
+    а полное количество лайков содержится в like_count. Полный список
+    доступен постранично в GET /api/tweets/{tweet_id}/likes.
+
+    При переданном stream элементы ленты собираются на стороне PostgreSQL
+    и отправляются клиенту по мере чтения из базы данных, не накапливая
+    ответ целиком в памяти (параметр render при этом не учитывается).
+
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param limit: Количество твитов на странице.
+    :param cursor: Курсор страницы (ID твита, до которого выдается лента).
+    :param render: Способ формирования ответа.
+    :param likes_preview: Количество лайкнувших пользователей в элементе ленты.
+    :param stream: Формат потоковой передачи ленты.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
+    :return: Ответ в формате JSON с лентой твитов и курсором следующей страницы.
     """
-    user: User = await lazy_get_user_by_apikey(session=session, api_key=api_key)
-    tweets: Sequence[Tweet] = await get_all_tweet(session=session)
-    tweet_feed: dict = await make_tweet_feed(tweets=tweets)
+    if stream is not None:
+        tweet_ids, next_cursor = await get_timeline_tweet_ids(
+            session=session, user_id=user.id, limit=limit, cursor=cursor
+        )
+        content = stream_tweet_feed(
+            tweet_ids=tweet_ids,
+            next_cursor=next_cursor,
+            likes_preview=likes_preview,
+            stream=stream,
+            bind=session.bind,
+        )
+        if stream == FeedStream.ndjson:
+            headers = {}
+            if next_cursor is not None:
+                headers["X-Next-Cursor"] = str(next_cursor)
+            return StreamingResponse(
+                content, media_type="application/x-ndjson", headers=headers
+            )
+        return StreamingResponse(content, media_type="application/json")
+
+    if render == FeedRender.database:
+        tweet_ids, next_cursor = await get_timeline_tweet_ids(
+            session=session, user_id=user.id, limit=limit, cursor=cursor
+        )
+        tweet_feed: str = await render_tweet_feed_json(
+            session=session,
+            tweet_ids=tweet_ids,
+            next_cursor=next_cursor,
+            likes_preview=likes_preview,
+        )
+        return Response(content=tweet_feed, media_type="application/json")
+
+    tweets, next_cursor = await get_timeline_page(
+        session=session,
+        user_id=user.id,
+        limit=limit,
+        cursor=cursor,
+        load_likes=likes_preview is None,
+    )
+    likes = None
+    if likes_preview is not None:
+        likes = await get_likes_preview(
+            session=session,
+            tweet_ids=[tweet.id for tweet in tweets],
+            size=likes_preview,
+        )
+    tweet_feed: TweetFeed = await make_tweet_feed(
+        tweets=tweets, next_cursor=next_cursor, likes=likes
+    )
 
-    return JSONResponse(tweet_feed)
+    return MsgspecJSONResponse(tweet_feed)
 
 
 @router.post("/")
-async def post_tweets(tweet_data: dict, api_key: str = Header(...)) -> JSONResponse:
+async def post_tweets(
+    tweet_data: dict,
+    user: UserIdentity = Depends(current_user()),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Создает новый твит.
 
     Функция создает новый твит с предоставленным контентом и
-    прикрепленными медиа-материалами. Если твит не содержит
-    данных, выбрасывается ошибка с кодом 400. После успешного
+    прикрепленными медиа-материалами, после чего добавляет его
+    в ленты автора и его подписчиков. Если твит не содержит
+    данных, выбрасывается ошибка с кодом 400. Медиа-материалы
+    блокируются (SELECT ... FOR UPDATE) до привязки к твиту, чтобы
+    сборщик медиафайлов не удалил их в это время; если какого-то из них
+    нет (например, он уже удален сборщиком), выбрасывается ошибка
+    с кодом 400. После успешного
     добавления твита в базу данных возвращается ответ с результатом
     операции и ID созданного твита.
 
     :param tweet_data: Данные твита, включая текст твита и список ID медиа-материалов.
-    :param api_key: API-ключ текущего пользователя, использующего функцию.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с результатом операции и ID созданного твита.
-    :raises HTTPException: Если твит пустой (отсутствует контент).
+    :raises HTTPException: Если твит пустой (отсутствует контент)
+        или медиа-материал не найден.
     """
-    user: User = await lazy_get_user_by_apikey(session=session, api_key=api_key)
-
     if not tweet_data:
         raise HTTPException(status_code=400, detail="Tweet is empty")
 
-    content = tweet_data.get("tweet_data")
-    new_tweet = Tweet(content=content, author_id=user.id)
-    session.add(new_tweet)
-    await session.flush()
-
     media_ids = tweet_data.get("tweet_media_ids", [])
+    media_items = []
     if media_ids:
         media_query = await session.execute(
-            select(Media).where(Media.id.in_(media_ids))
+            select(Media)
+            .where(Media.id.in_(media_ids))
+            .order_by(Media.id)
+            .with_for_update()
         )
         media_items = media_query.scalars().all()
-        for media in media_items:
-            media.tweet_id = new_tweet.id
-            session.add(media)
+        if len(media_items) != len(set(media_ids)):
+            logger.warning(
+                f"User {user.name}:{user.id} attached missing media: {media_ids}"
+            )
+            raise HTTPException(status_code=400, detail="Media not found")
+
+    content = tweet_data.get("tweet_data")
+    new_tweet = Tweet(content=content, author_id=user.id)
+    session.add(new_tweet)
+    await session.flush()
+    await push_tweet_to_timelines(session=session, tweet=new_tweet)
+
+    for media in media_items:
+        media.tweet_id = new_tweet.id
 
-    await session.commit()
     logger.info(
         f"User {
             user.name}:{
@@ -91,103 +266,169 @@ async def post_tweets(tweet_data: dict, api_key: str = Header(...)) -> JSONRespo
                 new_tweet.id}, Content: "{content}", Media IDs: {media_ids}'
     )
 
-    return JSONResponse({"result": True, "tweet_id": new_tweet.id})
+    return MsgspecJSONResponse({"result": True, "tweet_id": new_tweet.id})
+
+
+@router.get("/{tweet_id}/likes")
+async def tweet_likes(
+    tweet_id: int,
+    user: UserIdentity = Depends(current_user()),
+    limit: int = Query(default=LIKES_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(default=None),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
+    """
+    Получает список пользователей, лайкнувших твит.
+
+    Пользователи отдаются постранично в порядке постановки лайков,
+    для получения следующей страницы нужно передать значение
+    next_cursor из предыдущего ответа.
+
+    :param tweet_id: ID твита.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param limit: Количество лайков на странице.
+    :param cursor: Курсор страницы (ID лайка, после которого выдается список).
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
+    :return: Ответ в формате JSON со списком лайков и курсором следующей страницы.
+    :raises HTTPException: Если твит не найден.
+    """
+    tweet: Tweet = await lazy_get_tweet_by_id(tweet_id=tweet_id, session=session)
+    likes, next_cursor = await get_likes_page(
+        session=session, tweet_id=tweet.id, limit=limit, cursor=cursor
+    )
+
+    return MsgspecJSONResponse(
+        {
+            "result": True,
+            "likes": [{"user_id": like.user_id, "name": like.name} for like in likes],
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @router.post("/{tweet_id}/likes")
-async def like_the_tweet(tweet_id: int, api_key: str = Header(...)) -> JSONResponse:
+async def like_the_tweet(
+    tweet_id: int,
+    user: UserIdentity = Depends(current_user()),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Лайк твита.
 
     Функция позволяет пользователю поставить лайк на твит.
-    Если пользователь уже поставил лайк, возвращается
-    ошибка с кодом 400. Если лайк еще не поставлен,
-    он добавляется в базу данных.
+    Лайк и увеличение счетчика лайков твита выполняются
+    одним запросом (INSERT ... ON CONFLICT DO NOTHING), поэтому
+    параллельные лайки не создают дубликатов. Если пользователь
+    уже поставил лайк, возвращается ошибка с кодом 400.
 
     :param tweet_id: ID твита, на который ставится лайк.
-    :param api_key: API-ключ текущего пользователя, использующего функцию.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с результатом операции.
-    :raises HTTPException: Если твит уже был лайкнут пользователем.
+    :raises HTTPException: Если твит не найден или уже был лайкнут пользователем.
     """
-    user: User = await lazy_get_user_by_apikey(session=session, api_key=api_key)
-    tweet: Tweet = await lazy_get_tweet_by_id(tweet_id=tweet_id, session=session)
+    tweet_found, liked = await add_like(
+        session=session, user_id=user.id, tweet_id=tweet_id
+    )
 
-    try:
-        like: Like = await get_like(user_id=user.id, tweet_id=tweet.id, session=session)
-    except HTTPException:
-        session.add(Like(user_id=user.id, tweet_id=tweet.id))
-        await session.commit()
-        logger.info(f"{user.name}:{user.id} like tweet:{tweet.id}")
-        return JSONResponse({"result": True})
+    if not tweet_found:
+        logger.warning(f"Tweet not found for ID {tweet_id}")
+        raise HTTPException(status_code=404, detail="Tweet not found")
 
-    raise HTTPException(status_code=400, detail="Already liked the tweet")
+    if not liked:
+        raise HTTPException(status_code=400, detail="Already liked the tweet")
+
+    logger.info(f"{user.name}:{user.id} like tweet:{tweet_id}")
+    return MsgspecJSONResponse({"result": True})
 
 
 @router.delete("/{tweet_id}/likes")
 async def delete_like_on_the_tweet(
-    tweet_id: int, api_key: str = Header(...)
-) -> JSONResponse:
+    tweet_id: int,
+    user: UserIdentity = Depends(current_user()),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Удаление лайка с твита.
 
     Функция позволяет пользователю удалить свой лайк с твита.
-    Если лайк существует, он удаляется из базы данных.
+    Удаление лайка и уменьшение счетчика лайков твита
+    выполняются одним запросом (DELETE ... RETURNING).
     В случае успешного выполнения возвращается ответ с
     результатом операции.
 
     :param tweet_id: ID твита, с которого удаляется лайк.
-    :param api_key: API-ключ текущего пользователя, использующего функцию.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с результатом операции.
-    :raises HTTPException: Если лайк не был найден.
+    :raises HTTPException: Если твит или лайк не был найден.
     """
-    user: User = await lazy_get_user_by_apikey(session=session, api_key=api_key)
-    tweet: Tweet = await lazy_get_tweet_by_id(tweet_id=tweet_id, session=session)
-    like: Like = await get_like(user_id=user.id, tweet_id=tweet.id, session=session)
+    tweet_found, unliked = await remove_like(
+        session=session, user_id=user.id, tweet_id=tweet_id
+    )
+
+    if not tweet_found:
+        logger.warning(f"Tweet not found for ID {tweet_id}")
+        raise HTTPException(status_code=404, detail="Tweet not found")
 
-    await session.delete(like)
-    await session.commit()
-    logger.info(f"{user.name}:{user.id} unlike tweet:{tweet.id}")
-    return JSONResponse({"result": True})
+    if not unliked:
+        logger.warning(f"Like not found, user_id:{user.id}, tweet_id:{tweet_id}")
+        raise HTTPException(status_code=404, detail="Like not found")
+
+    logger.info(f"{user.name}:{user.id} unlike tweet:{tweet_id}")
+    return MsgspecJSONResponse({"result": True})
 
 
 @router.delete("/{tweet_id}")
-async def delete_tweet(tweet_id: int, api_key: str = Header(...)) -> JSONResponse:
+async def delete_tweet(
+    tweet_id: int,
+    user: UserIdentity = Depends(current_user()),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Удаление твита.
 
     Функция позволяет пользователю удалить твит,
-    если он является автором этого твита. При удалении
-    твита также удаляются связанные медиафайлы с сервера.
-    Если пользователь не является автором твита, возвращается
-    ошибка с кодом 403.
+    если он является автором этого твита. Твит удаляется одним
+    запросом DELETE ... RETURNING, лайки, медиа и записи лент
+    удаляются каскадно на уровне базы данных. Счетчики ссылок
+    на медиафайлы твита уменьшаются, после фиксации транзакции
+    медиафайлы, на которые не осталось ссылок, ставятся в очередь
+    фонового удаления, ответ возвращается, не дожидаясь их удаления с диска.
+    Если твит не найден, возвращается ошибка с кодом 404,
+    если пользователь не является автором твита - с кодом 403.
 
     :param tweet_id: ID твита, который нужно удалить.
-    :param api_key: API-ключ текущего пользователя, использующего функцию.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с результатом операции.
-    :raises HTTPException: Если пользователь не является автором твита.
+    :raises HTTPException: Если твит не найден или пользователь не является его автором.
     """
-    user: User = await get_user_by_apikey(api_key=api_key, session=session)
-    tweet: Tweet = await get_tweet_by_id(tweet_id=tweet_id, session=session)
-
-    if tweet.author_id == user.id:
-        for media in tweet.media:
-            if os.path.exists(media.file_path):
-                os.remove(media.file_path)
-                logger.info(f"{media.file_path} deleted")
-
-        await session.delete(tweet)
-        logger.info(f"User {user.name}:{user.id} deleted tweet:{tweet_id}")
-        await session.commit()
-
-        return JSONResponse({"result": True})
+    deleted = await delete_tweet_by_author(
+        session=session, tweet_id=tweet_id, author_id=user.id
+    )
 
-    else:
+    if deleted is None:
+        tweet: Tweet = await lazy_get_tweet_by_id(tweet_id=tweet_id, session=session)
         logger.warning(
-            f"{
-                user.name}:{
-                user.id} try to delete tweet '{
-                tweet.id}, but he is not the author of this tweet'"
+            f"{user.name}:{user.id} try to delete tweet '{tweet.id}', "
+            f"but he is not the author of this tweet"
         )
         raise HTTPException(
             status_code=403, detail="The user is not the author of the tweet"
         )
+
+    legacy_paths, sha256s = deleted
+    moved = await release_blobs(session=session, sha256s=sha256s)
+    # Транзакция фиксируется здесь, а не в get_session: если фиксация
+    # не удалась, отстраненные release_blobs файлы возвращаются на место,
+    # а в очередь удаления файлы ставятся только после фиксации
+    try:
+        await session.commit()
+    except BaseException:
+        await restore_blobs(moved)
+        raise
+    logger.info(f"User {user.name}:{user.id} deleted tweet:{tweet_id}")
+    media_deleter.submit(legacy_paths + [trash_path for _, trash_path in moved])
+
+    return MsgspecJSONResponse({"result": True})
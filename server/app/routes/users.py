@@ -2,70 +2,227 @@
 Модуль роутов /api/users/
 """
 
-from fastapi import APIRouter, Header, HTTPException
-from fastapi.responses import JSONResponse
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, HTTPException, Depends, Query
+from server.app.responses import MsgspecJSONResponse
 from server.app.loggerconf import logger
 from server.app.routes.utils import (
-    get_user_by_apikey,
-    get_user_by_id,
-    json_about_user,
+    current_user,
+    get_user_answer,
+    json_follows_page,
+    get_author_tweets_page,
+    get_likes_preview,
+    make_tweet_feed,
     lazy_get_user_by_id,
+    add_author_to_timeline,
+    remove_author_from_timeline,
+    add_follow,
+    remove_follow,
+)
+from server.database.confdb import get_session
+from server.database.getter_variables import (
+    FEED_PAGE_SIZE,
+    FEED_MAX_PAGE_SIZE,
+    FOLLOWS_PAGE_SIZE,
 )
-from server.database.confdb import session
+from server.app.cache import UserIdentity
 from server.database.models import User
+from server.app.schemas import TweetFeed, UserAnswer, UserPage
 
 router = APIRouter()
 
 
 @router.get("/me")
-async def get_me(api_key: str = Header(...)) -> JSONResponse:
+async def get_me(
+    user: UserIdentity = Depends(current_user()),
+    follows_preview: Optional[int] = Query(default=None, ge=1, le=FEED_MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Получает информацию о текущем пользователе по API-ключу.
 
     Функция извлекает данные о пользователе с помощью переданного API-ключа,
-    а затем формирует ответ с информацией о пользователе, включая его подписчиков и подписки.
+    а затем формирует ответ с информацией о пользователе, включая его подписчиков и подписки
+    и их количество.
 
-    :param api_key: API-ключ пользователя.
+    При переданном follows_preview в ответ попадают только первые
+    follows_preview подписчиков и подписок и курсоры следующих страниц,
+    полные списки доступны постранично в GET /api/users/{user_id}/followers
+    и GET /api/users/{user_id}/following.
+
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param follows_preview: Количество подписчиков и подписок в ответе.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с информацией о пользователе.
     """
-    user: User = await get_user_by_apikey(api_key=api_key, session=session)
-    result: dict = await json_about_user(user)
+    result: UserAnswer = await get_user_answer(
+        session=session, user_id=user.id, follows_preview=follows_preview
+    )
 
-    return JSONResponse(result)
+    return MsgspecJSONResponse(result)
 
 
 @router.get("/{user_id}")
-async def user_by_id(user_id: int) -> JSONResponse:
+async def user_by_id(
+    user_id: int,
+    follows_preview: Optional[int] = Query(default=None, ge=1, le=FEED_MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Получает информацию о текущем пользователе по его ID.
 
     Функция извлекает данные о пользователе с помощью переданного ID,
-    а затем формирует ответ с информацией о пользователе, включая его подписчиков и подписки.
+    а затем формирует ответ с информацией о пользователе, включая его подписчиков и подписки
+    и их количество.
+
+    При переданном follows_preview в ответ попадают только первые
+    follows_preview подписчиков и подписок и курсоры следующих страниц.
 
     :param user_id: ID пользователя.
+    :param follows_preview: Количество подписчиков и подписок в ответе.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с информацией о пользователе.
     """
-    user: User = await get_user_by_id(user_id=user_id, session=session)
-    result: dict = await json_about_user(user)
+    result: UserAnswer = await get_user_answer(
+        session=session, user_id=user_id, follows_preview=follows_preview
+    )
+
+    return MsgspecJSONResponse(result)
+
+
+@router.get("/{user_id}/followers")
+async def user_followers(
+    user_id: int,
+    limit: int = Query(default=FOLLOWS_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(default=None),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
+    """
+    Получает список подписчиков пользователя.
+
+    Подписчики отдаются постранично в порядке их ID, для получения
+    следующей страницы нужно передать значение next_cursor
+    из предыдущего ответа.
+
+    :param user_id: ID пользователя.
+    :param limit: Количество подписчиков на странице.
+    :param cursor: Курсор страницы (ID подписчика, после которого выдается список).
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
+    :return: Ответ в формате JSON со списком подписчиков и курсором следующей страницы.
+    :raises HTTPException: Если пользователь не найден.
+    """
+    result: UserPage = await json_follows_page(
+        session=session, user_id=user_id, limit=limit, cursor=cursor
+    )
+
+    return MsgspecJSONResponse(result)
+
+
+@router.get("/{user_id}/following")
+async def user_following(
+    user_id: int,
+    limit: int = Query(default=FOLLOWS_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(default=None),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
+    """
+    Получает список подписок пользователя.
 
-    return JSONResponse(result)
+    Подписки отдаются постранично в порядке ID пользователей, для получения
+    следующей страницы нужно передать значение next_cursor
+    из предыдущего ответа.
+
+    :param user_id: ID пользователя.
+    :param limit: Количество подписок на странице.
+    :param cursor: Курсор страницы (ID пользователя, после которого выдается список).
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
+    :return: Ответ в формате JSON со списком подписок и курсором следующей страницы.
+    :raises HTTPException: Если пользователь не найден.
+    """
+    result: UserPage = await json_follows_page(
+        session=session,
+        user_id=user_id,
+        limit=limit,
+        cursor=cursor,
+        followers=False,
+    )
+
+    return MsgspecJSONResponse(result)
+
+
+@router.get("/{user_id}/tweets")
+async def user_tweets(
+    user_id: int,
+    limit: int = Query(default=FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(default=None),
+    likes_preview: Optional[int] = Query(default=None, ge=0, le=FEED_MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
+    """
+    Получает твиты пользователя.
+
+    Твиты отдаются от новых к старым в том же формате, что и лента
+    GET /api/tweets/, для получения следующей страницы нужно передать
+    значение next_cursor из предыдущего ответа.
+
+    При переданном likes_preview в элементах вместо полного списка
+    лайков возвращаются только первые likes_preview лайкнувших пользователей.
+
+    :param user_id: ID пользователя.
+    :param limit: Количество твитов на странице.
+    :param cursor: Курсор страницы (ID твита, до которого выдаются твиты).
+    :param likes_preview: Количество лайкнувших пользователей в элементе.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
+    :return: Ответ в формате JSON с твитами и курсором следующей страницы.
+    :raises HTTPException: Если пользователь не найден.
+    """
+    user: User = await lazy_get_user_by_id(user_id=user_id, session=session)
+    tweets, next_cursor = await get_author_tweets_page(
+        session=session,
+        author_id=user.id,
+        limit=limit,
+        cursor=cursor,
+        load_likes=likes_preview is None,
+    )
+    likes = None
+    if likes_preview is not None:
+        likes = await get_likes_preview(
+            session=session,
+            tweet_ids=[tweet.id for tweet in tweets],
+            size=likes_preview,
+        )
+    tweet_feed: TweetFeed = await make_tweet_feed(
+        tweets=tweets, next_cursor=next_cursor, likes=likes
+    )
+
+    return MsgspecJSONResponse(tweet_feed)
 
 
 @router.post("/{user_id}/follow")
-async def post_users_follow(user_id: int, api_key: str = Header(...)) -> JSONResponse:
+async def post_users_follow(
+    user_id: int,
+    user: UserIdentity = Depends(current_user()),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Подписка на другого пользователя.
 
     Функция позволяет пользователю подписаться на другого пользователя по его ID.
+    Подписка добавляется одним запросом INSERT ... ON CONFLICT DO NOTHING
+    вместе с обновлением счетчиков подписок и подписчиков, последние твиты
+    автора добавляются в ленту подписчика. Подписки пользователей
+    при этом не загружаются.
     Если пользователь уже подписан, возвращается ошибка с кодом 400 и сообщением,
     {user.name} is already subscribed to {follow.name}
 
     :param user_id: ID пользователя, на которого нужно подписаться.
-    :param api_key: API-ключ текущего пользователя, использующего функцию.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с результатом операции.
     :raises HTTPException: Если пользователь уже подписан на другого.
     """
-    user: User = await get_user_by_apikey(api_key=api_key, session=session)
     follow: User = await lazy_get_user_by_id(user_id=user_id, session=session)
 
     if user.id == follow.id:
@@ -73,44 +230,53 @@ async def post_users_follow(user_id: int, api_key: str = Header(...)) -> JSONRes
             status_code=400,
             detail=f"Trying to subscribe to yourself",
         )
-    elif follow not in user.following:
-        user.following.append(follow)
-    else:
+
+    if not await add_follow(
+        session=session, follower_id=user.id, following_id=follow.id
+    ):
         raise HTTPException(
             status_code=400,
             detail=f"{user.name} is already subscribed to {follow.name}",
         )
 
+    await add_author_to_timeline(session=session, user_id=user.id, author_id=follow.id)
     logger.info(f"{user.name} subscribed to {follow.name}")
-    await session.commit()
-    return JSONResponse({"result": True})
+    return MsgspecJSONResponse({"result": True})
 
 
 @router.delete("/{user_id}/follow")
-async def delete_users_follow(user_id: int, api_key: str = Header(...)) -> JSONResponse:
+async def delete_users_follow(
+    user_id: int,
+    user: UserIdentity = Depends(current_user()),
+    session: AsyncSession = Depends(get_session),
+) -> MsgspecJSONResponse:
     """
     Отписка от пользователя.
 
     Функция позволяет пользователю отписаться от другого пользователя по его ID.
+    Подписка удаляется одним запросом DELETE ... RETURNING вместе
+    с обновлением счетчиков подписок и подписчиков, твиты автора
+    удаляются из ленты пользователя.
     Если пользователь не подписан, возвращается ошибка с кодом 400 и сообщением,
     {user.name} doesn't follow {follow.name}
 
     :param user_id: ID пользователя, на которого нужно подписаться.
-    :param api_key: API-ключ текущего пользователя, использующего функцию.
+    :param user: Текущий пользователь, определенный по API-ключу.
+    :param session: Асинхронная сессия SQLAlchemy текущего запроса.
     :return: Ответ в формате JSON с результатом операции.
     :raises HTTPException: Если пользователь уже подписан на другого.
     """
-    user: User = await get_user_by_apikey(api_key=api_key, session=session)
     follow: User = await lazy_get_user_by_id(user_id=user_id, session=session)
 
-    if follow in user.following:
-        user.following.remove(follow)
-    else:
+    if not await remove_follow(
+        session=session, follower_id=user.id, following_id=follow.id
+    ):
         raise HTTPException(
             status_code=400, detail=f"{user.name} doesn't follow {follow.name}"
         )
 
+    await remove_author_from_timeline(
+        session=session, user_id=user.id, author_id=follow.id
+    )
     logger.info(f"{user.name} unfollowed {follow.name}")
-    await session.commit()
-
-    return JSONResponse({"result": True})
+    return MsgspecJSONResponse({"result": True})
@@ -2,48 +2,134 @@
 Модуль утилит используемых в роутах.
 """
 
-from typing import Sequence
+import hashlib
+import heapq
+import os
+from collections import defaultdict
+from contextlib import suppress
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Sequence,
+    Optional,
+    Tuple,
+    List,
+    Union,
+)
+from uuid import uuid4
 
-from server.database.models import User, Tweet, Like
-from sqlalchemy import select, and_
-from sqlalchemy.orm import joinedload
+from server.database.confdb import get_session
+from server.database.models import User, Tweet, Like, Media, Follow, Timeline
+import aiofiles
+import aiofiles.os
+
+from server.database.getter_variables import (
+    MEDIA_MAX_SIZE,
+    MEDIA_CHUNK_SIZE,
+    TIMELINE_BACKFILL_SIZE,
+    CELEBRITY_FOLLOWERS_THRESHOLD,
+    FEED_STREAM_BATCH_SIZE,
+)
+from sqlalchemy import (
+    Delete,
+    Insert,
+    Integer,
+    Row,
+    Select,
+    Text,
+    select,
+    delete,
+    and_,
+    case,
+    cast,
+    func,
+    literal,
+    literal_column,
+    true,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.orm import aliased, joinedload, selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import HTTPException
+from fastapi import Depends, Header, HTTPException, UploadFile
 
 from server.app.loggerconf import logger
+from server.app.cache import UserIdentity, auth_cache
+from server.app.metrics import metrics
+from server.app.storage import UPLOAD_TMP_DIR
+from server.app.schemas import (
+    LikeItem,
+    TweetFeed,
+    TweetItem,
+    UserAnswer,
+    UserPage,
+    UserProfile,
+    UserShort,
+)
+
+# Текущий пользователь: только ID и имя или объект User с подгруженными связями
+CurrentUser = Union[UserIdentity, User]
+
 
+metrics.set("fanout_celebrity_threshold", CELEBRITY_FOLLOWERS_THRESHOLD)
 
-async def get_user_by_apikey(session: AsyncSession, api_key: str) -> User:
+
+def current_user(*relations: str) -> Callable[..., Awaitable[CurrentUser]]:
     """
-    Получает пользователя по API-ключу, подгружая его подписки и подписчиков.
+    Создает зависимость FastAPI, определяющую текущего пользователя
+    по заголовку api-key один раз за запрос.
 
-    Если пользователь найден, возвращается объект User.
-    В противном случае вызывается исключение HTTPException
-    с кодом 404 и сообщением "User not found, invalid API key".
+    Без переданных связей зависимость возвращает UserIdentity (ID и имя
+    пользователя из кэша аутентификации) без загрузки объекта User.
+    Если связи переданы, дополнительно загружается объект User,
+    у которого подгружены только перечисленные связи.
 
-    :param session: Асинхронная сессия SQLAlchemy.
-    :param api_key: API-ключ пользователя.
-    :return: Объект User.
-    :raises HTTPException: Если пользователь не найден.
+    Пример: Depends(current_user("followers", "following")).
+
+    :param relations: Имена связей модели User, нужных обработчику.
+    :return: Зависимость, возвращающая текущего пользователя.
+    :raises AttributeError: Если у модели User нет связи с таким именем.
     """
-    stmt = (
-        select(User)
-        .where(User.apikey == api_key)
-        .options(joinedload(User.followers), joinedload(User.following))
-    )
-    result = await session.execute(stmt)
-    user = result.scalars().first()
-    if user:
-        return user
+    options = [selectinload(getattr(User, relation)) for relation in relations]
 
-    logger.warning(f"User not found for API key: {api_key}")
-    raise HTTPException(status_code=404, detail="User not found, invalid API key")
+    async def dependency(
+        api_key: str = Header(...), session: AsyncSession = Depends(get_session)
+    ) -> CurrentUser:
+        """
+        Определяет текущего пользователя по API-ключу.
+
+        :param api_key: API-ключ текущего пользователя.
+        :param session: Асинхронная сессия SQLAlchemy текущего запроса.
+        :return: Текущий пользователь.
+        :raises HTTPException: Если пользователь не найден.
+        """
+        identity = await lazy_get_user_by_apikey(session=session, api_key=api_key)
+        if not options:
+            return identity
+
+        stmt = select(User).where(User.id == identity.id).options(*options)
+        result = await session.execute(stmt)
+        user = result.scalars().first()
+        if user:
+            return user
+
+        logger.warning(f"User not found for API key: {api_key}")
+        raise HTTPException(status_code=404, detail="User not found, invalid API key")
+
+    return dependency
 
 
 async def get_user_by_id(user_id: int, session: AsyncSession) -> User:
     """
     Получает пользователя по его ID, подгружая его подписки и подписчиков.
 
+    Подписчики и подписки подгружаются отдельными запросами (selectinload):
+    при загрузке обеих коллекций в одном запросе через JOIN количество
+    строк результата равно произведению их размеров.
+
     Если пользователь найден, возвращается объект User.
     В противном случае вызывается исключение HTTPException
     с кодом 404 и сообщением "User not found".
@@ -56,7 +142,7 @@ async def get_user_by_id(user_id: int, session: AsyncSession) -> User:
     stmt = (
         select(User)
         .where(User.id == user_id)
-        .options(joinedload(User.followers), joinedload(User.following))
+        .options(selectinload(User.followers), selectinload(User.following))
     )
     result = await session.execute(stmt)
     user = result.scalars().first()
@@ -67,53 +153,233 @@ async def get_user_by_id(user_id: int, session: AsyncSession) -> User:
     raise HTTPException(status_code=404, detail="User not found")
 
 
-async def make_tweet_feed(tweets: Sequence[Tweet]) -> dict:
+async def make_tweet_feed(
+    tweets: Sequence[Tweet],
+    next_cursor: Optional[int] = None,
+    likes: Optional[Dict[int, List[Row]]] = None,
+) -> TweetFeed:
     """
     Формирует структуру данных для ленты твитов.
 
     :param tweets: Список твитов, для которых будет сформирована лента.
-    :return: Словарь с данными о твитах, включая их контент, медиа, авторов и лайки.
-    """
-    return {
-        "result": True,
-        "tweets": [
-            {
-                "id": tweet.id,
-                "content": tweet.content,
-                "attachments": [media.file_url for media in tweet.media],
-                "author": {
-                    "id": tweet.author.id,
-                    "name": tweet.author.name,
-                },
-                "likes": [
-                    {
-                        "user_id": like.user_id,
-                        "name": like.user.name,
-                    }
-                    for like in tweet.likes
+    :param next_cursor: Курсор для запроса следующей страницы ленты.
+    :param likes: Сокращенные списки лайков по ID твитов (см. get_likes_preview).
+        Если не переданы, в ленту попадают все лайки твитов.
+    :return: Страница ленты с данными о твитах, включая их контент, медиа,
+        авторов и лайки.
+    """
+    return TweetFeed(
+        tweets=[
+            TweetItem(
+                id=tweet.id,
+                content=tweet.content,
+                attachments=[
+                    media.preview_url or media.file_url for media in tweet.media
                 ],
-            }
+                thumbnails=[
+                    media.thumbnail_url or media.file_url for media in tweet.media
+                ],
+                author=UserShort(id=tweet.author.id, name=tweet.author.name),
+                like_count=tweet.like_count,
+                likes=(
+                    [
+                        LikeItem(user_id=like.user_id, name=like.user.name)
+                        for like in tweet.likes
+                    ]
+                    if likes is None
+                    else [
+                        LikeItem(user_id=like.user_id, name=like.name)
+                        for like in likes.get(tweet.id, [])
+                    ]
+                ),
+            )
             for tweet in tweets
         ],
-    }
+        next_cursor=next_cursor,
+    )
 
 
-async def lazy_get_user_by_apikey(session: AsyncSession, api_key: str) -> User:
+def select_tweet_json_items(
+    tweet_ids: List[int], likes_preview: Optional[int] = None
+) -> Select:
     """
-    Получает пользователя по API-ключу без подгрузки дополнительных данных.
+    Формирует запрос, который собирает элементы ленты твитов
+    в JSON на стороне PostgreSQL.
 
-    Если пользователь найден, возвращается объект User.
+    URL медиа, автор и лайки собираются коррелированными подзапросами
+    json_agg / json_build_object, поэтому каждый твит занимает
+    ровно одну строку результата, без декартова произведения
+    лайков и медиа. Структура элемента совпадает с make_tweet_feed.
+
+    :param tweet_ids: ID твитов, включаемых в ленту.
+    :param likes_preview: Количество первых лайкнувших пользователей
+        в элементе ленты (None - все лайки).
+    :return: Запрос со столбцами id (ID твита) и item (JSON элемента ленты).
+    """
+    empty_array = literal_column("'[]'::json")
+    like_user = aliased(User)
+
+    attachments, thumbnails = (
+        select(
+            func.coalesce(
+                func.json_agg(
+                    aggregate_order_by(func.coalesce(url, Media.file_url), Media.id)
+                ),
+                empty_array,
+            )
+        )
+        .where(Media.tweet_id == Tweet.id)
+        .scalar_subquery()
+        for url in (Media.preview_url, Media.thumbnail_url)
+    )
+    likes_rows = (
+        select(Like.id, Like.user_id, like_user.name)
+        .join(like_user, like_user.id == Like.user_id)
+        .where(Like.tweet_id == Tweet.id)
+        .order_by(Like.id)
+        .correlate(Tweet)
+    )
+    if likes_preview is not None:
+        likes_rows = likes_rows.limit(likes_preview)
+    likes_rows = likes_rows.subquery()
+
+    likes = select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        "user_id", likes_rows.c.user_id, "name", likes_rows.c.name
+                    ),
+                    likes_rows.c.id,
+                )
+            ),
+            empty_array,
+        )
+    ).scalar_subquery()
+    item = func.json_build_object(
+        "id",
+        Tweet.id,
+        "content",
+        Tweet.content,
+        "attachments",
+        attachments,
+        "thumbnails",
+        thumbnails,
+        "author",
+        func.json_build_object("id", User.id, "name", User.name),
+        "like_count",
+        Tweet.like_count,
+        "likes",
+        likes,
+    )
+
+    return (
+        select(Tweet.id.label("id"), item.label("item"))
+        .join(User, User.id == Tweet.author_id)
+        .where(Tweet.id.in_(tweet_ids))
+    )
+
+
+async def render_tweet_feed_json(
+    session: AsyncSession,
+    tweet_ids: List[int],
+    next_cursor: Optional[int] = None,
+    likes_preview: Optional[int] = None,
+) -> str:
+    """
+    Формирует готовый JSON ленты твитов одним запросом к PostgreSQL.
+
+    ORM-объекты не создаются: база данных возвращает одну строку
+    с текстом ответа, который можно сразу отдать клиенту.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet_ids: ID твитов, включаемых в ленту.
+    :param next_cursor: Курсор для запроса следующей страницы ленты.
+    :param likes_preview: Количество первых лайкнувших пользователей
+        в элементе ленты (None - все лайки).
+    :return: Строка JSON с той же структурой, что и у make_tweet_feed.
+    """
+    items = select_tweet_json_items(
+        tweet_ids=tweet_ids, likes_preview=likes_preview
+    ).subquery()
+    tweets = func.coalesce(
+        func.json_agg(aggregate_order_by(items.c.item, items.c.id.desc())),
+        literal_column("'[]'::json"),
+    )
+    stmt = select(
+        cast(
+            func.json_build_object(
+                "result",
+                true(),
+                "tweets",
+                tweets,
+                "next_cursor",
+                literal(next_cursor, Integer),
+            ),
+            Text,
+        )
+    ).select_from(items)
+    result = await session.execute(stmt)
+
+    return result.scalar_one()
+
+
+async def stream_tweet_json_items(
+    session: AsyncSession, tweet_ids: List[int], likes_preview: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Построчно отдает элементы ленты твитов, собранные в JSON
+    на стороне PostgreSQL.
+
+    Строки читаются через серверный курсор пачками по
+    FEED_STREAM_BATCH_SIZE, поэтому в памяти одновременно
+    находится не больше одной пачки элементов.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet_ids: ID твитов, включаемых в ленту.
+    :param likes_preview: Количество первых лайкнувших пользователей
+        в элементе ленты (None - все лайки).
+    :return: Асинхронный итератор строк JSON элементов ленты от новых к старым.
+    """
+    items = select_tweet_json_items(
+        tweet_ids=tweet_ids, likes_preview=likes_preview
+    ).subquery()
+    stmt = (
+        select(cast(items.c.item, Text))
+        .order_by(items.c.id.desc())
+        .execution_options(yield_per=FEED_STREAM_BATCH_SIZE)
+    )
+    result = await session.stream(stmt)
+
+    async for item in result.scalars():
+        yield item
+
+
+async def lazy_get_user_by_apikey(session: AsyncSession, api_key: str) -> UserIdentity:
+    """
+    Получает ID и имя пользователя по API-ключу.
+
+    Пользователь сначала ищется в кэше аутентификации и только
+    при промахе запрашивается из базы данных. Результат, в том числе
+    отсутствие пользователя, сохраняется в кэше.
+
+    Если пользователь найден, возвращается объект UserIdentity.
     В противном случае вызывается исключение HTTPException
     с кодом 404 и сообщением "User not found, invalid API key".
 
     :param session: Асинхронная сессия SQLAlchemy.
     :param api_key: API-ключ пользователя.
-    :return: Объект User.
+    :return: Объект UserIdentity.
     :raises HTTPException: Если пользователь не найден.
     """
-    stmt = select(User).where(User.apikey == api_key)
-    result = await session.execute(stmt)
-    user = result.scalars().first()
+    cached, user = auth_cache.get(api_key)
+    if not cached:
+        stmt = select(User.id, User.name).where(User.apikey == api_key)
+        result = await session.execute(stmt)
+        row = result.first()
+        user = UserIdentity(id=row.id, name=row.name) if row else None
+        auth_cache.set(api_key, user)
+
     if user:
         return user
 
@@ -144,83 +410,723 @@ async def lazy_get_user_by_id(session: AsyncSession, user_id: int) -> User:
     raise HTTPException(status_code=404, detail="User not found")
 
 
-async def json_about_user(user: User) -> dict:
+async def json_about_user(user: User) -> UserAnswer:
     """
-    Формирует словарь с информацией о пользователе и его подписках.
+    Формирует ответ с информацией о пользователе и его подписках.
 
     :param user: Объект пользователя, содержащий данные о подписках и подписчиках.
-    :return: Словарь с данными о пользователе, подписчиках и подписках.
-    """
-    return {
-        "result": True,
-        "user": {
-            "id": user.id,
-            "name": user.name,
-            "followers": [
-                {
-                    "id": follower.id,
-                    "name": follower.name,
-                }
+    :return: Ответ с данными о пользователе, подписчиках и подписках.
+    """
+    return UserAnswer(
+        user=UserProfile(
+            id=user.id,
+            name=user.name,
+            followers_count=user.followers_count,
+            following_count=user.following_count,
+            followers=[
+                UserShort(id=follower.id, name=follower.name)
                 for follower in user.followers
             ],
-            "following": [
-                {
-                    "id": following.id,
-                    "name": following.name,
-                }
+            following=[
+                UserShort(id=following.id, name=following.name)
                 for following in user.following
             ],
-        },
-    }
+        ),
+    )
 
 
-async def get_all_tweet(session: AsyncSession) -> Sequence[Tweet]:
+async def get_follows_page(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[int] = None,
+    followers: bool = True,
+) -> Tuple[Sequence[Row], Optional[int]]:
     """
-    Функция получает все твиты из базы данных,
-    подгружает все зависимые таблицы.
+    Функция получает страницу подписчиков или подписок пользователя
+    в порядке их ID.
+
+    Пагинация построена по составному ключу таблицы follows: подписчики
+    читаются по индексу ix_follows_following_id_follower_id, подписки -
+    по первичному ключу (follower_id, following_id). На страницу попадают
+    пользователи с ID больше курсора.
 
     :param session: Асинхронная сессия SQLAlchemy.
-    :return: Последовательность моделей твитов.
+    :param user_id: ID пользователя.
+    :param limit: Максимальное количество пользователей на странице.
+    :param cursor: ID последнего пользователя предыдущей страницы.
+    :param followers: Получать подписчиков (True) или подписки (False).
+    :return: Строки (id, name) и курсор следующей страницы
+        (None, если страница последняя).
     """
-    stmt = select(Tweet).options(
-        joinedload(Tweet.author),
-        joinedload(Tweet.likes).joinedload(Like.user),
-        joinedload(Tweet.media),
+    if followers:
+        owner_id, other_id = Follow.following_id, Follow.follower_id
+    else:
+        owner_id, other_id = Follow.follower_id, Follow.following_id
+
+    stmt = (
+        select(User.id, User.name)
+        .join(Follow, User.id == other_id)
+        .where(owner_id == user_id)
+        .order_by(other_id)
+        .limit(limit + 1)
     )
+    if cursor is not None:
+        stmt = stmt.where(other_id > cursor)
+
     result = await session.execute(stmt)
-    tweets = result.scalars().unique().all()
+    users = result.all()
 
-    return tweets
+    if len(users) > limit:
+        return users[:limit], users[limit - 1].id
 
+    return users, None
 
-async def get_tweet_by_id(session: AsyncSession, tweet_id: int) -> Tweet:
+
+async def json_follows_page(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[int] = None,
+    followers: bool = True,
+) -> UserPage:
     """
-    Функция получает твит по его ID и подгружает все зависимые таблицы.
+    Формирует ответ со страницей подписчиков или подписок пользователя.
 
-    В случае если твит не найден, вызывается исключение
-    HTTPException с кодом 404 и сообщением "Tweet not found".
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID пользователя.
+    :param limit: Максимальное количество пользователей на странице.
+    :param cursor: ID последнего пользователя предыдущей страницы.
+    :param followers: Получать подписчиков (True) или подписки (False).
+    :return: Ответ со страницей пользователей и курсором следующей страницы.
+    :raises HTTPException: Если пользователь не найден.
+    """
+    user: User = await lazy_get_user_by_id(user_id=user_id, session=session)
+    users, next_cursor = await get_follows_page(
+        session=session,
+        user_id=user.id,
+        limit=limit,
+        cursor=cursor,
+        followers=followers,
+    )
+    return UserPage(
+        users=[UserShort(id=row.id, name=row.name) for row in users],
+        next_cursor=next_cursor,
+    )
+
+
+async def get_user_answer(
+    session: AsyncSession, user_id: int, follows_preview: Optional[int] = None
+) -> UserAnswer:
+    """
+    Формирует ответ с профилем пользователя.
+
+    Без follows_preview профиль содержит полные списки подписчиков
+    и подписок. С follows_preview в профиль попадают счетчики и только
+    первые follows_preview подписчиков и подписок, а также курсоры
+    следующих страниц для GET /api/users/{user_id}/followers
+    и GET /api/users/{user_id}/following.
 
     :param session: Асинхронная сессия SQLAlchemy.
-    :param tweet_id: ID Твита.
-    :return: Модель твита.
+    :param user_id: ID пользователя.
+    :param follows_preview: Количество подписчиков и подписок в профиле.
+    :return: Ответ с профилем пользователя.
+    :raises HTTPException: Если пользователь не найден.
+    """
+    if follows_preview is None:
+        user: User = await get_user_by_id(user_id=user_id, session=session)
+        return await json_about_user(user)
+
+    user: User = await lazy_get_user_by_id(user_id=user_id, session=session)
+    followers, followers_cursor = await get_follows_page(
+        session=session, user_id=user.id, limit=follows_preview
+    )
+    following, following_cursor = await get_follows_page(
+        session=session, user_id=user.id, limit=follows_preview, followers=False
+    )
+    return UserAnswer(
+        user=UserProfile(
+            id=user.id,
+            name=user.name,
+            followers_count=user.followers_count,
+            following_count=user.following_count,
+            followers=[UserShort(id=row.id, name=row.name) for row in followers],
+            following=[UserShort(id=row.id, name=row.name) for row in following],
+            followers_next_cursor=followers_cursor,
+            following_next_cursor=following_cursor,
+        ),
+    )
+
+
+async def get_timeline_page(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[int] = None,
+    load_likes: bool = True,
+) -> Tuple[Sequence[Tweet], Optional[int]]:
+    """
+    Функция получает страницу домашней ленты пользователя, начиная
+    с самых новых твитов, подгружает все зависимые таблицы.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID владельца ленты.
+    :param limit: Максимальное количество твитов на странице.
+    :param cursor: ID последнего твита предыдущей страницы.
+    :param load_likes: Подгружать ли полные списки лайков твитов.
+    :return: Твиты страницы и курсор следующей страницы (None, если страница последняя).
+    """
+    tweet_ids, next_cursor = await get_timeline_tweet_ids(
+        session=session, user_id=user_id, limit=limit, cursor=cursor
+    )
+    tweets = await get_tweets_by_ids(
+        session=session, tweet_ids=tweet_ids, load_likes=load_likes
+    )
+
+    return tweets, next_cursor
+
+
+async def get_author_tweets_page(
+    session: AsyncSession,
+    author_id: int,
+    limit: int,
+    cursor: Optional[int] = None,
+    load_likes: bool = True,
+) -> Tuple[Sequence[Tweet], Optional[int]]:
+    """
+    Функция получает страницу твитов автора, начиная с самых новых,
+    подгружает все зависимые таблицы.
+
+    ID твитов читаются диапазонным сканированием индекса
+    ix_tweets_author_id_id (author_id, id) в обратном порядке,
+    поэтому стоимость запроса не зависит ни от количества твитов
+    автора, ни от номера страницы.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param author_id: ID автора.
+    :param limit: Максимальное количество твитов на странице.
+    :param cursor: ID последнего твита предыдущей страницы.
+    :param load_likes: Подгружать ли полные списки лайков твитов.
+    :return: Твиты страницы и курсор следующей страницы (None, если страница последняя).
     """
+    stmt = (
+        select(Tweet.id)
+        .where(Tweet.author_id == author_id)
+        .order_by(Tweet.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Tweet.id < cursor)
+
+    result = await session.execute(stmt)
+    tweet_ids = result.scalars().all()
+
+    next_cursor = None
+    if len(tweet_ids) > limit:
+        tweet_ids, next_cursor = tweet_ids[:limit], tweet_ids[limit - 1]
+
+    tweets = await get_tweets_by_ids(
+        session=session, tweet_ids=tweet_ids, load_likes=load_likes
+    )
+
+    return tweets, next_cursor
+
+
+async def get_tweets_by_ids(
+    session: AsyncSession, tweet_ids: Sequence[int], load_likes: bool = True
+) -> Sequence[Tweet]:
+    """
+    Функция получает твиты по их ID от новых к старым,
+    подгружает авторов, медиа и, при необходимости, лайки.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet_ids: ID твитов.
+    :param load_likes: Подгружать ли полные списки лайков твитов.
+    :return: Твиты в порядке убывания ID.
+    """
+    if not tweet_ids:
+        return []
+
     stmt = (
         select(Tweet)
-        .where(Tweet.id == tweet_id)
-        .options(
-            joinedload(Tweet.author),
-            joinedload(Tweet.likes).joinedload(Like.user),
-            joinedload(Tweet.media),
+        .where(Tweet.id.in_(tweet_ids))
+        .order_by(Tweet.id.desc())
+        .options(joinedload(Tweet.author), selectinload(Tweet.media))
+    )
+    if load_likes:
+        stmt = stmt.options(selectinload(Tweet.likes).joinedload(Like.user))
+
+    result = await session.execute(stmt)
+    return result.scalars().all()
+
+
+async def get_likes_preview(
+    session: AsyncSession, tweet_ids: List[int], size: int
+) -> Dict[int, List[Row]]:
+    """
+    Функция получает первых лайкнувших пользователей для каждого твита.
+
+    Для каждого твита выполняется ограниченный LATERAL-подзапрос,
+    поэтому объем выборки не зависит от количества лайков твита.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet_ids: ID твитов.
+    :param size: Количество лайкнувших пользователей на твит.
+    :return: Словарь ID твита -> строки (user_id, name) в порядке лайков.
+    """
+    preview = (
+        select(Like.id, Like.user_id, User.name)
+        .join(User, User.id == Like.user_id)
+        .where(Like.tweet_id == Tweet.id)
+        .order_by(Like.id)
+        .limit(size)
+        .lateral()
+    )
+    stmt = (
+        select(Tweet.id.label("tweet_id"), preview.c.user_id, preview.c.name)
+        .join(preview, true())
+        .where(Tweet.id.in_(tweet_ids))
+        .order_by(Tweet.id, preview.c.id)
+    )
+    result = await session.execute(stmt)
+
+    likes = defaultdict(list)
+    for like in result.all():
+        likes[like.tweet_id].append(like)
+
+    return likes
+
+
+async def get_likes_page(
+    session: AsyncSession, tweet_id: int, limit: int, cursor: Optional[int] = None
+) -> Tuple[Sequence[Row], Optional[int]]:
+    """
+    Функция получает страницу пользователей, лайкнувших твит,
+    в порядке постановки лайков.
+
+    Пагинация построена по ключу likes.id: на страницу попадают
+    лайки с ID больше курсора.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet_id: ID твита.
+    :param limit: Максимальное количество лайков на странице.
+    :param cursor: ID последнего лайка предыдущей страницы.
+    :return: Строки (id, user_id, name) и курсор следующей страницы
+        (None, если страница последняя).
+    """
+    stmt = (
+        select(Like.id, Like.user_id, User.name)
+        .join(User, User.id == Like.user_id)
+        .where(Like.tweet_id == tweet_id)
+        .order_by(Like.id)
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Like.id > cursor)
+
+    result = await session.execute(stmt)
+    likes = result.all()
+
+    if len(likes) > limit:
+        return likes[:limit], likes[limit - 1].id
+
+    return likes, None
+
+
+async def get_timeline_tweet_ids(
+    session: AsyncSession, user_id: int, limit: int, cursor: Optional[int] = None
+) -> Tuple[List[int], Optional[int]]:
+    """
+    Функция получает ID твитов страницы домашней ленты пользователя.
+
+    Основная часть ленты читается из таблицы timelines диапазонным
+    сканированием первичного ключа (user_id, tweet_id). Твиты авторов,
+    число подписчиков которых превышает CELEBRITY_FOLLOWERS_THRESHOLD,
+    в ленты не записываются: последние твиты таких авторов выбираются
+    одним запросом и сливаются с лентой k-путевым слиянием.
+    На страницу попадают твиты с ID меньше курсора, поэтому стоимость
+    запроса не зависит ни от размера таблиц, ни от номера страницы.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID владельца ленты.
+    :param limit: Максимальное количество твитов на странице.
+    :param cursor: ID последнего твита предыдущей страницы.
+    :return: ID твитов страницы и курсор следующей страницы (None, если страница последняя).
+    """
+    timeline_stmt = (
+        select(Timeline.tweet_id)
+        .where(Timeline.user_id == user_id)
+        .order_by(Timeline.tweet_id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        timeline_stmt = timeline_stmt.where(Timeline.tweet_id < cursor)
+
+    result = await session.execute(timeline_stmt)
+    timeline_ids = result.scalars().all()
+
+    celebrity_ids = await get_celebrity_tweet_ids(
+        session=session, user_id=user_id, limit=limit, cursor=cursor
+    )
+    if celebrity_ids:
+        metrics.inc("feed_celebrity_merges_total")
+
+    tweet_ids = []
+    for tweet_id in heapq.merge(timeline_ids, *celebrity_ids, reverse=True):
+        # Твит может оказаться и в ленте, и среди твитов знаменитостей,
+        # если автор перешел порог подписчиков после публикации.
+        if tweet_ids and tweet_ids[-1] == tweet_id:
+            continue
+        tweet_ids.append(tweet_id)
+        if len(tweet_ids) > limit:
+            return tweet_ids[:limit], tweet_ids[limit - 1]
+
+    return tweet_ids, None
+
+
+async def get_celebrity_tweet_ids(
+    session: AsyncSession, user_id: int, limit: int, cursor: Optional[int] = None
+) -> List[List[int]]:
+    """
+    Функция получает ID последних твитов авторов-знаменитостей,
+    на которых подписан пользователь.
+
+    Знаменитостью считается автор, число подписчиков которого
+    превышает CELEBRITY_FOLLOWERS_THRESHOLD. Для каждого такого
+    автора выбирается не более limit + 1 твитов с ID меньше курсора.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID владельца ленты.
+    :param limit: Максимальное количество твитов на странице.
+    :param cursor: ID последнего твита предыдущей страницы.
+    :return: Списки ID твитов по каждому автору, отсортированные по убыванию.
+    """
+    celebrities = (
+        select(Follow.following_id.label("author_id"))
+        .join(User, User.id == Follow.following_id)
+        .where(Follow.follower_id == user_id)
+        .where(User.followers_count > CELEBRITY_FOLLOWERS_THRESHOLD)
+        .subquery()
+    )
+    recent_tweets = (
+        select(Tweet.id)
+        .where(Tweet.author_id == celebrities.c.author_id)
+        .order_by(Tweet.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        recent_tweets = recent_tweets.where(Tweet.id < cursor)
+    recent_tweets = recent_tweets.lateral()
+
+    stmt = select(celebrities.c.author_id, recent_tweets.c.id).select_from(
+        celebrities.join(recent_tweets, true())
+    )
+    result = await session.execute(stmt)
+
+    tweet_ids_by_author = defaultdict(list)
+    for author_id, tweet_id in result.all():
+        tweet_ids_by_author[author_id].append(tweet_id)
+
+    return [sorted(ids, reverse=True) for ids in tweet_ids_by_author.values()]
+
+
+async def push_tweet_to_timelines(session: AsyncSession, tweet: Tweet) -> None:
+    """
+    Добавляет новый твит в ленту автора и в ленты всех его подписчиков.
+
+    Вставка выполняется одним запросом INSERT ... SELECT по таблице follows.
+    Если число подписчиков автора превышает CELEBRITY_FOLLOWERS_THRESHOLD,
+    твит добавляется только в ленту автора, а подписчики получают его
+    при чтении ленты (см. get_celebrity_tweet_ids).
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet: Опубликованный твит.
+    """
+    followers_count = await session.scalar(
+        select(User.followers_count).where(User.id == tweet.author_id)
+    )
+
+    rows = select(literal(tweet.author_id), literal(tweet.id), literal(tweet.author_id))
+    if followers_count > CELEBRITY_FOLLOWERS_THRESHOLD:
+        metrics.inc("fanout_skipped_tweets_total")
+        logger.info(
+            f"Tweet:{tweet.id} of celebrity author:{tweet.author_id} "
+            f"with {followers_count} followers is merged at read time"
         )
+    else:
+        followers_rows = select(
+            Follow.follower_id, literal(tweet.id), literal(tweet.author_id)
+        ).where(Follow.following_id == tweet.author_id)
+        rows = union_all(rows, followers_rows)
+        metrics.inc("fanout_timeline_rows_total", followers_count)
+
+    stmt = insert(Timeline).from_select(["user_id", "tweet_id", "author_id"], rows)
+    await session.execute(stmt)
+
+
+async def add_author_to_timeline(
+    session: AsyncSession, user_id: int, author_id: int
+) -> None:
+    """
+    Добавляет в ленту пользователя последние твиты автора,
+    на которого он подписался.
+
+    Количество добавляемых твитов ограничено TIMELINE_BACKFILL_SIZE.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID владельца ленты.
+    :param author_id: ID автора, на которого оформлена подписка.
+    """
+    recent_tweets = (
+        select(literal(user_id), Tweet.id, Tweet.author_id)
+        .where(Tweet.author_id == author_id)
+        .order_by(Tweet.id.desc())
+        .limit(TIMELINE_BACKFILL_SIZE)
+    )
+    stmt = (
+        insert(Timeline)
+        .from_select(["user_id", "tweet_id", "author_id"], recent_tweets)
+        .on_conflict_do_nothing()
+    )
+    await session.execute(stmt)
+
+
+async def remove_author_from_timeline(
+    session: AsyncSession, user_id: int, author_id: int
+) -> None:
+    """
+    Удаляет из ленты пользователя все твиты автора, от которого он отписался.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID владельца ленты.
+    :param author_id: ID автора, от которого оформлена отписка.
+    """
+    stmt = delete(Timeline).where(
+        and_(Timeline.user_id == user_id, Timeline.author_id == author_id)
+    )
+    await session.execute(stmt)
+
+
+async def execute_like_change(
+    session: AsyncSession, tweet_id: int, changed: Union[Insert, Delete], delta: int
+) -> Tuple[bool, bool]:
+    """
+    Выполняет изменение лайка и счетчика лайков твита одним запросом.
+
+    Вставка или удаление лайка, изменение like_count и проверка
+    существования твита объединяются через CTE в одну команду,
+    поэтому операция атомарна и выполняется за одно обращение к базе.
+    Счетчик изменяется, только если лайк действительно был
+    добавлен или удален.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet_id: ID твита.
+    :param changed: Команда INSERT или DELETE лайка с RETURNING tweet_id.
+    :param delta: Величина изменения счетчика.
+    :return: Признак существования твита и признак изменения лайка.
+    """
+    changed_likes = changed.cte("changed_likes")
+    counted = (
+        update(Tweet)
+        .where(Tweet.id.in_(select(changed_likes.c.tweet_id)))
+        .values(like_count=Tweet.like_count + delta)
+        .returning(Tweet.id)
+        .cte("counted")
+    )
+    stmt = select(
+        select(Tweet.id).where(Tweet.id == tweet_id).exists(),
+        select(counted.c.id).exists(),
     )
     result = await session.execute(stmt)
-    tweets = result.scalars().first()
+    tweet_found, like_changed = result.one()
+    return tweet_found, like_changed
 
-    if not tweets:
-        logger.warning(f"Tweet not found for ID: {tweet_id}")
-        raise HTTPException(status_code=404, detail="Tweet not found")
 
-    return tweets
+async def add_like(
+    session: AsyncSession, user_id: int, tweet_id: int
+) -> Tuple[bool, bool]:
+    """
+    Ставит лайк пользователя на твит и увеличивает счетчик лайков.
+
+    Повторный лайк отбрасывается уникальным индексом
+    ix_likes_user_id_tweet_id (ON CONFLICT DO NOTHING), поэтому
+    параллельные лайки одного пользователя не создают дубликатов.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID пользователя, который ставит лайк.
+    :param tweet_id: ID твита.
+    :return: Признак существования твита и признак добавления лайка.
+    """
+    rows = select(literal(user_id, Integer), Tweet.id).where(Tweet.id == tweet_id)
+    stmt = (
+        insert(Like)
+        .from_select(["user_id", "tweet_id"], rows)
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(Like.tweet_id)
+    )
+    return await execute_like_change(
+        session=session, tweet_id=tweet_id, changed=stmt, delta=1
+    )
+
+
+async def remove_like(
+    session: AsyncSession, user_id: int, tweet_id: int
+) -> Tuple[bool, bool]:
+    """
+    Удаляет лайк пользователя с твита и уменьшает счетчик лайков.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param user_id: ID пользователя, который удаляет лайк.
+    :param tweet_id: ID твита.
+    :return: Признак существования твита и признак удаления лайка.
+    """
+    stmt = (
+        delete(Like)
+        .where(and_(Like.user_id == user_id, Like.tweet_id == tweet_id))
+        .returning(Like.tweet_id)
+    )
+    return await execute_like_change(
+        session=session, tweet_id=tweet_id, changed=stmt, delta=-1
+    )
+
+
+async def execute_follow_change(
+    session: AsyncSession, changed: Union[Insert, Delete], delta: int
+) -> bool:
+    """
+    Выполняет изменение подписки и счетчиков пользователей одним запросом.
+
+    Вставка или удаление подписки и изменение following_count подписчика
+    и followers_count автора объединяются через CTE в одну команду.
+    Счетчики изменяются, только если подписка действительно была
+    добавлена или удалена.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param changed: Команда INSERT или DELETE подписки
+        с RETURNING follower_id, following_id.
+    :param delta: Величина изменения счетчиков.
+    :return: True, если подписка была добавлена или удалена.
+    """
+    changed_follows = changed.cte("changed_follows")
+    counted = (
+        update(User)
+        .where(
+            User.id.in_([changed_follows.c.follower_id, changed_follows.c.following_id])
+        )
+        .values(
+            following_count=User.following_count
+            + case((User.id == changed_follows.c.follower_id, delta), else_=0),
+            followers_count=User.followers_count
+            + case((User.id == changed_follows.c.following_id, delta), else_=0),
+        )
+        .returning(User.id)
+        .cte("counted")
+    )
+    stmt = select(
+        select(changed_follows.c.follower_id).exists(),
+        select(counted.c.id).exists(),
+    )
+    result = await session.execute(stmt)
+    follow_changed, _ = result.one()
+    return follow_changed
+
+
+async def add_follow(
+    session: AsyncSession, follower_id: int, following_id: int
+) -> bool:
+    """
+    Подписывает пользователя на автора и увеличивает счетчики подписок.
+
+    Повторная подписка отбрасывается первичным ключом таблицы follows
+    (ON CONFLICT DO NOTHING), коллекции подписок пользователей
+    при этом не загружаются.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param follower_id: ID пользователя, который подписывается.
+    :param following_id: ID пользователя, на которого подписываются.
+    :return: True, если подписка добавлена, False, если она уже была.
+    """
+    stmt = (
+        insert(Follow)
+        .values(follower_id=follower_id, following_id=following_id)
+        .on_conflict_do_nothing(index_elements=["follower_id", "following_id"])
+        .returning(Follow.follower_id, Follow.following_id)
+    )
+    return await execute_follow_change(session=session, changed=stmt, delta=1)
+
+
+async def remove_follow(
+    session: AsyncSession, follower_id: int, following_id: int
+) -> bool:
+    """
+    Отписывает пользователя от автора и уменьшает счетчики подписок.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param follower_id: ID пользователя, который отписывается.
+    :param following_id: ID пользователя, от которого отписываются.
+    :return: True, если подписка удалена, False, если ее не было.
+    """
+    stmt = (
+        delete(Follow)
+        .where(
+            and_(
+                Follow.follower_id == follower_id,
+                Follow.following_id == following_id,
+            )
+        )
+        .returning(Follow.follower_id, Follow.following_id)
+    )
+    return await execute_follow_change(session=session, changed=stmt, delta=-1)
+
+
+async def delete_tweet_by_author(
+    session: AsyncSession, tweet_id: int, author_id: int
+) -> Optional[Tuple[List[str], List[str]]]:
+    """
+    Удаляет твит автора одним запросом DELETE ... RETURNING.
+
+    Лайки, медиа и записи лент удаляются каскадно на уровне базы данных
+    (ON DELETE CASCADE), без загрузки в сессию. Медиа твита возвращаются
+    подзапросами в RETURNING: они читают таблицу medias до каскадного
+    удаления ее строк. Строки medias читаются с блокировкой (FOR UPDATE),
+    поэтому, если их в этот момент переносит media_migration, запрос
+    дожидается конца переноса и возвращает уже перенесенные SHA-256,
+    а не снимок, сделанный до фиксации переноса.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param tweet_id: ID твита.
+    :param author_id: ID пользователя, удаляющего твит.
+    :return: Пути медиафайлов твита, загруженных до хранения по содержимому,
+        и SHA-256 остальных медиафайлов твита или None,
+        если твит не найден или пользователь не является его автором.
+    """
+    medias = (
+        select(Media.id, Media.file_path, Media.sha256)
+        .join(Tweet, Tweet.id == Media.tweet_id)
+        .where(and_(Tweet.id == tweet_id, Tweet.author_id == author_id))
+        .with_for_update(of=Media)
+        .cte("tweet_medias")
+    )
+    legacy_paths = func.array(
+        select(medias.c.file_path)
+        .where(medias.c.sha256.is_(None))
+        .order_by(medias.c.id)
+        .scalar_subquery()
+    )
+    sha256s = func.array(
+        select(medias.c.sha256)
+        .where(medias.c.sha256.is_not(None))
+        .order_by(medias.c.id)
+        .scalar_subquery()
+    )
+    stmt = (
+        delete(Tweet)
+        .where(and_(Tweet.id == tweet_id, Tweet.author_id == author_id))
+        .returning(legacy_paths, sha256s)
+    )
+    result = await session.execute(stmt)
+    row = result.one_or_none()
+    return None if row is None else (row[0], row[1])
 
 
 async def lazy_get_tweet_by_id(tweet_id: int, session: AsyncSession) -> Tweet:
@@ -245,27 +1151,39 @@ async def lazy_get_tweet_by_id(tweet_id: int, session: AsyncSession) -> Tweet:
     return tweet
 
 
-async def get_like(tweet_id: int, user_id: int, session: AsyncSession) -> Like:
+async def save_upload(file: UploadFile) -> Tuple[str, int, str]:
     """
-    Получает лайк на твите пользователя.
+    Сохраняет загруженный файл во временный файл, читая его частями
+    по MEDIA_CHUNK_SIZE байт.
 
-    Функция ищет лайк для конкретного твита, который
-    поставил указанный пользователь. Если лайк не найден,
-    генерируется исключение HTTPException с кодом 404 и
-    сообщением "Like not found".
+    SHA-256 содержимого вычисляется по мере записи, по нему
+    store_blob определяет итоговый путь файла. Если файл
+    больше MEDIA_MAX_SIZE, запись прерывается, временный файл удаляется.
 
-    :param tweet_id: ID твита, для которого ищется лайк.
-    :param user_id: ID пользователя, который поставил лайк.
-    :param session: Асинхронная сессия SQLAlchemy.
-    :return: Объект Like, если лайк найден.
-    :raises HTTPException: Если лайк не найден.
+    :param file: Загружаемый файл.
+    :return: Путь временного файла, размер файла в байтах
+        и SHA-256 содержимого в шестнадцатеричном виде.
+    :raises HTTPException: Если файл больше MEDIA_MAX_SIZE.
     """
-    stmt = select(Like).filter(and_(Like.user_id == user_id, Like.tweet_id == tweet_id))
-    result = await session.execute(stmt)
-    like = result.scalars().first()
+    await aiofiles.os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    temp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid4().hex}.part")
+    sha256 = hashlib.sha256()
+    size = 0
 
-    if not like:
-        logger.warning(f"Like not found, user_id:{user_id}, tweet_id:{tweet_id}")
-        raise HTTPException(status_code=404, detail="Like not found")
+    try:
+        async with aiofiles.open(temp_path, "wb") as media_file:
+            while chunk := await file.read(MEDIA_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MEDIA_MAX_SIZE:
+                    logger.warning(
+                        f"Upload {file.filename} exceeds {MEDIA_MAX_SIZE} bytes"
+                    )
+                    raise HTTPException(status_code=413, detail="File is too large")
+                sha256.update(chunk)
+                await media_file.write(chunk)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            await aiofiles.os.remove(temp_path)
+        raise
 
-    return like
+    return temp_path, size, sha256.hexdigest()
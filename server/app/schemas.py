@@ -0,0 +1,94 @@
+"""
+Модуль структур ответов API.
+
+Структуры объявлены через msgspec.Struct: они создаются быстрее
+словарей и сериализуются MsgspecJSONResponse без промежуточных
+словарей. Поля перечислены в порядке ключей ответа.
+"""
+
+from typing import List, Optional
+
+import msgspec
+
+
+class UserShort(msgspec.Struct):
+    """
+    Краткая информация о пользователе (автор твита, подписчик, подписка).
+    """
+
+    id: int
+    name: str
+
+
+class LikeItem(msgspec.Struct):
+    """
+    Лайк твита в элементе ленты.
+    """
+
+    user_id: int
+    name: str
+
+
+class TweetItem(msgspec.Struct):
+    """
+    Элемент ленты твитов.
+
+    attachments содержит URL превью изображений, thumbnails - URL
+    их миниатюр. Для файлов без вариантов (не изображений) оба списка
+    содержат URL исходного файла.
+    """
+
+    id: int
+    content: str
+    attachments: List[str]
+    thumbnails: List[str]
+    author: UserShort
+    like_count: int
+    likes: List[LikeItem]
+
+
+class TweetFeed(msgspec.Struct, kw_only=True):
+    """
+    Страница ленты твитов.
+    """
+
+    result: bool = True
+    tweets: List[TweetItem]
+    next_cursor: Optional[int] = None
+
+
+class UserProfile(msgspec.Struct, omit_defaults=True):
+    """
+    Профиль пользователя с подписчиками и подписками.
+
+    Курсоры следующих страниц подписчиков и подписок выводятся
+    только в кратком профиле, если списки не поместились в него целиком.
+    """
+
+    id: int
+    name: str
+    followers_count: int
+    following_count: int
+    followers: List[UserShort]
+    following: List[UserShort]
+    followers_next_cursor: Optional[int] = None
+    following_next_cursor: Optional[int] = None
+
+
+class UserAnswer(msgspec.Struct, kw_only=True):
+    """
+    Ответ с профилем пользователя.
+    """
+
+    result: bool = True
+    user: UserProfile
+
+
+class UserPage(msgspec.Struct, kw_only=True):
+    """
+    Страница списка подписчиков или подписок пользователя.
+    """
+
+    result: bool = True
+    users: List[UserShort]
+    next_cursor: Optional[int] = None
@@ -0,0 +1,233 @@
+"""
+Модуль хранилища медиафайлов.
+
+Медиафайлы хранятся по содержимому: имя файла на диске определяется
+SHA-256 его содержимого, поэтому одинаковые файлы, загруженные
+несколько раз, хранятся в одном экземпляре. Файлы раскладываются
+по двум уровням каталогов по первым символам SHA-256
+(MEDIA_ROOT/ab/cd/abcd...), чтобы ни один каталог
+не разрастался до сотен тысяч файлов. Таблица media_blobs
+хранит для каждого файла количество ссылающихся на него записей
+medias (ref_count). Файл удаляется с диска, когда удаляется
+последняя ссылающаяся на него запись.
+
+Изменения ref_count выполняются под блокировкой строки media_blobs
+в транзакции запроса, поэтому загрузка файла, совпадающего
+с удаляемым, дожидается завершения удаления и записывает файл заново.
+Файл, записанный вместе с новой строкой media_blobs, удаляется
+при откате транзакции, пока строка еще заблокирована.
+"""
+
+import os
+from collections import Counter
+from contextlib import suppress
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urljoin
+from uuid import uuid4
+
+import aiofiles.os
+from sqlalchemy import Boolean, delete, event, literal_column, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.app.loggerconf import logger
+from server.app.metrics import metrics
+from server.database.getter_variables import MEDIA_ROOT
+from server.database.models import MediaBlob
+
+BASE_URL = "http://127.0.0.1"
+# Каталог временных файлов загрузок, на той же файловой системе,
+# что и медиафайлы, чтобы переименование было атомарным
+UPLOAD_TMP_DIR = os.path.join(MEDIA_ROOT, "tmp")
+# Имена облегченных вариантов изображений (см. media_processing)
+VARIANTS = ("thumbnail", "preview")
+
+
+def blob_path(sha256: str, extension: str) -> str:
+    """
+    Формирует путь медиафайла по SHA-256 его содержимого.
+
+    :param sha256: SHA-256 содержимого в шестнадцатеричном виде.
+    :param extension: Расширение файла.
+    :return: Путь файла на сервере.
+    """
+    return os.path.join(MEDIA_ROOT, sha256[:2], sha256[2:4], f"{sha256}.{extension}")
+
+
+def variant_path(file_path: str, name: str) -> str:
+    """
+    Формирует путь варианта изображения в формате WebP.
+
+    :param file_path: Путь медиафайла.
+    :param name: Имя варианта.
+    :return: Путь варианта на сервере.
+    """
+    root, _ = os.path.splitext(file_path)
+    return f"{root}.{name}.webp"
+
+
+def media_url(file_path: str) -> str:
+    """
+    Формирует URL медиафайла по его пути на сервере.
+
+    :param file_path: Путь файла на сервере.
+    :return: URL для доступа к файлу.
+    """
+    relative_path = os.path.relpath(file_path, MEDIA_ROOT).replace(os.sep, "/")
+    return urljoin(BASE_URL, f"medias/{relative_path}")
+
+
+def remove_blob_files(file_path: str) -> None:
+    """
+    Удаляет медиафайл и его варианты.
+
+    :param file_path: Путь медиафайла.
+    """
+    for path in (file_path, *(variant_path(file_path, name) for name in VARIANTS)):
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+
+async def store_blob(
+    session: AsyncSession,
+    temp_path: str,
+    sha256: str,
+    size: int,
+    extension: str,
+    temp_variants: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Добавляет ссылку на медиафайл с заданным содержимым.
+
+    Счетчик ссылок увеличивается одним запросом INSERT ... ON CONFLICT
+    DO UPDATE. Если файла с таким содержимым еще нет, временный файл
+    переименовывается в путь медиафайла, иначе удаляется без записи
+    на диск. Так же переименовываются или удаляются временные файлы
+    уже созданных вариантов изображения. При ошибке запроса временные
+    файлы удаляются.
+
+    Если строка media_blobs вставлена этим запросом, при откате транзакции
+    медиафайл и его варианты удаляются до того, как откат снимет блокировку
+    строки: иначе файл остался бы вне UPLOAD_TMP_DIR без строки media_blobs,
+    и его не нашли бы ни фоновое удаление, ни сборщик медиафайлов.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param temp_path: Путь временного файла с загруженным содержимым.
+    :param sha256: SHA-256 содержимого в шестнадцатеричном виде.
+    :param size: Размер файла в байтах.
+    :param extension: Расширение загруженного файла.
+    :param temp_variants: Путь временного файла варианта изображения
+        по имени варианта.
+    :return: Путь медиафайла на сервере.
+    """
+    temp_variants = temp_variants or {}
+    stmt = (
+        insert(MediaBlob)
+        .values(
+            sha256=sha256,
+            file_path=blob_path(sha256, extension),
+            size=size,
+            ref_count=1,
+        )
+        .on_conflict_do_update(
+            index_elements=[MediaBlob.sha256],
+            set_={"ref_count": MediaBlob.ref_count + 1},
+        )
+        # xmax = 0 только у строки, вставленной этим запросом
+        .returning(
+            MediaBlob.file_path,
+            literal_column("xmax = 0", Boolean).label("inserted"),
+        )
+    )
+    try:
+        result = await session.execute(stmt)
+        file_path, inserted = result.one()
+    except BaseException:
+        for path in (temp_path, *temp_variants.values()):
+            with suppress(FileNotFoundError):
+                await aiofiles.os.remove(path)
+        raise
+
+    if inserted:
+        connection = await session.connection()
+        event.listen(
+            connection.sync_connection,
+            "rollback",
+            lambda _: remove_blob_files(file_path),
+        )
+
+    if inserted or not await aiofiles.os.path.exists(file_path):
+        await aiofiles.os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        await aiofiles.os.replace(temp_path, file_path)
+        metrics.inc("media_blobs_created_total")
+    else:
+        await aiofiles.os.remove(temp_path)
+        metrics.inc("media_dedup_hits_total")
+        logger.info(f"Upload deduplicated to {file_path}")
+
+    for name, temp_variant in temp_variants.items():
+        path = variant_path(file_path, name)
+        if await aiofiles.os.path.exists(path):
+            await aiofiles.os.remove(temp_variant)
+        else:
+            await aiofiles.os.replace(temp_variant, path)
+
+    return file_path
+
+
+async def release_blobs(
+    session: AsyncSession, sha256s: Sequence[str]
+) -> List[Tuple[str, str]]:
+    """
+    Удаляет ссылки на медиафайлы и отстраняет файлы без ссылок.
+
+    Счетчики ссылок уменьшаются на количество удаленных записей medias,
+    строки media_blobs с нулевым счетчиком удаляются. Файлы таких строк
+    и их варианты переименовываются, пока строки заблокированы транзакцией, чтобы
+    загрузка того же содержимого после фиксации записала новый файл,
+    а не получила файл, поставленный в очередь на удаление.
+
+    :param session: Асинхронная сессия SQLAlchemy.
+    :param sha256s: SHA-256 удаленных записей medias (с повторами).
+    :return: Пары (путь медиафайла, путь переименованного файла)
+        для файлов, на которые не осталось ссылок.
+    """
+    counts = Counter(sha256s)
+    shas_by_count = {}
+    for sha256, count in counts.items():
+        shas_by_count.setdefault(count, []).append(sha256)
+
+    for count, shas in shas_by_count.items():
+        await session.execute(
+            update(MediaBlob)
+            .where(MediaBlob.sha256.in_(shas))
+            .values(ref_count=MediaBlob.ref_count - count)
+        )
+
+    result = await session.execute(
+        delete(MediaBlob)
+        .where(MediaBlob.sha256.in_(counts), MediaBlob.ref_count <= 0)
+        .returning(MediaBlob.file_path)
+    )
+
+    moved = []
+    for file_path in result.scalars().all():
+        for path in (file_path, *(variant_path(file_path, name) for name in VARIANTS)):
+            trash_path = f"{path}.{uuid4().hex}.deleted"
+            with suppress(FileNotFoundError):
+                await aiofiles.os.rename(path, trash_path)
+                moved.append((path, trash_path))
+
+    return moved
+
+
+async def restore_blobs(moved: Sequence[Tuple[str, str]]) -> None:
+    """
+    Возвращает на место файлы, отстраненные release_blobs,
+    если транзакция удаления не была зафиксирована.
+
+    :param moved: Пары (путь медиафайла, путь переименованного файла).
+    """
+    for file_path, trash_path in moved:
+        with suppress(FileNotFoundError):
+            await aiofiles.os.rename(trash_path, file_path)
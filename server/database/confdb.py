@@ -2,23 +2,195 @@
 Модуль конфигурации SQLAlchemy.
 """
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+import asyncio
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import (
+    create_async_engine,
+    async_sessionmaker,
+    AsyncEngine,
+    AsyncSession,
+)
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base
 
-from server.database.getter_variables import DB_PASSWORD, DB_NAME, DB_USER, DB_HOST
+from server.database.getter_variables import (
+    DB_PASSWORD,
+    DB_NAME,
+    DB_USER,
+    DB_HOST,
+    DB_PORT,
+    DB_REPLICA_HOST,
+    DB_REPLICA_PORT,
+    DB_REPLICA_USER,
+    DB_REPLICA_PASSWORD,
+    DB_REPLICA_NAME,
+    READ_YOUR_WRITES_WINDOW,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_PREPARED_STATEMENT_CACHE_SIZE,
+)
 
 
 # Синхронный движок для Alembic
-sync_url = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
+sync_url = (
+    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
 engine = create_engine(sync_url)
 
+
+def make_async_engine(url: str) -> AsyncEngine:
+    """
+    Создает асинхронный движок с настройками пула из переменных окружения.
+
+    :param url: URL базы данных.
+    :return: Асинхронный движок SQLAlchemy.
+    """
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            # Кэш подготовленных выражений asyncpg на соединение
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            # Кэш подготовленных выражений диалекта SQLAlchemy на соединение
+            "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+        },
+    )
+
+
 # Асинхронный движок для приложения
-async_url = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
-async_engine = create_async_engine(async_url)
+async_url = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+async_engine = make_async_engine(async_url)
+
+# Асинхронный движок реплики для чтения (основной, если реплика не настроена)
+if DB_REPLICA_HOST:
+    replica_url = (
+        f"postgresql+asyncpg://{DB_REPLICA_USER}:{DB_REPLICA_PASSWORD}"
+        f"@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_REPLICA_NAME}"
+    )
+    replica_engine = make_async_engine(replica_url)
+else:
+    replica_engine = async_engine
 
 Session = async_sessionmaker(
     bind=async_engine, class_=AsyncSession, expire_on_commit=False
 )
-session = Session()
+ReplicaSession = async_sessionmaker(
+    bind=replica_engine, class_=AsyncSession, expire_on_commit=False
+)
 Base = declarative_base()
+
+# Методы запросов, обработчики которых только читают данные
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+
+class ReadYourWrites:
+    """
+    Реестр недавно писавших клиентов.
+
+    После успешной записи чтения клиента в течение окна window
+    выполняются на основной базе, чтобы клиент видел свои изменения
+    независимо от отставания реплики. Клиент определяется по API-ключу.
+    Реестр хранится в памяти процесса.
+
+    Атрибуты:
+        window (float): Длительность окна в секундах.
+        writers (OrderedDict): Время окончания окна по API-ключам
+            в порядке последней записи.
+    """
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self.writers: OrderedDict[str, float] = OrderedDict()
+
+    def mark(self, api_key: str) -> None:
+        """
+        Отмечает запись клиента и удаляет истекшие отметки.
+
+        :param api_key: API-ключ клиента.
+        """
+        now = time.monotonic()
+        self.writers[api_key] = now + self.window
+        self.writers.move_to_end(api_key)
+        while self.writers and next(iter(self.writers.values())) <= now:
+            self.writers.popitem(last=False)
+
+    def is_sticky(self, api_key: Optional[str]) -> bool:
+        """
+        Проверяет, должен ли клиент читать с основной базы.
+
+        :param api_key: API-ключ клиента.
+        :return: True, если клиент писал в течение последнего окна.
+        """
+        expires_at = self.writers.get(api_key)
+        return expires_at is not None and expires_at > time.monotonic()
+
+
+read_your_writes = ReadYourWrites(window=READ_YOUR_WRITES_WINDOW)
+
+
+async def get_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    Зависимость FastAPI, выдающая каждому запросу собственную сессию.
+
+    Запросы на чтение (GET, HEAD) получают сессию реплики, если клиент
+    не выполнял запись в течение READ_YOUR_WRITES_WINDOW секунд,
+    остальные запросы - сессию основной базы.
+
+    Транзакция сессии фиксируется после успешного выполнения обработчика
+    и откатывается, если обработчик завершился исключением (в том числе
+    HTTPException). Сессия закрывается по завершении запроса, поэтому
+    ее карта идентичности не переживает запрос.
+
+    :param request: Текущий запрос.
+    :return: Асинхронная сессия SQLAlchemy текущего запроса.
+    """
+    api_key = request.headers.get("api-key")
+    read_only = request.method in READ_ONLY_METHODS
+    use_replica = read_only and not read_your_writes.is_sticky(api_key)
+
+    async with (ReplicaSession if use_replica else Session)() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+    if not read_only and api_key:
+        read_your_writes.mark(api_key)
+
+
+async def warm_up_pool() -> None:
+    """
+    Открывает DB_POOL_SIZE соединений пула основной базы и реплики,
+    чтобы первые запросы после запуска приложения не тратили время
+    на их установку.
+    """
+    engines = {async_engine, replica_engine}
+    connections = await asyncio.gather(
+        *(engine.connect() for engine in engines for _ in range(DB_POOL_SIZE))
+    )
+    await asyncio.gather(*(connection.close() for connection in connections))
+
+
+async def dispose_engines() -> None:
+    """
+    Закрывает все соединения пулов основной базы и реплики.
+    """
+    await asyncio.gather(
+        *(engine.dispose() for engine in {async_engine, replica_engine})
+    )
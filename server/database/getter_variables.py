@@ -13,3 +13,53 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+
+# Реплика для чтения. Если DB_REPLICA_HOST не задан, чтение идет с основной базы.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_PORT = int(os.getenv("DB_REPLICA_PORT", DB_PORT))
+DB_REPLICA_USER = os.getenv("DB_REPLICA_USER", DB_USER)
+DB_REPLICA_PASSWORD = os.getenv("DB_REPLICA_PASSWORD", DB_PASSWORD)
+DB_REPLICA_NAME = os.getenv("DB_REPLICA_NAME", DB_NAME)
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", 5))
+
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", 20))
+FEED_MAX_PAGE_SIZE = int(os.getenv("FEED_MAX_PAGE_SIZE", 100))
+TIMELINE_BACKFILL_SIZE = int(os.getenv("TIMELINE_BACKFILL_SIZE", 50))
+CELEBRITY_FOLLOWERS_THRESHOLD = int(os.getenv("CELEBRITY_FOLLOWERS_THRESHOLD", 10000))
+LIKES_PAGE_SIZE = int(os.getenv("LIKES_PAGE_SIZE", 50))
+FOLLOWS_PAGE_SIZE = int(os.getenv("FOLLOWS_PAGE_SIZE", 50))
+FEED_STREAM_BATCH_SIZE = int(os.getenv("FEED_STREAM_BATCH_SIZE", 50))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+    os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 100)
+)
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_NEGATIVE_TTL = float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", 5))
+
+MEDIA_DELETE_WORKERS = int(os.getenv("MEDIA_DELETE_WORKERS", 4))
+MEDIA_DELETE_BATCH_SIZE = int(os.getenv("MEDIA_DELETE_BATCH_SIZE", 100))
+MEDIA_DELETE_RETRIES = int(os.getenv("MEDIA_DELETE_RETRIES", 3))
+MEDIA_DELETE_RETRY_DELAY = float(os.getenv("MEDIA_DELETE_RETRY_DELAY", 0.5))
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "server/medias")
+MEDIA_MAX_SIZE = int(os.getenv("MEDIA_MAX_SIZE", 10 * 1024 * 1024))
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", 64 * 1024))
+
+MEDIA_IMAGE_WORKERS = int(os.getenv("MEDIA_IMAGE_WORKERS", 2))
+MEDIA_THUMBNAIL_SIZE = int(os.getenv("MEDIA_THUMBNAIL_SIZE", 320))
+MEDIA_PREVIEW_SIZE = int(os.getenv("MEDIA_PREVIEW_SIZE", 1280))
+MEDIA_WEBP_QUALITY = int(os.getenv("MEDIA_WEBP_QUALITY", 80))
+
+MEDIA_GC_INTERVAL = float(os.getenv("MEDIA_GC_INTERVAL", 3600))
+MEDIA_GC_GRACE_PERIOD = float(os.getenv("MEDIA_GC_GRACE_PERIOD", 24 * 3600))
+MEDIA_GC_BATCH_SIZE = int(os.getenv("MEDIA_GC_BATCH_SIZE", 500))
+MEDIA_GC_CONCURRENCY = int(os.getenv("MEDIA_GC_CONCURRENCY", 8))
@@ -0,0 +1,66 @@
+"""add like and follow counters
+
+Revision ID: 005a63cf82ea
+Revises: 64df75672d29
+Create Date: 2026-10-18 03:38:34.618468
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "005a63cf82ea"
+down_revision: Union[str, None] = "64df75672d29"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tweets",
+        sa.Column("like_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "users",
+        sa.Column("followers_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "users",
+        sa.Column("following_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+    op.execute(
+        """
+        UPDATE tweets SET like_count = counts.total
+        FROM (SELECT tweet_id, count(*) AS total FROM likes GROUP BY tweet_id) AS counts
+        WHERE tweets.id = counts.tweet_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE users SET followers_count = counts.total
+        FROM (
+            SELECT following_id, count(*) AS total FROM follows GROUP BY following_id
+        ) AS counts
+        WHERE users.id = counts.following_id
+        """
+    )
+    op.execute(
+        """
+        UPDATE users SET following_count = counts.total
+        FROM (
+            SELECT follower_id, count(*) AS total FROM follows GROUP BY follower_id
+        ) AS counts
+        WHERE users.id = counts.follower_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "following_count")
+    op.drop_column("users", "followers_count")
+    op.drop_column("tweets", "like_count")
@@ -0,0 +1,43 @@
+"""add media blobs
+
+Revision ID: 3c9e1f7d2a56
+Revises: 691f6f6b4a49
+Create Date: 2026-10-18 05:41:37.902114
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c9e1f7d2a56"
+down_revision: Union[str, None] = "691f6f6b4a49"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_blobs",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+    # Существующие медиафайлы остаются без SHA-256 и удаляются по пути.
+    op.add_column("medias", sa.Column("sha256", sa.String(length=64), nullable=True))
+    op.create_foreign_key(
+        "medias_sha256_fkey", "medias", "media_blobs", ["sha256"], ["sha256"]
+    )
+    op.create_index("ix_medias_sha256", "medias", ["sha256"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_medias_sha256", table_name="medias")
+    op.drop_constraint("medias_sha256_fkey", "medias", type_="foreignkey")
+    op.drop_column("medias", "sha256")
+    op.drop_table("media_blobs")
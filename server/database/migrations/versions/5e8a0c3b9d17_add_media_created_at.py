@@ -0,0 +1,55 @@
+"""add media created at
+
+Revision ID: 5e8a0c3b9d17
+Revises: b7d42e9a1f03
+Create Date: 2026-10-18 07:03:48.526091
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5e8a0c3b9d17"
+down_revision: Union[str, None] = "b7d42e9a1f03"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Существующие медиафайлы получают время применения миграции
+    # и удаляются сборщиком не раньше, чем через период ожидания.
+    op.add_column(
+        "medias",
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+
+    # CREATE INDEX CONCURRENTLY не может выполняться внутри транзакции.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_medias_unattached_created_at",
+            "medias",
+            ["created_at", "id"],
+            postgresql_where=sa.text("tweet_id IS NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_medias_unattached_created_at",
+            table_name="medias",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("medias", "created_at")
@@ -0,0 +1,53 @@
+"""add timelines
+
+Revision ID: 64df75672d29
+Revises: 99463321795c
+Create Date: 2026-10-18 03:33:59.213273
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "64df75672d29"
+down_revision: Union[str, None] = "99463321795c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "timelines",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["author_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "tweet_id"),
+    )
+    op.create_index(
+        "ix_timelines_user_id_author_id", "timelines", ["user_id", "author_id"]
+    )
+
+    # Заполнение лент уже опубликованными твитами: свои твиты и твиты подписок.
+    op.execute(
+        """
+        INSERT INTO timelines (user_id, tweet_id, author_id)
+        SELECT tweets.author_id, tweets.id, tweets.author_id
+        FROM tweets
+        UNION
+        SELECT follows.follower_id, tweets.id, tweets.author_id
+        FROM follows
+        JOIN tweets ON tweets.author_id = follows.following_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_timelines_user_id_author_id", table_name="timelines")
+    op.drop_table("timelines")
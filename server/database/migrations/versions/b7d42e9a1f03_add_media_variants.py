@@ -0,0 +1,41 @@
+"""add media variants
+
+Revision ID: b7d42e9a1f03
+Revises: 3c9e1f7d2a56
+Create Date: 2026-10-18 06:27:05.114820
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b7d42e9a1f03"
+down_revision: Union[str, None] = "3c9e1f7d2a56"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COLUMNS = (
+    ("width", sa.Integer()),
+    ("height", sa.Integer()),
+    ("thumbnail_url", sa.String()),
+    ("thumbnail_width", sa.Integer()),
+    ("thumbnail_height", sa.Integer()),
+    ("preview_url", sa.String()),
+    ("preview_width", sa.Integer()),
+    ("preview_height", sa.Integer()),
+)
+
+
+def upgrade() -> None:
+    for name, type_ in COLUMNS:
+        op.add_column("medias", sa.Column(name, type_, nullable=True))
+
+
+def downgrade() -> None:
+    for name, _ in reversed(COLUMNS):
+        op.drop_column("medias", name)
@@ -0,0 +1,90 @@
+"""add performance indexes
+
+Revision ID: e443bc7a2183
+Revises: 005a63cf82ea
+Create Date: 2026-10-18 04:12:47.305118
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e443bc7a2183"
+down_revision: Union[str, None] = "005a63cf82ea"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Имя индекса, таблица и колонки
+INDEXES = (
+    ("ix_tweets_author_id_id", "tweets", ["author_id", "id"]),
+    ("ix_likes_tweet_id_id", "likes", ["tweet_id", "id"]),
+    ("ix_medias_tweet_id", "medias", ["tweet_id"]),
+    ("ix_follows_following_id_follower_id", "follows", ["following_id", "follower_id"]),
+    ("ix_timelines_tweet_id", "timelines", ["tweet_id"]),
+)
+
+
+def upgrade() -> None:
+    # Повторные лайки одного пользователя удаляются до создания
+    # уникального индекса, счетчики лайков уменьшаются на их количество.
+    op.execute(
+        """
+        WITH duplicates AS (
+            DELETE FROM likes
+            USING likes AS first_likes
+            WHERE likes.user_id = first_likes.user_id
+              AND likes.tweet_id = first_likes.tweet_id
+              AND likes.id > first_likes.id
+            RETURNING likes.id, likes.tweet_id
+        ),
+        counts AS (
+            SELECT tweet_id, count(DISTINCT id) AS total
+            FROM duplicates
+            GROUP BY tweet_id
+        )
+        UPDATE tweets SET like_count = tweets.like_count - counts.total
+        FROM counts
+        WHERE tweets.id = counts.tweet_id
+        """
+    )
+
+    # CREATE INDEX CONCURRENTLY не может выполняться внутри транзакции.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_likes_user_id_tweet_id",
+            "likes",
+            ["user_id", "tweet_id"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+        op.drop_index(
+            "ix_likes_user_id_tweet_id",
+            table_name="likes",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -2,7 +2,17 @@
 Модуль моделей базы данных.
 """
 
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Integer,
+    String,
+    ForeignKey,
+    Index,
+    func,
+    text,
+)
 from sqlalchemy.orm import relationship
 
 from server.database.confdb import Base
@@ -18,6 +28,9 @@ class Follow(Base):
     """
 
     __tablename__ = "follows"
+    __table_args__ = (
+        Index("ix_follows_following_id_follower_id", "following_id", "follower_id"),
+    )
 
     follower_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     following_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
@@ -31,6 +44,8 @@ class User(Base):
         id (int): Уникальный идентификатор пользователя.
         apikey (str): Уникальный API-ключ пользователя.
         name (str): Имя пользователя, ограниченное 50 символами.
+        followers_count (int): Количество подписчиков пользователя.
+        following_count (int): Количество подписок пользователя.
 
     Связи:
         tweets (list[Tweet]): Список твитов, созданных пользователем.
@@ -44,6 +59,8 @@ class User(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     apikey = Column(String, unique=True, nullable=False)
     name = Column(String(50), nullable=False)
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     tweets = relationship("Tweet", back_populates="author")
     likes = relationship("Like", back_populates="user")
@@ -64,6 +81,7 @@ class Tweet(Base):
         id (int): Уникальный идентификатор твита.
         author_id (int): Уникальный идентификатор автора твита.
         content (str): Текст содержащийся в твите.
+        like_count (int): Количество лайков твита.
 
     Связи:
         author (User): Модель автора твита.
@@ -72,14 +90,26 @@ class Tweet(Base):
     """
 
     __tablename__ = "tweets"
+    __table_args__ = (Index("ix_tweets_author_id_id", "author_id", "id"),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(String(280), nullable=False)
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     author = relationship("User", back_populates="tweets")
-    likes = relationship("Like", back_populates="tweet", cascade="all, delete-orphan")
-    media = relationship("Media", back_populates="tweet", cascade="all, delete-orphan")
+    likes = relationship(
+        "Like",
+        back_populates="tweet",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    media = relationship(
+        "Media",
+        back_populates="tweet",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
 
 class Like(Base):
@@ -97,15 +127,41 @@ class Like(Base):
     """
 
     __tablename__ = "likes"
+    __table_args__ = (
+        Index("ix_likes_user_id_tweet_id", "user_id", "tweet_id", unique=True),
+        Index("ix_likes_tweet_id_id", "tweet_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    tweet_id = Column(Integer, ForeignKey("tweets.id"))
+    tweet_id = Column(Integer, ForeignKey("tweets.id", ondelete="CASCADE"))
 
     user = relationship("User", back_populates="likes")
     tweet = relationship("Tweet", back_populates="likes")
 
 
+class MediaBlob(Base):
+    """
+    Модель медиафайла на диске, хранящегося по содержимому.
+
+    Один файл может использоваться несколькими записями medias
+    с одинаковым содержимым, ref_count хранит их количество.
+
+    Атрибуты:
+        sha256 (str): SHA-256 содержимого файла.
+        file_path (str): Путь к файлу на сервере.
+        size (int): Размер файла в байтах.
+        ref_count (int): Количество записей medias, ссылающихся на файл.
+    """
+
+    __tablename__ = "media_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    file_path = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
 class Media(Base):
     """
     Модель медиафайла, связанного с твитом.
@@ -115,15 +171,105 @@ class Media(Base):
         file_path (str): Путь к файлу на сервере.
         file_url (str): URL-адрес для доступа к файлу.
         tweet_id (int): Идентификатор твита, с которым связан медиафайл.
+        sha256 (str): SHA-256 содержимого файла (None у файлов,
+            загруженных до хранения по содержимому).
+        width (int): Ширина изображения (None, если файл не изображение).
+        height (int): Высота изображения.
+        thumbnail_url (str): URL-адрес миниатюры в формате WebP.
+        thumbnail_width (int): Ширина миниатюры.
+        thumbnail_height (int): Высота миниатюры.
+        preview_url (str): URL-адрес превью в формате WebP.
+        preview_width (int): Ширина превью.
+        preview_height (int): Высота превью.
+        created_at (datetime): Время загрузки медиафайла.
 
     Связи:
         tweet (Tweet): Твит, к которому относится медиафайл.
     """
 
     __tablename__ = "medias"
+    __table_args__ = (
+        Index("ix_medias_tweet_id", "tweet_id"),
+        Index("ix_medias_sha256", "sha256"),
+        Index(
+            "ix_medias_unattached_created_at",
+            "created_at",
+            "id",
+            postgresql_where=text("tweet_id IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     file_path = Column(String, nullable=False)
     file_url = Column(String, nullable=False)
-    tweet_id = Column(Integer, ForeignKey("tweets.id"))
+    tweet_id = Column(Integer, ForeignKey("tweets.id", ondelete="CASCADE"))
+    sha256 = Column(String(64), ForeignKey("media_blobs.sha256"))
+    width = Column(Integer)
+    height = Column(Integer)
+    thumbnail_url = Column(String)
+    thumbnail_width = Column(Integer)
+    thumbnail_height = Column(Integer)
+    preview_url = Column(String)
+    preview_width = Column(Integer)
+    preview_height = Column(Integer)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
     tweet = relationship("Tweet", back_populates="media")
+
+
+class Timeline(Base):
+    """
+    Модель домашней ленты пользователя.
+
+    Лента заполняется в момент публикации твита: ссылка на твит
+    добавляется в ленту автора и в ленты всех его подписчиков.
+    Чтение ленты сводится к диапазонному сканированию первичного ключа.
+
+    Атрибуты:
+        user_id (int): Идентификатор владельца ленты.
+        tweet_id (int): Идентификатор твита в ленте.
+        author_id (int): Идентификатор автора твита.
+    """
+
+    __tablename__ = "timelines"
+    __table_args__ = (
+        Index("ix_timelines_user_id_author_id", "user_id", "author_id"),
+        Index("ix_timelines_tweet_id", "tweet_id"),
+    )
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    tweet_id = Column(
+        Integer, ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+    author_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+
+
+class MediaDeletionFailure(Base):
+    """
+    Модель медиафайла, который не удалось удалить с сервера.
+
+    Записи добавляются фоновым удалением медиафайлов после исчерпания
+    повторных попыток и используются для повторного удаления файлов.
+
+    Атрибуты:
+        id (int): Уникальный идентификатор записи.
+        file_path (str): Путь к файлу на сервере.
+        error (str): Текст последней ошибки удаления.
+        attempts (int): Количество выполненных попыток удаления.
+        failed_at (datetime): Время последней неудачной попытки.
+    """
+
+    __tablename__ = "media_deletion_failures"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_path = Column(String, nullable=False)
+    error = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False)
+    failed_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
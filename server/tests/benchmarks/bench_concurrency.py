@@ -0,0 +1,135 @@
+"""
+Бенчмарк пропускной способности API при параллельных клиентах.
+
+Запросы отправляются в приложение через httpx.ASGITransport (без сетевого
+сервера) заданным числом параллельных клиентов. Для каждого уровня
+параллельности выводится количество запросов в секунду и медиана задержки.
+Каждый запрос выполняется в собственной сессии (get_session), поэтому
+пропускная способность должна расти с числом клиентов вплоть до размера
+пула соединений.
+
+Бенчмарк создает собственного пользователя с твитами и удаляет его
+по завершении, запускать его следует на тестовой базе данных:
+
+    python -m server.tests.benchmarks.bench_concurrency --requests 400
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Tuple
+
+import httpx
+from sqlalchemy import text
+
+from server.app.main import app
+from server.database.confdb import engine
+
+
+def seed(tweets: int) -> Tuple[int, str]:
+    """
+    Создает пользователя и его твиты в ленте.
+
+    :return: ID и API-ключ пользователя.
+    """
+    with engine.begin() as connection:
+        user_id, apikey = connection.execute(
+            text(
+                "INSERT INTO users (apikey, name) "
+                "VALUES ('bench-' || md5(random()::text), 'bench user') "
+                "RETURNING id, apikey"
+            )
+        ).one()
+        connection.execute(
+            text(
+                "WITH new_tweets AS ("
+                "INSERT INTO tweets (author_id, content) "
+                "SELECT :user_id, 'bench tweet ' || g "
+                "FROM generate_series(1, :tweets) g RETURNING id) "
+                "INSERT INTO timelines (user_id, tweet_id, author_id) "
+                "SELECT :user_id, id, :user_id FROM new_tweets"
+            ),
+            {"user_id": user_id, "tweets": tweets},
+        )
+
+    return user_id, apikey
+
+
+def cleanup(user_id: int) -> None:
+    """
+    Удаляет данные, созданные бенчмарком.
+    """
+    with engine.begin() as connection:
+        params = {"user_id": user_id}
+        connection.execute(
+            text("DELETE FROM timelines WHERE user_id = :user_id"), params
+        )
+        connection.execute(
+            text("DELETE FROM tweets WHERE author_id = :user_id"), params
+        )
+        connection.execute(text("DELETE FROM users WHERE id = :user_id"), params)
+
+
+async def measure(
+    url: str, apikey: str, clients: int, requests: int
+) -> Tuple[float, float]:
+    """
+    Отправляет requests запросов GET url силами clients параллельных клиентов.
+
+    :return: Количество запросов в секунду и медиана задержки в миллисекундах.
+    """
+    timings: List[float] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(url, headers={"api-key": apikey})
+            response.raise_for_status()
+            timings.append((time.perf_counter() - started) * 1000)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return requests / elapsed, statistics.median(timings)
+
+
+async def run(apikey: str, clients: List[int], requests: int) -> None:
+    """
+    Запускает измерения и выводит таблицу результатов.
+    """
+    print(f"{'url':<16}{'clients':>8}{'req/s':>12}{'p50, ms':>12}")
+    for url in ("/api/users/me", "/api/tweets/"):
+        for count in clients:
+            per_second, p50 = await measure(url, apikey, count, requests)
+            print(f"{url:<16}{count:>8}{per_second:>12.1f}{p50:>12.2f}")
+
+
+def main() -> None:
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tweets", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    user_id, apikey = seed(args.tweets)
+    try:
+        asyncio.run(run(apikey, args.clients, args.requests))
+    finally:
+        cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Бенчмарк сериализации ответов API.
+
+Сравнивает два способа сериализации страницы ленты твитов и профиля пользователя:
+    json: вложенные словари и JSONResponse (стандартный json.dumps);
+    msgspec: структуры server.app.schemas и MsgspecJSONResponse.
+
+Для каждого способа выводится количество сериализованных ответов в секунду
+и пропускная способность в МБ/с. Время включает построение структуры ответа
+из объектов твитов, поэтому база данных для запуска не требуется:
+
+    python -m server.tests.benchmarks.bench_encoding --tweets 100 --likes 50
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Awaitable, Callable, List, Tuple
+
+from fastapi.responses import JSONResponse
+
+from server.app.responses import MsgspecJSONResponse
+from server.app.routes.utils import json_about_user, make_tweet_feed
+
+
+def make_tweets(tweets: int, likes: int, media: int) -> List[SimpleNamespace]:
+    """
+    Создает объекты с атрибутами твитов, достаточными для make_tweet_feed.
+    """
+    users = [SimpleNamespace(id=i, name=f"Пользователь {i}") for i in range(likes + 1)]
+    return [
+        SimpleNamespace(
+            id=i,
+            content=f"Текст твита {i} " * 10,
+            media=[
+                SimpleNamespace(
+                    file_url=f"http://127.0.0.1/medias/{i}/{j}.jpg",
+                    preview_url=f"http://127.0.0.1/medias/{i}/{j}.preview.webp",
+                    thumbnail_url=f"http://127.0.0.1/medias/{i}/{j}.thumbnail.webp",
+                )
+                for j in range(media)
+            ],
+            author=users[0],
+            like_count=likes,
+            likes=[SimpleNamespace(user_id=user.id, user=user) for user in users[1:]],
+        )
+        for i in range(tweets)
+    ]
+
+
+def make_user(follows: int) -> SimpleNamespace:
+    """
+    Создает объект с атрибутами пользователя, достаточными для json_about_user.
+    """
+    users = [SimpleNamespace(id=i, name=f"Пользователь {i}") for i in range(follows)]
+    return SimpleNamespace(
+        id=0,
+        name="Пользователь",
+        followers_count=follows,
+        following_count=follows,
+        followers=users,
+        following=users,
+    )
+
+
+def feed_dict(tweets: List[SimpleNamespace]) -> dict:
+    """
+    Лента в виде вложенных словарей (прежний формат make_tweet_feed).
+    """
+    return {
+        "result": True,
+        "tweets": [
+            {
+                "id": tweet.id,
+                "content": tweet.content,
+                "attachments": [media.preview_url for media in tweet.media],
+                "thumbnails": [media.thumbnail_url for media in tweet.media],
+                "author": {"id": tweet.author.id, "name": tweet.author.name},
+                "like_count": tweet.like_count,
+                "likes": [
+                    {"user_id": like.user_id, "name": like.user.name}
+                    for like in tweet.likes
+                ],
+            }
+            for tweet in tweets
+        ],
+        "next_cursor": None,
+    }
+
+
+def user_dict(user: SimpleNamespace) -> dict:
+    """
+    Профиль в виде вложенных словарей (прежний формат json_about_user).
+    """
+    return {
+        "result": True,
+        "user": {
+            "id": user.id,
+            "name": user.name,
+            "followers_count": user.followers_count,
+            "following_count": user.following_count,
+            "followers": [{"id": f.id, "name": f.name} for f in user.followers],
+            "following": [{"id": f.id, "name": f.name} for f in user.following],
+        },
+    }
+
+
+async def measure(
+    encode: Callable[[], Awaitable[bytes]], runs: int
+) -> Tuple[float, float]:
+    """
+    Измеряет пропускную способность сериализации.
+
+    :return: Количество ответов в секунду и МБ/с.
+    """
+    size = len(await encode())
+    started = time.perf_counter()
+    for _ in range(runs):
+        await encode()
+    elapsed = time.perf_counter() - started
+
+    return runs / elapsed, size * runs / elapsed / 1024 / 1024
+
+
+async def run(tweets: int, likes: int, media: int, follows: int, runs: int) -> None:
+    """
+    Запускает измерения и выводит таблицу результатов.
+    """
+    tweet_objects = make_tweets(tweets, likes, media)
+    user_object = make_user(follows)
+
+    async def json_feed() -> bytes:
+        return JSONResponse(feed_dict(tweet_objects)).body
+
+    async def msgspec_feed() -> bytes:
+        return MsgspecJSONResponse(await make_tweet_feed(tweets=tweet_objects)).body
+
+    async def json_user() -> bytes:
+        return JSONResponse(user_dict(user_object)).body
+
+    async def msgspec_user() -> bytes:
+        return MsgspecJSONResponse(await json_about_user(user_object)).body
+
+    print(f"{'payload':<10}{'encoder':<10}{'resp/s':>12}{'MB/s':>12}")
+    for payload, encoder, encode in (
+        ("feed", "json", json_feed),
+        ("feed", "msgspec", msgspec_feed),
+        ("user", "json", json_user),
+        ("user", "msgspec", msgspec_user),
+    ):
+        per_second, megabytes = await measure(encode, runs)
+        print(f"{payload:<10}{encoder:<10}{per_second:>12.1f}{megabytes:>12.1f}")
+
+
+def main() -> None:
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tweets", type=int, default=100, help="твитов в ленте")
+    parser.add_argument("--likes", type=int, default=50, help="лайков на твит")
+    parser.add_argument("--media", type=int, default=4, help="медиа на твит")
+    parser.add_argument("--follows", type=int, default=500, help="подписок")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.tweets, args.likes, args.media, args.follows, args.runs))
+
+
+if __name__ == "__main__":
+    main()
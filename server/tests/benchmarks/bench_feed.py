@@ -0,0 +1,259 @@
+"""
+Бенчмарк способов формирования ленты твитов.
+
+Сравнивает три способа получения одной страницы ленты:
+    joinedload: загрузка через joinedload лайков и медиа (декартово произведение);
+    orm: текущий ORM-путь (get_timeline_page + make_tweet_feed);
+    database: сборка JSON на стороне PostgreSQL (render_tweet_feed_json).
+
+Для каждого способа выводится количество строк, переданных из базы
+данных, и задержка (медиана и 95-й перцентиль).
+
+Бенчмарк создает собственные данные и удаляет их по завершении,
+запускать его следует на тестовой базе данных:
+
+    python -m server.tests.benchmarks.bench_feed --tweets 200 --likes 50 --media 4
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Callable, Awaitable, List, Optional, Sequence, Tuple
+
+import msgspec
+from sqlalchemy import select, text
+from sqlalchemy.orm import joinedload
+
+from server.app.routes.utils import (
+    get_timeline_page,
+    get_timeline_tweet_ids,
+    make_tweet_feed,
+    render_tweet_feed_json,
+)
+from server.database.confdb import Session, engine
+from server.database.models import Tweet, Like
+
+
+def seed(users: int, tweets: int, likes: int, media: int) -> Tuple[int, List[int]]:
+    """
+    Создает пользователей, твиты, лайки, медиа и ленту читателя.
+
+    :return: ID читателя ленты и ID созданных пользователей.
+    """
+    with engine.begin() as connection:
+        user_ids = (
+            connection.execute(
+                text(
+                    "INSERT INTO users (apikey, name) "
+                    "SELECT 'bench-' || g || '-' || md5(random()::text), "
+                    "'bench user ' || g FROM generate_series(1, :users) g "
+                    "RETURNING id"
+                ),
+                {"users": users},
+            )
+            .scalars()
+            .all()
+        )
+        tweet_ids = (
+            connection.execute(
+                text(
+                    "INSERT INTO tweets (author_id, content) "
+                    "SELECT (CAST(:user_ids AS integer[]))"
+                    "[1 + g % cardinality(CAST(:user_ids AS integer[]))], "
+                    "'bench tweet ' || g FROM generate_series(1, :tweets) g "
+                    "RETURNING id"
+                ),
+                {"user_ids": user_ids, "tweets": tweets},
+            )
+            .scalars()
+            .all()
+        )
+        connection.execute(
+            text(
+                "INSERT INTO likes (user_id, tweet_id) "
+                "SELECT u, t FROM unnest(CAST(:tweet_ids AS integer[])) t, "
+                "unnest((CAST(:user_ids AS integer[]))[1:(:likes)]) u"
+            ),
+            {"tweet_ids": tweet_ids, "user_ids": user_ids, "likes": likes},
+        )
+        connection.execute(
+            text(
+                "INSERT INTO medias (file_path, file_url, tweet_id) "
+                "SELECT 'bench', 'http://127.0.0.1/medias/bench/' || t || '-' || g, t "
+                "FROM unnest(CAST(:tweet_ids AS integer[])) t, "
+                "generate_series(1, :media) g"
+            ),
+            {"tweet_ids": tweet_ids, "media": media},
+        )
+        connection.execute(
+            text(
+                "INSERT INTO timelines (user_id, tweet_id, author_id) "
+                "SELECT :reader, id, author_id FROM tweets "
+                "WHERE id = ANY(CAST(:tweet_ids AS integer[]))"
+            ),
+            {"reader": user_ids[0], "tweet_ids": tweet_ids},
+        )
+
+    return user_ids[0], user_ids
+
+
+def cleanup(user_ids: List[int]) -> None:
+    """
+    Удаляет данные, созданные бенчмарком.
+    """
+    with engine.begin() as connection:
+        params = {"user_ids": user_ids}
+        for table in ("likes", "medias", "timelines"):
+            connection.execute(
+                text(
+                    f"DELETE FROM {table} WHERE tweet_id IN (SELECT id FROM tweets "
+                    "WHERE author_id = ANY(CAST(:user_ids AS integer[])))"
+                ),
+                params,
+            )
+        connection.execute(
+            text(
+                "DELETE FROM tweets WHERE author_id = ANY(CAST(:user_ids AS integer[]))"
+            ),
+            params,
+        )
+        connection.execute(
+            text("DELETE FROM users WHERE id = ANY(CAST(:user_ids AS integer[]))"),
+            params,
+        )
+
+
+async def feed_joinedload(reader_id: int, limit: int) -> int:
+    """
+    Лента с загрузкой лайков и медиа через joinedload.
+
+    :return: Количество строк, переданных из базы данных.
+    """
+    async with Session() as session:
+        tweet_ids, next_cursor = await get_timeline_tweet_ids(
+            session=session, user_id=reader_id, limit=limit
+        )
+        stmt = (
+            select(Tweet)
+            .where(Tweet.id.in_(tweet_ids))
+            .order_by(Tweet.id.desc())
+            .options(
+                joinedload(Tweet.author),
+                joinedload(Tweet.likes).joinedload(Like.user),
+                joinedload(Tweet.media),
+            )
+        )
+        result = await session.execute(stmt)
+        tweets = result.scalars().unique().all()
+        tweet_feed = await make_tweet_feed(tweets=tweets, next_cursor=next_cursor)
+        msgspec.json.encode(tweet_feed)
+
+    # LEFT OUTER JOIN лайков и медиа дает по строке на каждую их пару.
+    return page_rows(tweets, next_cursor) + sum(
+        max(len(tweet.likes), 1) * max(len(tweet.media), 1) for tweet in tweets
+    )
+
+
+async def feed_orm(reader_id: int, limit: int) -> int:
+    """
+    Лента через текущий ORM-путь.
+
+    :return: Количество строк, переданных из базы данных.
+    """
+    async with Session() as session:
+        tweets, next_cursor = await get_timeline_page(
+            session=session, user_id=reader_id, limit=limit
+        )
+        tweet_feed = await make_tweet_feed(tweets=tweets, next_cursor=next_cursor)
+        msgspec.json.encode(tweet_feed)
+
+    # Твиты с авторами, лайки с пользователями и медиа загружаются отдельными запросами.
+    return (
+        page_rows(tweets, next_cursor)
+        + len(tweets)
+        + sum(len(tweet.likes) for tweet in tweets)
+        + sum(len(tweet.media) for tweet in tweets)
+    )
+
+
+async def feed_database(reader_id: int, limit: int) -> int:
+    """
+    Лента, собранная на стороне PostgreSQL.
+
+    :return: Количество строк, переданных из базы данных.
+    """
+    async with Session() as session:
+        tweet_ids, next_cursor = await get_timeline_tweet_ids(
+            session=session, user_id=reader_id, limit=limit
+        )
+        tweet_feed = await render_tweet_feed_json(
+            session=session, tweet_ids=tweet_ids, next_cursor=next_cursor
+        )
+        tweet_feed.encode()
+
+    return page_rows(tweet_ids, next_cursor) + 1
+
+
+def page_rows(page: Sequence, next_cursor: Optional[int]) -> int:
+    """
+    Количество строк, прочитанных из ленты для получения ID твитов страницы.
+    """
+    return len(page) + (1 if next_cursor is not None else 0)
+
+
+async def measure(
+    path: Callable[[int, int], Awaitable[int]], reader_id: int, limit: int, runs: int
+) -> Tuple[int, float, float]:
+    """
+    Измеряет задержку способа формирования ленты.
+
+    :return: Количество строк, медиана и 95-й перцентиль задержки в миллисекундах.
+    """
+    rows = await path(reader_id, limit)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await path(reader_id, limit)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    return rows, statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+async def run(reader_id: int, limit: int, runs: int) -> None:
+    """
+    Запускает измерения и выводит таблицу результатов.
+    """
+    print(f"{'path':<12}{'rows':>10}{'p50, ms':>12}{'p95, ms':>12}")
+    for name, path in (
+        ("joinedload", feed_joinedload),
+        ("orm", feed_orm),
+        ("database", feed_database),
+    ):
+        rows, p50, p95 = await measure(path, reader_id, limit, runs)
+        print(f"{name:<12}{rows:>10}{p50:>12.2f}{p95:>12.2f}")
+
+
+def main() -> None:
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tweets", type=int, default=200)
+    parser.add_argument("--likes", type=int, default=50, help="лайков на твит")
+    parser.add_argument("--media", type=int, default=4, help="медиа на твит")
+    parser.add_argument("--limit", type=int, default=20, help="размер страницы")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    reader_id, user_ids = seed(args.users, args.tweets, args.likes, args.media)
+    try:
+        asyncio.run(run(reader_id, args.limit, args.runs))
+    finally:
+        cleanup(user_ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,11 @@ from server.tests.getter_variables import (
     DB_PASSWORD,
     DB_USER,
     DB_HOST,
+    DB_PORT,
 )
 
 
-url = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:5432/{DB_NAME}"
+url = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 engine = create_engine(url, echo=True)
 Session = sessionmaker(bind=engine, autocommit=False, expire_on_commit=False)
 session = Session()
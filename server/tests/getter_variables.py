@@ -13,6 +13,7 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 DB_HOST = os.getenv("DB_HOST")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
 
 TEST_APIKEY = os.getenv("APIKEY")
 TEST_USERNAME = os.getenv("USERNAME")
@@ -2,13 +2,16 @@
 Модуль фикстур pytest
 """
 
+from typing import Dict, List
+
 import pytest
 from faker import Faker
+from sqlalchemy import text
 from fastapi.testclient import TestClient
 
 from server.tests.getter_variables import TEST_APIKEY, TEST_USERNAME
 from server.tests.confdb import session, engine
-from server.database.models import User, Tweet
+from server.database.models import User, Tweet, Timeline
 from server.database.confdb import Base
 from server.app.main import app
 
@@ -26,9 +29,12 @@ def setup():
 
 
 @pytest.fixture(scope="session", autouse=True)
-def client() -> TestClient:
+def client(setup) -> TestClient:
     """
     Фикстура для получения тестового клиента FastAPI.
+
+    Приложение запускается после создания таблиц: при запуске
+    фоновое удаление медиафайлов читает таблицу media_deletion_failures.
     """
     with TestClient(app) as client:
         yield client
@@ -71,18 +77,41 @@ def random_user_for_func() -> User:
     session.commit()
 
 
+@pytest.fixture(scope="function")
+def random_users_for_func() -> List[User]:
+    """
+    Фикстура для создания восьми пользователей со
+    случайными именами и apikey. Используется в тестах
+    параллельных запросов в рамках функции.
+    """
+    new_users = [User(name=Faker.name(), apikey=Faker.password()) for _ in range(8)]
+    session.add_all(new_users)
+    session.commit()
+
+    yield new_users
+
+    for new_user in new_users:
+        session.delete(new_user)
+    session.commit()
+
+
 @pytest.fixture(scope="function")
 @pytest.mark.usefixtures("init_user")
 def init_tweet_and_its_author(init_user: User) -> (Tweet, User):
     """
     Фикстура для создания твита в авторстве
-    тестового пользователя.
+    тестового пользователя. Твит добавляется
+    в ленту автора.
     """
     new_tweet = Tweet(
         author_id=init_user.id,
         content=Faker.text(),
     )
     session.add(new_tweet)
+    session.flush()
+    session.add(
+        Timeline(user_id=init_user.id, tweet_id=new_tweet.id, author_id=init_user.id)
+    )
     session.commit()
 
     yield new_tweet, init_user
@@ -106,3 +135,124 @@ def init_followers(init_user: User, random_user_for_func: User) -> (User, User):
     yield user, following
 
     user.following.remove(user)
+
+
+@pytest.fixture(scope="module")
+def plan_dataset() -> Dict[str, int]:
+    """
+    Фикстура для создания набора данных, близкого к рабочему по объему:
+    1000 пользователей по 30 твитов, около 90000 лайков, медиа у каждого
+    третьего твита и 10 подписок на пользователя. Читатель (первый
+    пользователь) подписан на 200 авторов, их твиты добавлены в его ленту.
+    После заполнения собирается статистика для планировщика.
+    """
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO users (apikey, name) "
+                "SELECT 'plan-' || g, 'plan user ' || g "
+                "FROM generate_series(1, 1000) g"
+            )
+        )
+        connection.execute(
+            text(
+                "CREATE TEMPORARY TABLE plan_users ON COMMIT DROP AS "
+                "SELECT id, row_number() OVER (ORDER BY id) AS n "
+                "FROM users WHERE apikey LIKE 'plan-%'"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO tweets (author_id, content) "
+                "SELECT id, 'plan tweet ' || g "
+                "FROM plan_users, generate_series(1, 30) g"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO follows (follower_id, following_id) "
+                "SELECT follower.id, following.id "
+                "FROM plan_users AS follower "
+                "CROSS JOIN generate_series(1, 10) AS k "
+                "JOIN plan_users AS following "
+                "ON following.n = (follower.n + k) % 1000 + 1 "
+                "WHERE follower.n > 1 "
+                "UNION "
+                "SELECT reader.id, following.id "
+                "FROM plan_users AS reader JOIN plan_users AS following "
+                "ON following.n BETWEEN 2 AND 201 WHERE reader.n = 1"
+            )
+        )
+        connection.execute(
+            text(
+                "UPDATE users SET followers_count = counts.total FROM ("
+                "SELECT following_id, count(*) AS total FROM follows "
+                "GROUP BY following_id) AS counts "
+                "WHERE users.id = counts.following_id "
+                "AND users.id IN (SELECT id FROM plan_users)"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO likes (user_id, tweet_id) "
+                "SELECT DISTINCT liker.id, tweets.id "
+                "FROM tweets JOIN plan_users AS author ON author.id = tweets.author_id "
+                "CROSS JOIN generate_series(1, 3) AS k "
+                "JOIN plan_users AS liker "
+                "ON liker.n = (tweets.id + author.n * k) % 1000 + 1"
+            )
+        )
+        connection.execute(
+            text(
+                "UPDATE tweets SET like_count = counts.total FROM ("
+                "SELECT tweet_id, count(*) AS total FROM likes GROUP BY tweet_id"
+                ") AS counts WHERE tweets.id = counts.tweet_id "
+                "AND tweets.author_id IN (SELECT id FROM plan_users)"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO medias (file_path, file_url, tweet_id) "
+                "SELECT 'plan', 'http://127.0.0.1/medias/plan/' || tweets.id, "
+                "tweets.id FROM tweets JOIN plan_users ON plan_users.id = "
+                "tweets.author_id WHERE tweets.id % 3 = 0"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO timelines (user_id, tweet_id, author_id) "
+                "SELECT reader.id, tweets.id, tweets.author_id "
+                "FROM plan_users AS reader "
+                "JOIN follows ON follows.follower_id = reader.id "
+                "JOIN tweets ON tweets.author_id = follows.following_id "
+                "WHERE reader.n = 1"
+            )
+        )
+        reader_id, tweet_id, liker_id = connection.execute(
+            text(
+                "SELECT follows.follower_id, likes.tweet_id, likes.user_id "
+                "FROM follows JOIN tweets ON tweets.author_id = follows.following_id "
+                "JOIN likes ON likes.tweet_id = tweets.id "
+                "JOIN plan_users ON plan_users.id = follows.follower_id "
+                "WHERE plan_users.n = 1 LIMIT 1"
+            )
+        ).one()
+        connection.execute(
+            text("ANALYZE users, tweets, likes, medias, follows, timelines")
+        )
+
+    yield {"reader_id": reader_id, "tweet_id": tweet_id, "liker_id": liker_id}
+
+    with engine.begin() as connection:
+        users = "(SELECT id FROM users WHERE apikey LIKE 'plan-%')"
+        for statement in (
+            f"DELETE FROM timelines WHERE user_id IN {users}",
+            f"DELETE FROM likes WHERE user_id IN {users}",
+            f"DELETE FROM medias WHERE tweet_id IN "
+            f"(SELECT id FROM tweets WHERE author_id IN {users})",
+            f"DELETE FROM follows WHERE follower_id IN {users} "
+            f"OR following_id IN {users}",
+            f"DELETE FROM tweets WHERE author_id IN {users}",
+            "DELETE FROM users WHERE apikey LIKE 'plan-%'",
+        ):
+            connection.execute(text(statement))
@@ -2,14 +2,31 @@
 Модуль тестирования роута /api/medias/
 """
 
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from io import BytesIO
-from server.database.models import Media
+from server.database.models import Media, MediaBlob, MediaDeletionFailure
 from typing import Dict
+from uuid import uuid4
 
 import pytest
 from fastapi.testclient import TestClient
+from PIL import Image
 
 from server.database.models import User, Tweet
+from server.app.media_cleanup import media_deleter
+from server.app.media_gc import media_sweeper
+from server.app.media_migration import migrate_media
+from server.app.storage import UPLOAD_TMP_DIR, blob_path, media_url, variant_path
+from server.database.getter_variables import (
+    MEDIA_MAX_SIZE,
+    MEDIA_CHUNK_SIZE,
+    MEDIA_ROOT,
+)
 from server.tests.getter_variables import API_URL
 from server.tests.confdb import session
 from server.tests.testing.utils import (
@@ -18,6 +35,8 @@ from server.tests.testing.utils import (
     HEADERS,
     INVALID_HEADERS,
     get_valid_image,
+    get_metric,
+    wait_media_deletion,
 )
 
 
@@ -89,9 +108,482 @@ class TestMedias:
         response = client.post(URL, headers=HEADERS)
         assert response.status_code == 422
 
+    def test_post_media_streamed_to_disk(self, init_user: User, client: TestClient):
+        """
+        Тестирует запись файла, состоящего из нескольких частей,
+        без оставшихся временных файлов.
+        """
+        content = os.urandom(MEDIA_CHUNK_SIZE * 3 + 1)
+        files = {"file": ("image.jpg", BytesIO(content))}
+        response = client.post(URL, headers=HEADERS, files=files)
+        assert response.status_code == 200
+
+        media = (
+            session.query(Media).where(Media.id == response.json()["media_id"]).one()
+        )
+        with open(media.file_path, "rb") as media_file:
+            assert media_file.read() == content
+        assert not any(name.endswith(".part") for name in os.listdir(UPLOAD_TMP_DIR))
+
+        os.remove(media.file_path)
+        session.delete(media)
+        session.commit()
+
+    def test_post_media_deduplicated(self, client: TestClient):
+        """
+        Тестирует загрузку одинакового содержимого дважды:
+        обе записи ссылаются на один файл, второй раз файл
+        на диск не записывается.
+        """
+        content = os.urandom(64)
+        dedup_hits = get_metric(client, "media_dedup_hits_total")
+
+        media_ids = [
+            client.post(URL, headers=HEADERS, files=get_valid_image(content)).json()[
+                "media_id"
+            ]
+            for _ in range(2)
+        ]
+        medias = session.query(Media).where(Media.id.in_(media_ids)).all()
+        blob = (
+            session.query(MediaBlob).where(MediaBlob.sha256 == medias[0].sha256).one()
+        )
+
+        assert len({media.file_path for media in medias}) == 1
+        assert len({media.file_url for media in medias}) == 1
+        assert blob.file_path == medias[0].file_path
+        assert blob.ref_count == 2
+        assert blob.size == len(content)
+        assert get_metric(client, "media_dedup_hits_total") == dedup_hits + 1
+        with open(blob.file_path, "rb") as media_file:
+            assert media_file.read() == content
+
+        # medias ссылаются на media_blobs, поэтому удаляются первыми
+        try:
+            for media in medias:
+                session.delete(media)
+            session.flush()
+            session.delete(blob)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        os.remove(blob.file_path)
+
+    def test_post_media_image_variants(self, init_user: User, client: TestClient):
+        """
+        Тестирует создание миниатюры и превью изображения в формате WebP,
+        их вывод в ленте и удаление вместе с твитом.
+        """
+        image_file = BytesIO()
+        Image.effect_noise((2000, 1000), 64).save(image_file, "PNG")
+        image_file.seek(0)
+        response = client.post(
+            URL, headers=HEADERS, files={"file": ("image.png", image_file)}
+        )
+        media = (
+            session.query(Media).where(Media.id == response.json()["media_id"]).one()
+        )
+
+        assert not any(name.endswith(".webp") for name in os.listdir(UPLOAD_TMP_DIR))
+        assert (media.width, media.height) == (2000, 1000)
+        assert (media.preview_width, media.preview_height) == (1280, 640)
+        assert (media.thumbnail_width, media.thumbnail_height) == (320, 160)
+        variant_paths = [
+            variant_path(media.file_path, name) for name in ("preview", "thumbnail")
+        ]
+        for path, url, size in zip(
+            variant_paths,
+            (media.preview_url, media.thumbnail_url),
+            ((1280, 640), (320, 160)),
+        ):
+            assert url == media_url(path)
+            with Image.open(path) as variant:
+                assert variant.format == "WEBP"
+                assert variant.size == size
+
+        tweet_data = {"tweet_data": Faker.text(), "tweet_media_ids": [media.id]}
+        tweet_id = client.post(
+            f"{API_URL}/tweets/", json=tweet_data, headers=HEADERS
+        ).json()["tweet_id"]
+        feed = client.get(f"{API_URL}/users/{init_user.id}/tweets", headers=HEADERS)
+        item = next(item for item in feed.json()["tweets"] if item["id"] == tweet_id)
+        assert item["attachments"] == [media.preview_url]
+        assert item["thumbnails"] == [media.thumbnail_url]
+
+        client.delete(f"{API_URL}/tweets/{tweet_id}", headers=HEADERS)
+        wait_media_deletion(client)
+        assert not any(
+            os.path.exists(path) for path in [media.file_path, *variant_paths]
+        )
+
+    def test_post_media_rollback(
+        self, client: TestClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        """
+        Тестирует откат транзакции загрузки после записи медиафайла:
+        медиафайл и его варианты удаляются, строка media_blobs не остается.
+        """
+
+        async def invalid_columns(*args) -> Dict[str, object]:
+            return {"width": "invalid"}
+
+        monkeypatch.setattr("server.app.routes.medias.variant_columns", invalid_columns)
+        image_file = BytesIO()
+        Image.effect_noise((400, 200), 64).save(image_file, "PNG")
+        sha256 = hashlib.sha256(image_file.getvalue()).hexdigest()
+        image_file.seek(0)
+
+        with pytest.raises(Exception):
+            client.post(URL, headers=HEADERS, files={"file": ("image.png", image_file)})
+
+        file_path = blob_path(sha256, "png")
+        assert session.get(MediaBlob, sha256) is None
+        assert not any(
+            os.path.exists(path)
+            for path in [
+                file_path,
+                *(variant_path(file_path, name) for name in ("preview", "thumbnail")),
+            ]
+        )
+
+    def test_post_media_not_image(self, client: TestClient):
+        """
+        Тестирует загрузку файла, не являющегося изображением:
+        файл сохраняется без вариантов.
+        """
+        response = client.post(URL, headers=HEADERS, files=get_valid_image())
+        assert response.status_code == 200
+
+        media = (
+            session.query(Media).where(Media.id == response.json()["media_id"]).one()
+        )
+        assert media.width is None
+        assert media.preview_url is None
+        assert media.thumbnail_url is None
+        assert not os.path.exists(variant_path(media.file_path, "preview"))
+
+    def test_post_media_too_large(
+        self, init_user: User, client: TestClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        """
+        Тестирование файла больше MEDIA_MAX_SIZE: запись прерывается,
+        временный файл удаляется.
+        """
+        monkeypatch.setattr("server.app.routes.utils.MEDIA_MAX_SIZE", 10)
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+        files_before = set(os.listdir(UPLOAD_TMP_DIR))
+
+        files = {"file": ("image.jpg", BytesIO(b"x" * 11))}
+        response = client.post(URL, headers=HEADERS, files=files)
+
+        assert response.status_code == 413
+        assert response.json() == {"detail": "File is too large"}
+        assert set(os.listdir(UPLOAD_TMP_DIR)) == files_before
+
+    def test_post_media_content_length_too_large(self, client: TestClient):
+        """
+        Тестирование запроса, Content-Length которого превышает
+        допустимый размер: запрос отклоняется до чтения тела.
+        """
+        rejected = get_metric(client, "request_body_too_large_total")
+        content = b"x" * (MEDIA_MAX_SIZE + MEDIA_CHUNK_SIZE + 1)
+        files = {"file": ("image.jpg", BytesIO(content))}
+        response = client.post(URL, headers=HEADERS, files=files)
+
+        assert response.status_code == 413
+        assert response.json() == {"detail": "File is too large"}
+        assert get_metric(client, "request_body_too_large_total") == rejected + 1
+
     def test_post_media_file_empty(self, client: TestClient):
         """
         Тестирование переданного пустого files.
         """
         response = client.post(URL, headers=HEADERS, files={"file": None})
         assert response.status_code == 400
+
+
+class TestMediaDeleter:
+    """
+    Тестирование фонового удаления медиафайлов.
+    """
+
+    def test_media_deleter_batch(self, client: TestClient):
+        """
+        Проверяет удаление пачки файлов, в том числе уже отсутствующих.
+        """
+        media_dir = tempfile.mkdtemp()
+        file_paths = [os.path.join(media_dir, f"{index}.jpg") for index in range(10)]
+        for file_path in file_paths:
+            with open(file_path, "wb") as media_file:
+                media_file.write(b"test content")
+
+        missing_path = os.path.join(media_dir, "missing.jpg")
+        client.portal.call(media_deleter.submit, file_paths + [missing_path])
+        wait_media_deletion(client)
+
+        assert not any(os.path.exists(file_path) for file_path in file_paths)
+        os.rmdir(media_dir)
+
+    def test_media_deleter_failure_recorded(
+        self, client: TestClient, monkeypatch: pytest.MonkeyPatch
+    ):
+        """
+        Проверяет повторные попытки удаления и запись файла,
+        который не удалось удалить, в media_deletion_failures.
+        """
+        monkeypatch.setattr(media_deleter, "retries", 2)
+        monkeypatch.setattr(media_deleter, "retry_delay", 0)
+        # Каталог нельзя удалить через os.remove
+        media_dir = tempfile.mkdtemp()
+
+        client.portal.call(media_deleter.submit, [media_dir])
+        wait_media_deletion(client)
+
+        failure = (
+            session.query(MediaDeletionFailure)
+            .where(MediaDeletionFailure.file_path == media_dir)
+            .one()
+        )
+        assert failure.attempts == 3
+        assert failure.error
+
+        client.portal.call(media_deleter.requeue_failures)
+        wait_media_deletion(client)
+        session.expire_all()
+        assert (
+            session.query(MediaDeletionFailure)
+            .where(MediaDeletionFailure.file_path == media_dir)
+            .count()
+            == 1
+        )
+
+        session.query(MediaDeletionFailure).where(
+            MediaDeletionFailure.file_path == media_dir
+        ).delete()
+        session.commit()
+        os.rmdir(media_dir)
+
+
+@pytest.mark.usefixtures("init_user")
+class TestMediaMigration:
+    """
+    Тестирование переноса медиафайлов в раскладку по префиксу SHA-256.
+    """
+
+    def test_migrate_legacy_media(self, init_user: User, client: TestClient):
+        """
+        Проверяет перенос файла из каталога пользователя: запись
+        получает SHA-256 и новый путь, старый файл удаляется,
+        повторный перенос запись не изменяет.
+        """
+        content = os.urandom(64)
+        sha256 = hashlib.sha256(content).hexdigest()
+        media_dir = os.path.join(MEDIA_ROOT, str(init_user.id))
+        os.makedirs(media_dir, exist_ok=True)
+        old_path = os.path.join(media_dir, f"{uuid4().hex}.jpg")
+        with open(old_path, "wb") as media_file:
+            media_file.write(content)
+        media = Media(file_path=old_path, file_url=media_url(old_path))
+        session.add(media)
+        session.commit()
+
+        stats = client.portal.call(migrate_media, 2)
+
+        session.expire_all()
+        new_path = blob_path(sha256, "jpg")
+        blob = session.query(MediaBlob).where(MediaBlob.sha256 == sha256).one()
+        assert stats["medias"] >= 1
+        assert media.sha256 == sha256
+        assert media.file_path == new_path
+        assert media.file_url == media_url(new_path)
+        assert blob.ref_count == 1
+        assert not os.path.exists(old_path)
+        with open(new_path, "rb") as media_file:
+            assert media_file.read() == content
+
+        client.portal.call(migrate_media, 2)
+        session.expire_all()
+        assert media.file_path == new_path
+        assert session.get(MediaBlob, sha256).ref_count == 1
+
+        try:
+            session.delete(media)
+            session.flush()
+            session.delete(blob)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        os.remove(new_path)
+
+    def test_delete_tweet_during_migration(self, init_user: User, client: TestClient):
+        """
+        Проверяет удаление твита, медиафайл которого в этот момент
+        переносится: удаление дожидается фиксации переноса
+        и освобождает ссылку на перенесенный медиафайл.
+        """
+        content = os.urandom(64)
+        sha256 = hashlib.sha256(content).hexdigest()
+        media_dir = os.path.join(MEDIA_ROOT, str(init_user.id))
+        os.makedirs(media_dir, exist_ok=True)
+        old_path = os.path.join(media_dir, f"{uuid4().hex}.jpg")
+        with open(old_path, "wb") as media_file:
+            media_file.write(content)
+        tweet_id = client.post(
+            f"{API_URL}/tweets/", json={"tweet_data": Faker.text()}, headers=HEADERS
+        ).json()["tweet_id"]
+        media = Media(
+            file_path=old_path, file_url=media_url(old_path), tweet_id=tweet_id
+        )
+        session.add(media)
+        session.commit()
+        media_id = media.id
+
+        # Незафиксированная транзакция переноса, как в migrate_legacy_batch
+        new_path = blob_path(sha256, "jpg")
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.link(old_path, new_path)
+        session.add(
+            MediaBlob(sha256=sha256, file_path=new_path, size=len(content), ref_count=1)
+        )
+        session.flush()
+        media.sha256 = sha256
+        media.file_path = new_path
+        media.file_url = media_url(new_path)
+        session.flush()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                client.delete, f"{API_URL}/tweets/{tweet_id}", headers=HEADERS
+            )
+            time.sleep(0.5)
+            assert not future.done()
+            session.commit()
+            response = future.result()
+        os.remove(old_path)
+        wait_media_deletion(client)
+
+        session.expire_all()
+        assert response.status_code == 200
+        assert session.get(Media, media_id) is None
+        assert session.get(MediaBlob, sha256) is None
+        assert not os.path.exists(new_path)
+
+    def test_migrate_flat_blob(self, client: TestClient):
+        """
+        Проверяет перенос файла, лежащего непосредственно в MEDIA_ROOT,
+        в каталог по префиксу SHA-256.
+        """
+        response = client.post(URL, headers=HEADERS, files=get_valid_image())
+        media = (
+            session.query(Media).where(Media.id == response.json()["media_id"]).one()
+        )
+        blob = session.query(MediaBlob).where(MediaBlob.sha256 == media.sha256).one()
+        new_path = blob.file_path
+        flat_path = os.path.join(MEDIA_ROOT, os.path.basename(new_path))
+        os.replace(new_path, flat_path)
+        blob.file_path = media.file_path = flat_path
+        media.file_url = media_url(flat_path)
+        session.commit()
+
+        stats = client.portal.call(migrate_media, 2)
+
+        session.expire_all()
+        assert stats["blobs"] == 1
+        assert blob.file_path == media.file_path == new_path
+        assert media.file_url == media_url(new_path)
+        assert os.path.exists(new_path)
+        assert not os.path.exists(flat_path)
+
+        try:
+            session.delete(media)
+            session.flush()
+            session.delete(blob)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        os.remove(new_path)
+
+
+@pytest.mark.usefixtures("init_user")
+class TestMediaSweeper:
+    """
+    Тестирование сборки медиафайлов, не привязанных к твитам.
+    """
+
+    def test_sweep_unattached_media(self, client: TestClient):
+        """
+        Проверяет удаление записи и файла медиафайла, не привязанного
+        к твиту дольше периода ожидания, и временного файла загрузки.
+        Привязанные к твиту и недавно загруженные медиафайлы остаются.
+        """
+        media_ids = [
+            client.post(URL, headers=HEADERS, files=get_valid_image()).json()[
+                "media_id"
+            ]
+            for _ in range(3)
+        ]
+        orphan_id, attached_id, recent_id = media_ids
+        tweet_data = {"tweet_data": Faker.text(), "tweet_media_ids": [attached_id]}
+        tweet_id = client.post(
+            f"{API_URL}/tweets/", json=tweet_data, headers=HEADERS
+        ).json()["tweet_id"]
+        session.query(Media).where(Media.id.in_([orphan_id, attached_id])).update(
+            {Media.created_at: Media.created_at - timedelta(days=2)},
+            synchronize_session=False,
+        )
+        session.commit()
+        orphan = session.get(Media, orphan_id)
+        orphan_sha256, orphan_path = orphan.sha256, orphan.file_path
+        orphan_size = os.path.getsize(orphan_path)
+
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+        temp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid4().hex}.part")
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(b"x" * 10)
+        stale = time.time() - 2 * 24 * 3600
+        os.utime(temp_path, (stale, stale))
+
+        reclaimed = get_metric(client, "media_gc_bytes_reclaimed_total")
+        stats = client.portal.call(media_sweeper.sweep)
+
+        session.expire_all()
+        assert stats["medias"] >= 1
+        assert stats["bytes"] >= orphan_size + 10
+        assert get_metric(client, "media_gc_bytes_reclaimed_total") == (
+            reclaimed + stats["bytes"]
+        )
+        assert session.get(Media, orphan_id) is None
+        assert session.get(MediaBlob, orphan_sha256) is None
+        assert not os.path.exists(orphan_path)
+        assert not os.path.exists(temp_path)
+        assert session.get(Media, attached_id) is not None
+        assert session.get(Media, recent_id) is not None
+
+        client.delete(f"{API_URL}/tweets/{tweet_id}", headers=HEADERS)
+        wait_media_deletion(client)
+
+    def test_post_tweet_with_swept_media(self, client: TestClient):
+        """
+        Проверяет создание твита с медиафайлом, удаленным сборщиком:
+        возвращается ошибка с кодом 400, твит не создается.
+        """
+        media_id = client.post(URL, headers=HEADERS, files=get_valid_image()).json()[
+            "media_id"
+        ]
+        session.query(Media).where(Media.id == media_id).update(
+            {Media.created_at: Media.created_at - timedelta(days=2)},
+            synchronize_session=False,
+        )
+        session.commit()
+        client.portal.call(media_sweeper.sweep)
+        tweets_count = session.query(Tweet).count()
+
+        tweet_data = {"tweet_data": Faker.text(), "tweet_media_ids": [media_id]}
+        response = client.post(f"{API_URL}/tweets/", json=tweet_data, headers=HEADERS)
+
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Media not found"}
+        assert session.query(Tweet).count() == tweets_count
@@ -0,0 +1,242 @@
+"""
+Модуль проверки планов выполнения горячих запросов routes/utils.py.
+
+Запросы выполняются функциями из routes/utils.py на наборе данных
+plan_dataset, их SQL перехватывается и повторно выполняется
+через EXPLAIN. Проверяется, что большие таблицы читаются
+по индексам, а не последовательным сканированием.
+"""
+
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Iterator, List
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from server.app.cache import auth_cache
+from server.app.routes.utils import (
+    add_like,
+    get_author_tweets_page,
+    get_follows_page,
+    get_likes_page,
+    get_likes_preview,
+    get_timeline_page,
+    get_timeline_tweet_ids,
+    get_user_by_id,
+    lazy_get_user_by_apikey,
+    remove_like,
+    render_tweet_feed_json,
+)
+from server.tests.confdb import engine as sync_engine
+
+
+# Та же тестовая база данных, что и у синхронной сессии тестов
+URL = sync_engine.url.set(drivername="postgresql+asyncpg")
+HOT_TABLES = {"tweets", "likes", "medias", "follows", "timelines"}
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+async def explain_queries(
+    call: Callable[[AsyncSession], Awaitable],
+) -> List[Dict]:
+    """
+    Выполняет функцию с собственной сессией, перехватывает выполненные
+    ею SELECT-запросы и получает их планы через EXPLAIN.
+
+    :param call: Функция, выполняющая запросы в переданной сессии.
+    :return: Планы выполнения перехваченных запросов.
+    """
+    engine = create_async_engine(URL, poolclass=NullPool)
+    queries = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            queries.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    plans = []
+    async with engine.connect() as connection:
+        async with AsyncSession(bind=connection) as session:
+            await call(session)
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+        for statement, parameters in queries:
+            result = await connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            )
+            plan = result.scalar_one()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plans.append(plan[0]["Plan"])
+        await connection.rollback()
+
+    await engine.dispose()
+    assert plans, "Функция не выполнила ни одного запроса"
+    return plans
+
+
+def plan_nodes(plan: Dict) -> Iterator[Dict]:
+    """
+    Обходит все узлы плана выполнения.
+    """
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def assert_index_scans(plans: List[Dict]) -> None:
+    """
+    Проверяет, что ни один план не читает большие таблицы
+    последовательным сканированием и каждый план использует индекс.
+    """
+    for plan in plans:
+        nodes = list(plan_nodes(plan))
+        seq_scans = {
+            node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"
+        }
+        assert not seq_scans & HOT_TABLES, json.dumps(plan, indent=2)
+        assert any(node["Node Type"] in INDEX_SCANS for node in nodes), json.dumps(
+            plan, indent=2
+        )
+
+
+@pytest.mark.usefixtures("plan_dataset")
+class TestQueryPlans:
+    """
+    Тестирование планов выполнения запросов routes/utils.py
+    """
+
+    def test_plan_user_by_apikey(self):
+        """
+        Проверяет поиск пользователя по API-ключу.
+        """
+        auth_cache.invalidate("plan-1")
+        plans = asyncio.run(
+            explain_queries(
+                lambda session: lazy_get_user_by_apikey(
+                    session=session, api_key="plan-1"
+                )
+            )
+        )
+        assert_index_scans(plans)
+
+    def test_plan_user_by_id(self, plan_dataset: Dict[str, int]):
+        """
+        Проверяет загрузку профиля с подписчиками и подписками.
+        """
+        plans = asyncio.run(
+            explain_queries(
+                lambda session: get_user_by_id(
+                    user_id=plan_dataset["reader_id"], session=session
+                )
+            )
+        )
+        assert_index_scans(plans)
+
+    def test_plan_timeline_page(self, plan_dataset: Dict[str, int]):
+        """
+        Проверяет чтение страницы ленты с твитами, медиа и лайками.
+        """
+        plans = asyncio.run(
+            explain_queries(
+                lambda session: get_timeline_page(
+                    session=session, user_id=plan_dataset["reader_id"], limit=20
+                )
+            )
+        )
+        assert_index_scans(plans)
+
+    def test_plan_timeline_celebrities(
+        self, plan_dataset: Dict[str, int], monkeypatch: pytest.MonkeyPatch
+    ):
+        """
+        Проверяет чтение ленты со слиянием твитов популярных авторов.
+        """
+        monkeypatch.setattr("server.app.routes.utils.CELEBRITY_FOLLOWERS_THRESHOLD", 0)
+        plans = asyncio.run(
+            explain_queries(
+                lambda session: get_timeline_tweet_ids(
+                    session=session, user_id=plan_dataset["reader_id"], limit=20
+                )
+            )
+        )
+        assert_index_scans(plans)
+
+    def test_plan_database_render(self, plan_dataset: Dict[str, int]):
+        """
+        Проверяет сборку ленты на стороне PostgreSQL.
+        """
+
+        async def call(session: AsyncSession) -> None:
+            tweet_ids, next_cursor = await get_timeline_tweet_ids(
+                session=session, user_id=plan_dataset["reader_id"], limit=20
+            )
+            await render_tweet_feed_json(
+                session=session,
+                tweet_ids=tweet_ids,
+                next_cursor=next_cursor,
+                likes_preview=3,
+            )
+
+        assert_index_scans(asyncio.run(explain_queries(call)))
+
+    def test_plan_likes(self, plan_dataset: Dict[str, int]):
+        """
+        Проверяет лайк и его удаление, превью и страницу лайков твита.
+        """
+
+        async def call(session: AsyncSession) -> None:
+            await add_like(
+                session=session,
+                user_id=plan_dataset["liker_id"],
+                tweet_id=plan_dataset["tweet_id"],
+            )
+            await remove_like(
+                session=session,
+                user_id=plan_dataset["liker_id"],
+                tweet_id=plan_dataset["tweet_id"],
+            )
+            await get_likes_preview(
+                session=session, tweet_ids=[plan_dataset["tweet_id"]], size=3
+            )
+            await get_likes_page(
+                session=session, tweet_id=plan_dataset["tweet_id"], limit=50
+            )
+
+        assert_index_scans(asyncio.run(explain_queries(call)))
+
+    def test_plan_follows_page(self, plan_dataset: Dict[str, int]):
+        """
+        Проверяет страницы подписчиков и подписок пользователя.
+        """
+
+        async def call(session: AsyncSession) -> None:
+            for followers in (True, False):
+                await get_follows_page(
+                    session=session,
+                    user_id=plan_dataset["reader_id"],
+                    limit=50,
+                    cursor=plan_dataset["reader_id"],
+                    followers=followers,
+                )
+
+        assert_index_scans(asyncio.run(explain_queries(call)))
+
+    def test_plan_author_tweets_page(self, plan_dataset: Dict[str, int]):
+        """
+        Проверяет чтение страницы твитов автора.
+        """
+        plans = asyncio.run(
+            explain_queries(
+                lambda session: get_author_tweets_page(
+                    session=session,
+                    author_id=plan_dataset["liker_id"],
+                    limit=20,
+                    load_likes=False,
+                )
+            )
+        )
+        assert_index_scans(plans)
@@ -2,17 +2,20 @@
 Модуль тестирования /api/tweets/
 """
 
+import json
 import os
 import random
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 import pytest
 from sqlalchemy import and_
 from fastapi.testclient import TestClient
 
-from server.database.models import User, Tweet, Like
+from server.database.models import User, Tweet, Like, Media, MediaBlob, Timeline
 from server.tests.getter_variables import API_URL
 from server.tests.confdb import session
+from server.database.confdb import read_your_writes
 from server.tests.testing.utils import (
     USER_NOT_FOUND_INVALID_API,
     RESULT_TRUE,
@@ -20,6 +23,8 @@ from server.tests.testing.utils import (
     INVALID_HEADERS,
     get_dict_tweet_feed,
     get_tweet_data,
+    get_valid_image,
+    wait_media_deletion,
 )
 
 
@@ -32,17 +37,237 @@ class TestGetTweets:
     Тестирование GET /api/tweet/
     """
 
-    def test_get_tweets(self, client: TestClient):
+    def test_get_tweets(
+        self, init_tweet_and_its_author: (Tweet, User), client: TestClient
+    ):
         """
         Проверяет успешное получение ленту твитов.
         """
+        tweet, user = init_tweet_and_its_author
         url = f"{URL}/"
         response = client.get(url, headers=HEADERS)
 
-        true_answer: Dict = get_dict_tweet_feed(session=session)
+        true_answer: Dict = get_dict_tweet_feed(session=session, user_id=user.id)
+        assert response.status_code == 200
+        assert response.json() == true_answer
+
+    def test_get_tweets_database_render(
+        self, init_tweet_and_its_author: (Tweet, User), client: TestClient
+    ):
+        """
+        Проверяет, что лента, собранная на стороне PostgreSQL,
+        совпадает с лентой, собранной через ORM.
+        """
+        tweet, user = init_tweet_and_its_author
+        url = f"{URL}/"
+        client.post(f"{URL}/{tweet.id}/likes", headers=HEADERS)
+
+        response = client.get(url, headers=HEADERS, params={"render": "database"})
+
+        true_answer: Dict = get_dict_tweet_feed(session=session, user_id=user.id)
         assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
         assert response.json() == true_answer
 
+        client.delete(f"{URL}/{tweet.id}/likes", headers=HEADERS)
+
+    def test_get_tweets_stream_json(
+        self, init_tweet_and_its_author: (Tweet, User), client: TestClient
+    ):
+        """
+        Проверяет, что лента, переданная потоком в формате JSON,
+        совпадает с обычным ответом ленты.
+        """
+        tweet, user = init_tweet_and_its_author
+        response = client.get(f"{URL}/", headers=HEADERS, params={"stream": "json"})
+
+        true_answer: Dict = get_dict_tweet_feed(session=session, user_id=user.id)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == true_answer
+
+    def test_get_tweets_stream_ndjson(
+        self, init_tweet_and_its_author: (Tweet, User), client: TestClient
+    ):
+        """
+        Проверяет ленту в формате NDJSON: по одному твиту в строке
+        и курсор следующей страницы в заголовке X-Next-Cursor.
+        """
+        tweet, user = init_tweet_and_its_author
+        new_tweet_id = client.post(
+            f"{URL}/", headers=HEADERS, json=get_tweet_data()
+        ).json()["tweet_id"]
+        response = client.get(
+            f"{URL}/", headers=HEADERS, params={"stream": "ndjson", "limit": 1}
+        )
+
+        true_answer: Dict = get_dict_tweet_feed(
+            session=session, user_id=user.id, limit=1
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.headers["x-next-cursor"] == str(true_answer["next_cursor"])
+        assert [json.loads(line) for line in response.text.splitlines()] == true_answer[
+            "tweets"
+        ]
+
+        client.delete(f"{URL}/{new_tweet_id}", headers=HEADERS)
+
+    @pytest.mark.usefixtures("random_user_for_func")
+    def test_get_tweets_likes_preview(
+        self,
+        init_tweet_and_its_author: (Tweet, User),
+        random_user_for_func: User,
+        client: TestClient,
+    ):
+        """
+        Проверяет ленту с сокращенным списком лайков
+        в обоих способах формирования ответа.
+        """
+        tweet, user = init_tweet_and_its_author
+        likes_url = f"{URL}/{tweet.id}/likes"
+        client.post(likes_url, headers=HEADERS)
+        client.post(likes_url, headers={"api-key": random_user_for_func.apikey})
+
+        for render in ("orm", "database"):
+            response = client.get(
+                f"{URL}/",
+                headers=HEADERS,
+                params={"likes_preview": 1, "render": render},
+            )
+            assert response.status_code == 200
+
+            item = next(
+                item for item in response.json()["tweets"] if item["id"] == tweet.id
+            )
+            assert item["like_count"] == 2
+            assert item["likes"] == [{"user_id": user.id, "name": user.name}]
+
+        client.delete(likes_url, headers=HEADERS)
+        client.delete(likes_url, headers={"api-key": random_user_for_func.apikey})
+
+    def test_get_tweets_pagination(
+        self, init_tweet_and_its_author: (Tweet, User), client: TestClient
+    ):
+        """
+        Проверяет постраничное получение ленты по курсору.
+        """
+        tweet, user = init_tweet_and_its_author
+        url = f"{URL}/"
+        new_tweet_ids = [
+            client.post(url, headers=HEADERS, json=get_tweet_data()).json()["tweet_id"]
+            for _ in range(3)
+        ]
+
+        received_ids = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor is not None:
+                params["cursor"] = cursor
+            response = client.get(url, headers=HEADERS, params=params)
+            assert response.status_code == 200
+
+            page = response.json()
+            assert len(page["tweets"]) <= 2
+            received_ids.extend(item["id"] for item in page["tweets"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        expected_ids = [
+            tweet_id
+            for (tweet_id,) in session.query(Timeline.tweet_id)
+            .where(Timeline.user_id == user.id)
+            .order_by(Timeline.tweet_id.desc())
+        ]
+        assert received_ids == expected_ids
+        assert set(new_tweet_ids) <= set(received_ids)
+
+        for tweet_id in new_tweet_ids:
+            client.delete(f"{URL}/{tweet_id}", headers=HEADERS)
+
+    def test_get_tweets_invalid_limit(self, client: TestClient):
+        """
+        Проверяет запрос ленты с недопустимым размером страницы.
+        """
+        url = f"{URL}/"
+        response = client.get(url, headers=HEADERS, params={"limit": 0})
+        assert response.status_code == 422
+
+    @pytest.mark.usefixtures("random_user_for_func")
+    def test_get_tweets_from_following(
+        self, random_user_for_func: User, client: TestClient
+    ):
+        """
+        Проверяет, что твиты автора попадают в ленту после
+        подписки на него и исчезают из нее после отписки.
+        """
+        author: User = random_user_for_func
+        author_headers = {"api-key": author.apikey}
+        follow_url = f"{API_URL}/users/{author.id}/follow"
+
+        client.post(follow_url, headers=HEADERS)
+        response = client.post(f"{URL}/", headers=author_headers, json=get_tweet_data())
+        tweet_id = response.json()["tweet_id"]
+
+        feed_ids = [
+            item["id"]
+            for item in client.get(f"{URL}/", headers=HEADERS).json()["tweets"]
+        ]
+        assert tweet_id in feed_ids
+
+        client.delete(follow_url, headers=HEADERS)
+
+        feed_ids = [
+            item["id"]
+            for item in client.get(f"{URL}/", headers=HEADERS).json()["tweets"]
+        ]
+        assert tweet_id not in feed_ids
+
+        client.delete(f"{URL}/{tweet_id}", headers=author_headers)
+
+    @pytest.mark.usefixtures("random_user_for_func")
+    def test_get_tweets_from_celebrity(
+        self,
+        init_user: User,
+        random_user_for_func: User,
+        client: TestClient,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        """
+        Проверяет, что твиты автора с числом подписчиков выше порога
+        не записываются в ленты подписчиков, но попадают в ленту
+        при ее чтении.
+        """
+        monkeypatch.setattr("server.app.routes.utils.CELEBRITY_FOLLOWERS_THRESHOLD", 0)
+        author: User = random_user_for_func
+        author_headers = {"api-key": author.apikey}
+        follow_url = f"{API_URL}/users/{author.id}/follow"
+
+        client.post(follow_url, headers=HEADERS)
+        response = client.post(f"{URL}/", headers=author_headers, json=get_tweet_data())
+        tweet_id = response.json()["tweet_id"]
+
+        timeline_row = (
+            session.query(Timeline)
+            .where(
+                and_(Timeline.user_id == init_user.id, Timeline.tweet_id == tweet_id)
+            )
+            .scalar()
+        )
+        assert timeline_row is None
+
+        feed = client.get(f"{URL}/", headers=HEADERS).json()
+        assert tweet_id in [item["id"] for item in feed["tweets"]]
+
+        metrics = client.get(f"{API_URL}/metrics/").text
+        assert "fanout_celebrity_threshold" in metrics
+        assert "fanout_skipped_tweets_total" in metrics
+
+        client.delete(follow_url, headers=HEADERS)
+        client.delete(f"{URL}/{tweet_id}", headers=author_headers)
+
     def test_get_tweets_fail(self, client: TestClient):
         """
         Проверяет неудачный запрос на получение
@@ -55,6 +280,98 @@ class TestGetTweets:
 
 
 @pytest.mark.usefixtures("init_user")
+@pytest.mark.usefixtures("init_tweet_and_its_author")
+class TestConcurrentRequests:
+    """
+    Тестирование параллельных запросов к /api/tweets/
+    """
+
+    @pytest.mark.usefixtures("random_users_for_func")
+    def test_concurrent_likes(
+        self,
+        init_tweet_and_its_author: (Tweet, User),
+        random_users_for_func: List[User],
+        client: TestClient,
+    ):
+        """
+        Проверяет, что параллельные запросы разных пользователей
+        выполняются в собственных сессиях и не мешают друг другу.
+        """
+        tweet, user = init_tweet_and_its_author
+        likes_url = f"{URL}/{tweet.id}/likes"
+        users_headers = [{"api-key": user.apikey} for user in random_users_for_func]
+        session.add_all(
+            Timeline(user_id=new_user.id, tweet_id=tweet.id, author_id=user.id)
+            for new_user in random_users_for_func
+        )
+        session.commit()
+
+        with ThreadPoolExecutor(max_workers=len(users_headers)) as executor:
+            responses = list(
+                executor.map(
+                    lambda headers: client.post(likes_url, headers=headers),
+                    users_headers,
+                )
+            )
+            assert all(response.status_code == 200 for response in responses)
+
+            feeds = list(
+                executor.map(
+                    lambda headers: client.get(f"{URL}/", headers=headers),
+                    users_headers,
+                )
+            )
+            assert all(response.status_code == 200 for response in feeds)
+            assert all(response.json() == feeds[0].json() for response in feeds)
+
+            [item] = feeds[0].json()["tweets"]
+            assert item["id"] == tweet.id
+            assert item["like_count"] == len(users_headers)
+
+            list(
+                executor.map(
+                    lambda headers: client.delete(likes_url, headers=headers),
+                    users_headers,
+                )
+            )
+
+    def test_concurrent_likes_same_user(
+        self, init_tweet_and_its_author: (Tweet, User), client: TestClient
+    ):
+        """
+        Проверяет, что параллельные лайки одного пользователя
+        создают один лайк и увеличивают счетчик лайков один раз.
+        """
+        tweet, user = init_tweet_and_its_author
+        likes_url = f"{URL}/{tweet.id}/likes"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(
+                executor.map(
+                    lambda _: client.post(likes_url, headers=HEADERS), range(8)
+                )
+            )
+
+        status_codes = sorted(response.status_code for response in responses)
+        assert status_codes == [200] + [400] * 7
+
+        likes = session.query(Like).where(Like.tweet_id == tweet.id).all()
+        assert len(likes) == 1
+
+        session.refresh(tweet)
+        assert tweet.like_count == 1
+
+        response = client.delete(likes_url, headers=HEADERS)
+        assert response.status_code == 200
+        session.refresh(tweet)
+        assert tweet.like_count == 0
+
+        response = client.delete(likes_url, headers=HEADERS)
+        assert response.status_code == 404
+        session.refresh(tweet)
+        assert tweet.like_count == 0
+
+
 class TestPostTweets:
     """
     Тестирование POST /api/tweet/
@@ -88,6 +405,23 @@ class TestPostTweets:
         session.delete(tweet)
         session.commit()
 
+    def test_post_tweets_read_your_writes(self, init_user: User, client: TestClient):
+        """
+        Проверяет, что после записи чтения автора идут с основной базы
+        и созданный твит сразу виден в его ленте.
+        """
+        url = f"{URL}/"
+        response = client.post(url, headers=HEADERS, json=get_tweet_data())
+        tweet_id = response.json()["tweet_id"]
+
+        assert read_your_writes.is_sticky(init_user.apikey)
+        assert not read_your_writes.is_sticky(INVALID_HEADERS["api-key"])
+
+        feed = client.get(url, headers=HEADERS).json()
+        assert feed["tweets"][0]["id"] == tweet_id
+
+        client.delete(f"{URL}/{tweet_id}", headers=HEADERS)
+
     # Проверка неудачных сценариев создания твита.
 
     def test_post_tweets_empty_data(self, client: TestClient):
@@ -113,6 +447,54 @@ class TestPostTweets:
         assert response.json() == USER_NOT_FOUND_INVALID_API
 
 
+@pytest.mark.usefixtures("init_tweet_and_its_author")
+class TestGetLikes:
+    """
+    Тестирование GET /api/tweets/{tweet_id}/likes
+    """
+
+    @pytest.mark.usefixtures("random_user_for_func")
+    def test_get_likes_pagination(
+        self,
+        init_tweet_and_its_author: (Tweet, User),
+        random_user_for_func: User,
+        client: TestClient,
+    ):
+        """
+        Проверяет постраничное получение лайкнувших пользователей.
+        """
+        tweet, user = init_tweet_and_its_author
+        other: User = random_user_for_func
+        url = f"{URL}/{tweet.id}/likes"
+        client.post(url, headers=HEADERS)
+        client.post(url, headers={"api-key": other.apikey})
+
+        first_page = client.get(url, headers=HEADERS, params={"limit": 1}).json()
+        assert first_page["likes"] == [{"user_id": user.id, "name": user.name}]
+        assert first_page["next_cursor"] is not None
+
+        second_page = client.get(
+            url,
+            headers=HEADERS,
+            params={"limit": 1, "cursor": first_page["next_cursor"]},
+        ).json()
+        assert second_page["likes"] == [{"user_id": other.id, "name": other.name}]
+        assert second_page["next_cursor"] is None
+
+        client.delete(url, headers=HEADERS)
+        client.delete(url, headers={"api-key": other.apikey})
+
+    def test_get_likes_invalid_tweet_id(self, client: TestClient):
+        """
+        Неверный ID твита.
+        """
+        url = f"{URL}/{random.randint(8888, 9999)}/likes"
+        response = client.get(url, headers=HEADERS)
+
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Tweet not found"}
+
+
 @pytest.mark.usefixtures("init_tweet_and_its_author")
 class TestPostLike:
     def test_post_like_success(
@@ -133,8 +515,12 @@ class TestPostLike:
         )
         assert like is not None
 
-        session.delete(like)
-        session.commit()
+        session.refresh(tweet)
+        assert tweet.like_count == 1
+
+        client.delete(url, headers=HEADERS)
+        session.refresh(tweet)
+        assert tweet.like_count == 0
 
     # Проверка неудачных сценариев поставить лайк.
 
@@ -265,9 +651,92 @@ class TestDeleteTweet:
         deleted_tweet = session.query(Tweet).filter_by(id=tweet.id).first()
         assert deleted_tweet is None
 
+        wait_media_deletion(client)
         for media in tweet.media:
             assert not os.path.exists(media.file_path)
 
+    @pytest.mark.usefixtures("random_user_for_func")
+    def test_delete_tweet_with_likes_and_media(
+        self, random_user_for_func: User, client: TestClient
+    ):
+        """
+        Удаление твита с лайками и медиа: связанные записи удаляются
+        каскадно в базе данных, медиафайл удаляется с сервера.
+        """
+        media_response = client.post(
+            f"{API_URL}/medias/", files=get_valid_image(), headers=HEADERS
+        )
+        media_id = media_response.json()["media_id"]
+        file_path = session.query(Media.file_path).where(Media.id == media_id).scalar()
+
+        tweet_data = get_tweet_data()
+        tweet_data["tweet_media_ids"] = [media_id]
+        tweet_id = client.post(f"{URL}/", headers=HEADERS, json=tweet_data).json()[
+            "tweet_id"
+        ]
+        likes_url = f"{URL}/{tweet_id}/likes"
+        client.post(likes_url, headers=HEADERS)
+        client.post(likes_url, headers={"api-key": random_user_for_func.apikey})
+        assert os.path.exists(file_path)
+
+        response = client.delete(f"{URL}/{tweet_id}", headers=HEADERS)
+        assert response.status_code == 200
+        assert response.json() == RESULT_TRUE
+
+        assert session.query(Tweet).filter_by(id=tweet_id).first() is None
+        assert session.query(Like).filter_by(tweet_id=tweet_id).count() == 0
+        assert session.query(Media).filter_by(id=media_id).count() == 0
+        assert session.query(Timeline).filter_by(tweet_id=tweet_id).count() == 0
+
+        wait_media_deletion(client)
+        assert not os.path.exists(file_path)
+
+    def test_delete_tweet_shared_media(self, client: TestClient):
+        """
+        Удаление твитов с одинаковым медиафайлом: файл удаляется
+        с сервера только вместе с последним ссылающимся на него твитом.
+        """
+        content = os.urandom(64)
+        tweet_ids = []
+        for _ in range(2):
+            media_id = client.post(
+                f"{API_URL}/medias/", files=get_valid_image(content), headers=HEADERS
+            ).json()["media_id"]
+            tweet_data = get_tweet_data()
+            tweet_data["tweet_media_ids"] = [media_id]
+            tweet_ids.append(
+                client.post(f"{URL}/", headers=HEADERS, json=tweet_data).json()[
+                    "tweet_id"
+                ]
+            )
+        sha256 = session.query(Media.sha256).where(Media.id == media_id).scalar()
+        file_path = (
+            session.query(MediaBlob.file_path)
+            .where(MediaBlob.sha256 == sha256)
+            .scalar()
+        )
+
+        response = client.delete(f"{URL}/{tweet_ids[0]}", headers=HEADERS)
+        assert response.status_code == 200
+        wait_media_deletion(client)
+
+        session.expire_all()
+        blob = session.query(MediaBlob).where(MediaBlob.sha256 == sha256).one()
+        assert blob.ref_count == 1
+        assert os.path.exists(file_path)
+
+        response = client.delete(f"{URL}/{tweet_ids[1]}", headers=HEADERS)
+        assert response.status_code == 200
+        wait_media_deletion(client)
+
+        session.expire_all()
+        assert session.query(MediaBlob).where(MediaBlob.sha256 == sha256).count() == 0
+        assert not os.path.exists(file_path)
+        assert not any(
+            name.startswith(os.path.basename(file_path))
+            for name in os.listdir(os.path.dirname(file_path))
+        )
+
     # Проверка неудачных сценариев.
 
     def test_delete_tweet_not_author(
@@ -3,14 +3,16 @@
 """
 
 import random
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 import pytest
 from fastapi.testclient import TestClient
 
-from server.database.models import User
+from server.database.models import Tweet, User
 from server.tests.testing.utils import get_dict_about_user
 from server.tests.getter_variables import API_URL
+from server.tests.confdb import session
 from server.tests.testing.utils import (
     Faker,
     USER_NOT_FOUND,
@@ -18,6 +20,8 @@ from server.tests.testing.utils import (
     RESULT_TRUE,
     HEADERS,
     INVALID_HEADERS,
+    get_metric,
+    get_tweet_data,
 )
 
 
@@ -135,6 +139,17 @@ class TestPostUserFollow:
         assert response.json() == RESULT_TRUE
         assert test_user in new_user.followers
 
+        session.refresh(test_user)
+        session.refresh(new_user)
+        assert test_user.following_count == 1
+        assert new_user.followers_count == 1
+
+        client.delete(url=url, headers=HEADERS)
+        session.refresh(test_user)
+        session.refresh(new_user)
+        assert test_user.following_count == 0
+        assert new_user.followers_count == 0
+
     # Проверка неверных сценариев подписки.
 
     @pytest.mark.usefixtures("random_user_for_func")
@@ -184,6 +199,42 @@ class TestPostUserFollow:
                 new_user.name}"
         }
 
+    def test_post_user_follow_concurrent(
+        self, init_user: User, random_user_for_func: User, client: TestClient
+    ):
+        """
+        Проверяет, что параллельные подписки на одного пользователя
+        создают одну подписку и изменяют счетчики один раз.
+        """
+        test_user: User = init_user
+        new_user: User = random_user_for_func
+
+        # init_user общий для класса, поэтому проверяются изменения счетчиков
+        session.refresh(test_user)
+        following_count = test_user.following_count
+        followers_count = new_user.followers_count
+
+        url = f"{URL}/{new_user.id}/follow"
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(
+                executor.map(lambda _: client.post(url=url, headers=HEADERS), range(8))
+            )
+
+        status_codes = sorted(response.status_code for response in responses)
+        assert status_codes == [200] + [400] * 7
+
+        session.refresh(test_user)
+        session.refresh(new_user)
+        assert test_user.following_count == following_count + 1
+        assert new_user.followers_count == followers_count + 1
+
+        response = client.delete(url=url, headers=HEADERS)
+        assert response.status_code == 200
+        session.refresh(test_user)
+        session.refresh(new_user)
+        assert test_user.following_count == following_count
+        assert new_user.followers_count == followers_count
+
     def test_post_follow_to_yourself(self, init_user: User, client: TestClient):
         """
         Подписка на самого себя
@@ -268,3 +319,272 @@ class TestDeleteUserUnfollow:
         assert response.json() == {
             "detail": f"{user.name} is already subscribed to {following.name}"
         }
+
+
+@pytest.mark.usefixtures("init_user")
+class TestGetUserFollows:
+    """
+    Тестирование GET /api/users/{user_id}/followers,
+    GET /api/users/{user_id}/following и краткого профиля.
+    """
+
+    @staticmethod
+    def collect_pages(client: TestClient, url: str, limit: int) -> List[Dict]:
+        """
+        Обходит все страницы списка пользователей по next_cursor.
+        """
+        users, cursor = [], None
+        while True:
+            params = {"limit": limit}
+            if cursor is not None:
+                params["cursor"] = cursor
+            response = client.get(url, params=params)
+            assert response.status_code == 200
+
+            page = response.json()
+            assert len(page["users"]) <= limit
+            users.extend(page["users"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return users
+
+    @pytest.mark.usefixtures("random_users_for_func")
+    def test_get_followers_pagination(
+        self,
+        init_user: User,
+        random_users_for_func: List[User],
+        client: TestClient,
+    ):
+        """
+        Проверяет постраничное получение всех подписчиков без повторов.
+        """
+        follow_url = f"{URL}/{init_user.id}/follow"
+        for user in random_users_for_func:
+            response = client.post(follow_url, headers={"api-key": user.apikey})
+            assert response.status_code == 200
+
+        users = self.collect_pages(client, f"{URL}/{init_user.id}/followers", 3)
+        assert users == [
+            {"id": user.id, "name": user.name}
+            for user in sorted(random_users_for_func, key=lambda user: user.id)
+        ]
+
+        for user in random_users_for_func:
+            client.delete(follow_url, headers={"api-key": user.apikey})
+
+    @pytest.mark.usefixtures("random_users_for_func")
+    def test_get_following_pagination(
+        self,
+        init_user: User,
+        random_users_for_func: List[User],
+        client: TestClient,
+    ):
+        """
+        Проверяет постраничное получение всех подписок без повторов.
+        """
+        for user in random_users_for_func:
+            client.post(f"{URL}/{user.id}/follow", headers=HEADERS)
+
+        users = self.collect_pages(client, f"{URL}/{init_user.id}/following", 3)
+        assert users == [
+            {"id": user.id, "name": user.name}
+            for user in sorted(random_users_for_func, key=lambda user: user.id)
+        ]
+
+        for user in random_users_for_func:
+            client.delete(f"{URL}/{user.id}/follow", headers=HEADERS)
+
+    @pytest.mark.usefixtures("random_users_for_func")
+    def test_get_me_follows_preview(
+        self,
+        init_user: User,
+        random_users_for_func: List[User],
+        client: TestClient,
+    ):
+        """
+        Проверяет краткий профиль: счетчики, первая страница подписок
+        и курсор следующей страницы.
+        """
+        for user in random_users_for_func:
+            client.post(f"{URL}/{user.id}/follow", headers=HEADERS)
+        following = sorted(random_users_for_func, key=lambda user: user.id)
+
+        response = client.get(
+            f"{URL}/me", headers=HEADERS, params={"follows_preview": 3}
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            "result": True,
+            "user": {
+                "id": init_user.id,
+                "name": init_user.name,
+                "followers_count": 0,
+                "following_count": len(following),
+                "followers": [],
+                "following": [
+                    {"id": user.id, "name": user.name} for user in following[:3]
+                ],
+                "following_next_cursor": following[2].id,
+            },
+        }
+
+        for user in random_users_for_func:
+            client.delete(f"{URL}/{user.id}/follow", headers=HEADERS)
+
+    def test_get_followers_wrong_id(self, client: TestClient):
+        """
+        Проверяет запрос подписчиков несуществующего пользователя.
+        """
+        url = f"{URL}/{random.randint(8888, 9999)}/followers"
+        response = client.get(url=url)
+
+        assert response.status_code == 404
+        assert response.json() == USER_NOT_FOUND
+
+
+@pytest.mark.usefixtures("init_tweet_and_its_author")
+class TestGetUserTweets:
+    """
+    Тестирование GET /api/users/{user_id}/tweets
+    """
+
+    @pytest.mark.usefixtures("random_user_for_func")
+    def test_get_user_tweets_pagination(
+        self,
+        init_tweet_and_its_author: (Tweet, User),
+        random_user_for_func: User,
+        client: TestClient,
+    ):
+        """
+        Проверяет постраничное получение всех твитов пользователя
+        от новых к старым без твитов других авторов.
+        """
+        tweet, user = init_tweet_and_its_author
+        tweets_url = f"{API_URL}/tweets"
+        new_tweet_ids = [
+            client.post(
+                f"{tweets_url}/", headers=HEADERS, json=get_tweet_data()
+            ).json()["tweet_id"]
+            for _ in range(3)
+        ]
+        other_headers = {"api-key": random_user_for_func.apikey}
+        other_tweet_id = client.post(
+            f"{tweets_url}/", headers=other_headers, json=get_tweet_data()
+        ).json()["tweet_id"]
+
+        url = f"{URL}/{user.id}/tweets"
+        items, cursor = [], None
+        while True:
+            params = {"limit": 2}
+            if cursor is not None:
+                params["cursor"] = cursor
+            response = client.get(url, params=params)
+            assert response.status_code == 200
+
+            page = response.json()
+            assert len(page["tweets"]) <= 2
+            items.extend(page["tweets"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        expected_ids = [
+            tweet_id
+            for (tweet_id,) in session.query(Tweet.id)
+            .where(Tweet.author_id == user.id)
+            .order_by(Tweet.id.desc())
+        ]
+        assert [item["id"] for item in items] == expected_ids
+        assert set(new_tweet_ids) | {tweet.id} <= set(expected_ids)
+        assert all(
+            item["author"] == {"id": user.id, "name": user.name} for item in items
+        )
+
+        for tweet_id in new_tweet_ids:
+            client.delete(f"{tweets_url}/{tweet_id}", headers=HEADERS)
+        client.delete(f"{tweets_url}/{other_tweet_id}", headers=other_headers)
+
+    def test_get_user_tweets_likes_preview(
+        self, init_tweet_and_its_author: (Tweet, User), client: TestClient
+    ):
+        """
+        Проверяет превью лайков в твитах пользователя.
+        """
+        tweet, user = init_tweet_and_its_author
+        likes_url = f"{API_URL}/tweets/{tweet.id}/likes"
+        client.post(likes_url, headers=HEADERS)
+
+        response = client.get(f"{URL}/{user.id}/tweets", params={"likes_preview": 1})
+        assert response.status_code == 200
+        item = next(
+            item for item in response.json()["tweets"] if item["id"] == tweet.id
+        )
+        assert item["like_count"] == 1
+        assert item["likes"] == [{"user_id": user.id, "name": user.name}]
+
+        client.delete(likes_url, headers=HEADERS)
+
+    def test_get_user_tweets_wrong_id(self, client: TestClient):
+        """
+        Проверяет запрос твитов несуществующего пользователя.
+        """
+        url = f"{URL}/{random.randint(8888, 9999)}/tweets"
+        response = client.get(url=url)
+
+        assert response.status_code == 404
+        assert response.json() == USER_NOT_FOUND
+
+
+class TestAuthCache:
+    """
+    Тестирование кэша аутентификации по API-ключу.
+    """
+
+    @pytest.mark.usefixtures("random_user_for_func")
+    def test_auth_cache_hit_and_invalidation(
+        self, random_user_for_func: User, client: TestClient
+    ):
+        """
+        Проверяет, что повторный запрос обслуживается из кэша,
+        а смена API-ключа сразу сбрасывает запись кэша.
+        """
+        tweets_url = f"{API_URL}/tweets/"
+        old_headers = {"api-key": random_user_for_func.apikey}
+        assert client.get(tweets_url, headers=old_headers).status_code == 200
+
+        hits = get_metric(client, "auth_cache_hits_total")
+        assert client.get(tweets_url, headers=old_headers).status_code == 200
+        assert get_metric(client, "auth_cache_hits_total") == hits + 1
+
+        random_user_for_func.apikey = Faker.password()
+        session.commit()
+
+        response = client.get(tweets_url, headers=old_headers)
+        assert response.status_code == 404
+        assert response.json() == USER_NOT_FOUND_INVALID_API
+
+        new_headers = {"api-key": random_user_for_func.apikey}
+        assert client.get(tweets_url, headers=new_headers).status_code == 200
+
+    def test_auth_cache_negative(self, client: TestClient):
+        """
+        Проверяет кэширование неверного API-ключа и сброс
+        этой записи при создании пользователя с таким ключом.
+        """
+        tweets_url = f"{API_URL}/tweets/"
+        api_key = Faker.password()
+        headers = {"api-key": api_key}
+        assert client.get(tweets_url, headers=headers).status_code == 404
+
+        negative_hits = get_metric(client, "auth_cache_negative_hits_total")
+        assert client.get(tweets_url, headers=headers).status_code == 404
+        assert get_metric(client, "auth_cache_negative_hits_total") == negative_hits + 1
+
+        new_user = User(name=Faker.name(), apikey=api_key)
+        session.add(new_user)
+        session.commit()
+
+        assert client.get(tweets_url, headers=headers).status_code == 200
+
+        session.delete(new_user)
+        session.commit()
@@ -2,15 +2,19 @@
 Модуль утилит используемых в тестах.
 """
 
-from typing import Dict
+import os
+from typing import Dict, Optional
 from io import BytesIO
 
-from sqlalchemy.orm import joinedload, Session
+from sqlalchemy.orm import joinedload, selectinload, Session
 from sqlalchemy import select
 from faker import Faker
+from fastapi.testclient import TestClient
 
-from server.tests.getter_variables import TEST_APIKEY
-from server.database.models import User, Tweet, Like
+from server.app.media_cleanup import media_deleter
+from server.tests.getter_variables import TEST_APIKEY, API_URL
+from server.database.getter_variables import FEED_PAGE_SIZE
+from server.database.models import User, Tweet, Like, Timeline
 
 
 Faker = Faker()
@@ -33,6 +37,8 @@ def get_dict_about_user(user: User) -> Dict:
         "user": {
             "id": user.id,
             "name": user.name,
+            "followers_count": user.followers_count,
+            "following_count": user.following_count,
             "followers": [
                 {
                     "id": follower.id,
@@ -51,20 +57,39 @@ def get_dict_about_user(user: User) -> Dict:
     }
 
 
-def get_dict_tweet_feed(session: Session) -> Dict:
+def get_dict_tweet_feed(
+    session: Session, user_id: int, limit: int = FEED_PAGE_SIZE
+) -> Dict:
     """
-    Формирует структуру данных для ленты твитов.
+    Формирует структуру данных для первой страницы ленты твитов пользователя.
 
-    :param tweets: Список твитов, для которых будет сформирована лента.
+    :param session: Сессия SQLAlchemy.
+    :param user_id: ID владельца ленты.
+    :param limit: Количество твитов на странице.
     :return: Словарь с данными о твитах, включая их контент, медиа, авторов и лайки.
     """
-    stmt = select(Tweet).options(
-        joinedload(Tweet.author),
-        joinedload(Tweet.likes).joinedload(Like.user),
-        joinedload(Tweet.media),
+    stmt = (
+        select(Tweet)
+        .join(Timeline, Timeline.tweet_id == Tweet.id)
+        .where(Timeline.user_id == user_id)
+        .order_by(Tweet.id.desc())
+        .limit(limit + 1)
+        .options(
+            joinedload(Tweet.author),
+            selectinload(Tweet.likes).joinedload(Like.user),
+            selectinload(Tweet.media),
+        )
+        # Счетчики лайков обновляются SQL-запросами приложения,
+        # поэтому объекты из identity map сессии перечитываются
+        .execution_options(populate_existing=True)
     )
     result = session.execute(stmt)
-    tweets = result.scalars().unique().all()
+    tweets = result.scalars().all()
+
+    next_cursor = None
+    if len(tweets) > limit:
+        tweets = tweets[:limit]
+        next_cursor = tweets[-1].id
 
     tweet_feed = {
         "result": True,
@@ -72,11 +97,17 @@ def get_dict_tweet_feed(session: Session) -> Dict:
             {
                 "id": tweet.id,
                 "content": tweet.content,
-                "attachments": [media.file_url for media in tweet.media],
+                "attachments": [
+                    media.preview_url or media.file_url for media in tweet.media
+                ],
+                "thumbnails": [
+                    media.thumbnail_url or media.file_url for media in tweet.media
+                ],
                 "author": {
                     "id": tweet.author.id,
                     "name": tweet.author.name,
                 },
+                "like_count": tweet.like_count,
                 "likes": [
                     {
                         "user_id": like.user_id,
@@ -87,18 +118,23 @@ def get_dict_tweet_feed(session: Session) -> Dict:
             }
             for tweet in tweets
         ],
+        "next_cursor": next_cursor,
     }
 
     return tweet_feed
 
 
-def get_valid_image() -> Dict:
+def get_valid_image(content: Optional[bytes] = None) -> Dict:
     """
     Формирует словарь с содержанием валидной картинки.
 
+    Содержимое каждой картинки уникально, чтобы загрузки в разных тестах
+    не ссылались на один медиафайл.
+
+    :param content: Содержимое картинки.
     :return: Словарь с данными о файле.
     """
-    image_content = b"test content"
+    image_content = content if content is not None else os.urandom(32)
     image_file = BytesIO(image_content)
     files = {"file": ("image.jpg", image_file)}
 
@@ -116,3 +152,29 @@ def get_tweet_data() -> Dict:
         "tweet_media_ids": [],
     }
     return tweet_data
+
+
+def get_metric(client: TestClient, name: str) -> float:
+    """
+    Получает текущее значение метрики из /api/metrics/.
+
+    :param client: Тестовый клиент FastAPI.
+    :param name: Имя метрики.
+    :return: Значение метрики (0, если метрика еще не записывалась).
+    """
+    for line in client.get(f"{API_URL}/metrics/").text.splitlines():
+        metric_name, _, value = line.partition(" ")
+        if metric_name == name:
+            return float(value)
+
+    return 0
+
+
+def wait_media_deletion(client: TestClient) -> None:
+    """
+    Дожидается удаления всех медиафайлов, поставленных в очередь
+    фонового удаления, в цикле событий тестового клиента.
+
+    :param client: Тестовый клиент FastAPI.
+    """
+    client.portal.call(media_deleter.join)